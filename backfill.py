@@ -0,0 +1,213 @@
+# backfill.py — 歷史回補：日期區間分派給有上限的 worker pool，逐日 normalize + 存檔，可中斷續跑
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import os, json
+
+from utils import HttpClient, norm_ymd
+from raw_archive import raw_path, write_raw
+from trading_calendar import get_calendar
+from scheduler import HostLimiter, DATASET_HOSTS
+from ratelimit import RequestBudget, BudgetExhaustedError
+from insti import get_insti
+from index_fetch import _try_taiex, _try_otc, OtcSnapshot
+from store import save, open_store
+from store_sqlite import table_exists
+import telemetry
+import datasets
+
+# 可回補的資料集（其餘 openapi 端點只有最新快照，沒有歷史可抓；登錄在 datasets.py）
+BACKFILLABLE = datasets.backfillable()
+
+DEFAULT_WORKERS = 4
+DEFAULT_BUDGET = 2000           # 單次執行最多送出的 HTTP 請求數（含重試、OTC 的全量快照）
+
+class Checkpoint:
+    """
+    <out_root>/cache/backfill_<ds>.json：{"done": [...], "empty": [...]}
+    done = 已寫進資料庫；empty = 成功回應但沒資料（休市或來源沒有該日）。
+    只在資料庫 commit 之後才記錄，被中斷時最多重做進行中的那幾天。
+    """
+    def __init__(self, out_root: str, ds: str):
+        self.path = os.path.join(out_root, "cache", f"backfill_{ds}.json")
+        self.done, self.empty = set(), set()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    obj = json.load(f)
+                self.done = set(obj.get("done") or [])
+                self.empty = set(obj.get("empty") or [])
+            except Exception:
+                pass
+
+    def __contains__(self, ymd):
+        return ymd in self.done or ymd in self.empty
+
+    def mark(self, ymd: str, empty: bool = False):
+        (self.empty if empty else self.done).add(ymd)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"done": sorted(self.done), "empty": sorted(self.empty)}, f)
+        os.replace(tmp, self.path)
+
+def stored_dates(db, table: str) -> set:
+    """資料庫裡該表已有的日期（統一成 YYYYMMDD；date 欄有索引，只掃索引）。"""
+    if not table_exists(db.conn, table):
+        return set()
+    return {ymd for (d,) in db.conn.execute(f'SELECT DISTINCT date FROM "{table}"')
+            if (ymd := norm_ymd(d))}
+
+def plan(ds: str, start: str, end: str, cal, have: set, ckpt: Checkpoint) -> list:
+    """[start, end] 的候選交易日中，資料庫沒有、checkpoint 也沒記過的缺口（舊→新）。"""
+    return [ymd for ymd in cal.trading_days_between(start, end)
+            if ymd not in have and ymd not in ckpt]
+
+def _fetch_date(ds: str, ymd: str, client: HttpClient, cal, snapshot):
+    """
+    抓單日；回傳 (ok, data)。ok=False 只代表交易所回了「沒資料」（之後記成 empty）；
+    連線 / HTTP / 斷路錯誤一律往上拋（該日不記 checkpoint，下次重試）。
+    """
+    if ds == "insti":
+        data = get_insti(client, ymd, cal)
+        return bool(isinstance(data, dict) and data.get("data")), data
+    if ds == "taiex":
+        return _try_taiex(client, ymd, "backfill", cal, strict=True)
+    # OTC 回空不一定是休市（歷史資料涵蓋有限），不拿來學休市日
+    ok, data = _try_otc(client, ymd, "backfill", snapshot, strict=True)
+    if ok:
+        cal.observe(ymd, True)
+    return ok, data
+
+def run_backfill(names, start: str, end: str, client: HttpClient, out_root: str,
+                 storage: str = "sqlite", workers: int = DEFAULT_WORKERS,
+                 budget: int = DEFAULT_BUDGET, host_limits: dict | None = None,
+                 refetch: bool = False, indicators: bool = True) -> dict:
+    """
+    回補 names 在 [start, end] 的缺口：
+      - 工作依 (資料集, 日期) 分派，同時在途最多 workers 個，另受每主機並行上限限制
+      - 每完成一天就 normalize → upsert → commit → 記 checkpoint（單一寫入者：主執行緒）
+      - 請求額度（每次 HTTP 送出含重試扣一次）用完即停，剩下的缺口留給下次
+    refetch=True 時忽略資料庫與 checkpoint，區間內每天都重抓。
+    indicators=True 時，有補進資料的 daily / insti 把補進的日期交給 indicators.refresh：
+    都在既有狀態之後就逐天推進，補到舊日期才分塊重算。
+    回傳 {ds: {"planned", "stored", "empty", "failed"}}。
+    """
+    start, end = norm_ymd(start), norm_ymd(end)
+    if not start or not end or start > end:
+        raise ValueError(f"invalid backfill range: {start}..{end}")
+
+    cal = get_calendar(out_root)
+    raw_dir = os.path.join(out_root, "raw")
+    limiter = HostLimiter(host_limits)
+    quota = RequestBudget(budget)
+    snapshot = OtcSnapshot(client)
+    prev_budget, client.budget = client.budget, quota
+
+    try:
+        stats = _backfill(names, start, end, client, out_root, storage, workers, refetch,
+                          indicators, cal, raw_dir, limiter, quota, snapshot)
+    finally:
+        client.budget = prev_budget
+
+    for ds, st in stats.items():
+        left = st["planned"] - st["stored"] - st["empty"]
+        print(f"[OK] backfill {ds}: stored={st['stored']} empty={st['empty']} "
+              f"failed={st['failed']} remaining={left}")
+    return stats
+
+def _backfill(names, start, end, client, out_root, storage, workers, refetch, indicators,
+              cal, raw_dir, limiter, quota, snapshot) -> dict:
+    with open_store(out_root) as db:
+        ckpts, todo, stats = {}, [], {}
+        stored_days = {ds: [] for ds in names}
+        for ds in names:
+            ckpt = ckpts[ds] = Checkpoint(out_root, ds)
+            if refetch:
+                ckpt.done, ckpt.empty = set(), set()
+            have = set() if refetch else stored_dates(db, ds)
+            dates = plan(ds, start, end, cal, have, ckpt)
+            stats[ds] = {"planned": len(dates), "stored": 0, "empty": 0, "failed": 0}
+            print(f"[INFO] backfill {ds}: {len(dates)} missing date(s) in {start}..{end}")
+            todo.extend((ds, ymd) for ymd in dates)
+        # 資料集交錯排列，讓不同主機同時有工作
+        todo.sort(key=lambda t: (t[1], t[0]))
+
+        def _task(ds, ymd):
+            with limiter.slot(DATASET_HOSTS.get(ds, ds)), telemetry.stage("fetch", ds) as st:
+                ok, data = _fetch_date(ds, ymd, client, cal, snapshot)
+                st["rows_out"] = telemetry.count_rows(data)
+                return ok, data
+
+        pending = {}
+        it = iter(todo)
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as ex:
+            while True:
+                # 補滿在途工作（不一次丟進幾千個 future）
+                while not exhausted and len(pending) < max(1, int(workers)):
+                    nxt = next(it, None)
+                    if nxt is None:
+                        exhausted = True
+                    elif quota.left <= 0:
+                        exhausted = True
+                    else:
+                        pending[ex.submit(_task, *nxt)] = nxt
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    ds, ymd = pending.pop(fut)
+                    try:
+                        ok, data = fut.result()
+                        if ok:
+                            spec = datasets.get(ds)
+                            write_raw(data, raw_path(raw_dir, spec.raw, ymd))
+                            with telemetry.stage("normalize", ds) as st:
+                                st["rows_in"] = telemetry.count_rows(data)
+                                df = spec.normalizer()(data)
+                                st["rows_out"] = len(df)
+                            with telemetry.stage("store", ds) as st:
+                                st["rows_in"] = st["rows_out"] = len(df)
+                                save(df, storage, out_root, ds, db=db, csv=False)
+                                db.commit()
+                    except BudgetExhaustedError:
+                        # 額度在這天途中用完：不算失敗，不記 checkpoint，下次再補
+                        exhausted = True
+                        continue
+                    except Exception as e:
+                        # 該日不記 checkpoint，下次執行會再補
+                        print(f"[ERR] backfill {ds} {ymd}: {e!r}")
+                        stats[ds]["failed"] += 1
+                        continue
+                    if ok:
+                        ckpts[ds].mark(ymd)
+                        stats[ds]["stored"] += 1
+                        stored_days[ds].append(f"{ymd[:4]}-{ymd[4:6]}-{ymd[6:]}")
+                        print(f"[OK] backfill {ds} {ymd}: {len(df)} rows")
+                    else:
+                        ckpts[ds].mark(ymd, empty=True)
+                        stats[ds]["empty"] += 1
+                    ckpts[ds].save()
+        if quota.left <= 0:
+            print("[WARN] backfill request budget exhausted; rerun to continue")
+        # 日曆這次學到的開 / 休市日整批寫一次（不是每觀測一天就整份重寫）
+        cal.flush()
+
+        # daily × insti join：只重算補進來的日期
+        import daily_insti
+        for ds in names:
+            if ds in daily_insti.SOURCES and stored_days[ds]:
+                with telemetry.stage("daily_insti", ds) as st:
+                    st["rows_in"] = len(stored_days[ds])
+                    st["rows_out"] = daily_insti.refresh(db, stored_days[ds])
+                db.commit()
+        if indicators:
+            import indicators as ind
+            for ds in names:
+                if ds in ind.SOURCES and stored_days[ds]:
+                    with telemetry.stage("indicators", ds) as st:
+                        st["rows_in"] = len(stored_days[ds])
+                        st["rows_out"] = ind.refresh(db, ds, stored_days[ds])
+                    db.commit()
+    return stats
@@ -0,0 +1,44 @@
+# bench/bench_parsing.py — 逐格 map 與向量化解析的速度比較（並確認輸出相同）
+# 用法：python bench/bench_parsing.py [列數]
+import os, sys, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import parsing as P
+
+def _sample(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    price = [f"{rnd.uniform(5, 1200):,.2f}" if rnd.random() > 0.02 else "--" for _ in range(n)]
+    volume = [f"{rnd.randint(0, 80_000_000):,}" for _ in range(n)]
+    dates = [f"{rnd.randint(100, 114)}/{rnd.randint(1, 12):02d}/{rnd.randint(1, 28):02d}" for _ in range(n)]
+    return pd.Series(price, dtype=object), pd.Series(volume, dtype=object), pd.Series(dates, dtype=object)
+
+def _time(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    price, volume, dates = _sample(n)
+    cases = [
+        ("to_num(price)",  lambda: price.map(P.num_cell),       lambda: P.to_num(price)),
+        ("to_num(volume)", lambda: volume.map(P.num_cell),      lambda: P.to_num(volume)),
+        ("to_float",       lambda: price.map(P.float_cell),     lambda: P.to_float(price)),
+        ("to_int",         lambda: volume.map(P.int_cell),      lambda: P.to_int(volume)),
+        ("roc_to_iso",     lambda: dates.map(P.roc_date_cell),  lambda: P.roc_to_iso(dates)),
+    ]
+    print(f"rows={n}")
+    for name, old, new in cases:
+        t_old, a = _time(old)
+        t_new, b = _time(new)
+        same = a.dtype == b.dtype and a.equals(b)
+        print(f"{name:16s} map={t_old*1000:8.1f}ms  vectorized={t_new*1000:8.1f}ms  "
+              f"x{t_old / t_new:5.1f}  same={same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# bench/bench_pipeline.py — normalize / store / report 的微基準：假資料、可調規模、JSON 基準檔、回歸比較
+# 用法：
+#   python bench/bench_pipeline.py run [--codes 1000] [--days 60] [--repeat 3] [--out data/bench/base.json]
+#   python bench/bench_pipeline.py run --codes 2000 --days 750          # 約 150 萬列的 insti 歷史
+#   python bench/bench_pipeline.py compare data/bench/base.json data/bench/new.json [--threshold 0.15]
+# compare 有任何一項變慢（或記憶體峰值變大）超過門檻就以 exit code 1 結束，可放進 CI。
+import os, sys, json, time, shutil, argparse, platform, tempfile, tracemalloc, subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "reports"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import payloads as P
+from normalize import normalize_daily, normalize_insti, normalize_taiex, normalize_otc
+from store import save, open_store
+
+DEFAULT_THRESHOLD = 0.15        # 耗時變慢超過 15% 算回歸
+DEFAULT_MEM_THRESHOLD = 0.25    # 記憶體峰值多 25% 算回歸
+
+# ---- 共用假資料（同一次執行只產生一次）----
+_cache = {}
+_tmpdirs = []
+
+def _tmpdir():
+    d = tempfile.mkdtemp(prefix="bench_")
+    _tmpdirs.append(d)
+    return d
+
+def _memo(key, fn):
+    if key not in _cache:
+        _cache[key] = fn()
+    return _cache[key]
+
+def _days(a):
+    return P.trading_days(a.days)
+
+def _insti_frames(a):
+    return _memo(("insti", a.codes, a.days),
+                 lambda: [normalize_insti(P.t86(a.codes, ymd)) for ymd in _days(a)])
+
+def _index_frames(a):
+    def build():
+        taiex = pd.concat([normalize_taiex(P.mi_index(ymd)) for ymd in _days(a)], ignore_index=True)
+        otc = normalize_otc(P.tpex_index(a.days))
+        return taiex, otc
+    return _memo(("index", a.days), build)
+
+def _history_db(a):
+    """insti (codes × days) + taiex/otc (days) 的資料庫，建一次，各 case 複製來用。"""
+    def build():
+        d = _tmpdir()
+        _load_history(d, a)
+        return d
+    return _memo(("hist", a.codes, a.days), build)
+
+def _load_history(out_root, a):
+    taiex, otc = _index_frames(a)
+    with open_store(out_root) as db:
+        for df in _insti_frames(a):
+            db.upsert(df, "insti")
+        db.upsert(taiex, "taiex")
+        db.upsert(otc, "otc")
+    return sum(len(df) for df in _insti_frames(a)) + len(taiex) + len(otc)
+
+def _copy_history(a):
+    d = _tmpdir()
+    shutil.copy(os.path.join(_history_db(a), "twse.db"), os.path.join(d, "twse.db"))
+    return d
+
+def _report_env(out_root):
+    import market_report as mr
+    mr.DB_PATH = os.path.join(out_root, "twse.db")
+    mr.CSV_OUT = os.path.join(out_root, "market_overview.csv")
+    return mr
+
+# ---- cases：(名稱, setup(args) -> ctx, run(ctx) -> 處理列數) ----
+def _case_normalize_daily(a):
+    raw = P.stock_day_all(a.codes)
+    return raw, lambda raw: len(normalize_daily(raw))
+
+def _case_normalize_insti(a):
+    raw = P.t86(a.codes)
+    return raw, lambda raw: len(normalize_insti(raw))
+
+def _case_normalize_taiex(a):
+    raws = [P.mi_index(ymd) for ymd in _days(a)]
+    return raws, lambda raws: sum(len(normalize_taiex(r)) for r in raws)
+
+def _case_normalize_otc(a):
+    raw = P.tpex_index(a.days)
+    return raw, lambda raw: len(normalize_otc(raw))
+
+def _case_store_daily(a):
+    df = normalize_daily(P.stock_day_all(a.codes))
+    d = _tmpdir()
+    def run(ctx):
+        with open_store(d) as db:
+            save(df, "sqlite", d, "daily", db=db)
+        return len(df)
+    return None, run
+
+def _case_store_insti_history(a):
+    _insti_frames(a), _index_frames(a)          # 假資料不計時
+    d = _tmpdir()
+    return d, lambda d: _load_history(d, a)
+
+def _case_store_insti_reupsert(a):
+    d = _copy_history(a)
+    last = _insti_frames(a)[-1]
+    def run(d):
+        with open_store(d) as db:
+            db.upsert(last, "insti")
+        return len(last)
+    return d, run
+
+def _case_report_full(a):
+    mr = _report_env(_copy_history(a))
+    return None, lambda _: mr.build_report(full=True)
+
+def _case_report_incremental(a):
+    mr = _report_env(_copy_history(a))
+    mr.build_report(full=True)
+    return None, lambda _: mr.build_report()
+
+CASES = {
+    "normalize_daily":       _case_normalize_daily,
+    "normalize_insti":       _case_normalize_insti,
+    "normalize_taiex":       _case_normalize_taiex,
+    "normalize_otc":         _case_normalize_otc,
+    "store_daily":           _case_store_daily,
+    "store_insti_history":   _case_store_insti_history,
+    "store_insti_reupsert":  _case_store_insti_reupsert,
+    "report_full":           _case_report_full,
+    "report_incremental":    _case_report_incremental,
+}
+
+# ---- 執行 ----
+def _quiet(fn, *args):
+    # 被測函式會 print 進度；量時間時丟掉
+    import io, contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+def run_case(name, a):
+    times, rows = [], None
+    for _ in range(a.repeat):
+        ctx, fn = _quiet(CASES[name], a)
+        t0 = time.perf_counter()
+        rows = _quiet(fn, ctx)
+        times.append(time.perf_counter() - t0)
+    res = {"seconds": round(min(times), 6), "mean": round(sum(times) / len(times), 6), "rows": rows,
+           "rows_per_s": round(rows / min(times)) if rows and min(times) > 0 else None}
+    if a.memory:
+        # 另跑一次量 tracemalloc 峰值（只算 Python 端配置，SQLite 自己的快取不在內）
+        ctx, fn = _quiet(CASES[name], a)
+        tracemalloc.start()
+        try:
+            _quiet(fn, ctx)
+            res["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    return res
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def cmd_run(a):
+    names = [n for n in CASES if not a.cases or n in a.cases]
+    meta = {"created": datetime.now().isoformat(timespec="seconds"), "git": _git_rev(),
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "codes": a.codes, "days": a.days, "repeat": a.repeat}
+    results = {}
+    print(f"codes={a.codes} days={a.days} repeat={a.repeat}")
+    for name in names:
+        res = results[name] = run_case(name, a)
+        print(f"{name:24s} {res['seconds'] * 1000:10.1f} ms  rows={res['rows']!s:>9}  "
+              f"peak={res.get('peak_mb', '-')!s:>8} MB")
+    out = a.out or os.path.join("data", "bench", f"{datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=1)
+    print(f"[OK] baseline -> {out}")
+    for d in _tmpdirs:
+        shutil.rmtree(d, ignore_errors=True)
+
+def compare(base: dict, new: dict, threshold=DEFAULT_THRESHOLD, mem_threshold=DEFAULT_MEM_THRESHOLD):
+    """回傳 (輸出行, 回歸項目)；規模（codes/days）不同時只提醒、不擋。"""
+    lines, regressions = [], []
+    mb, mn = base.get("meta", {}), new.get("meta", {})
+    if (mb.get("codes"), mb.get("days")) != (mn.get("codes"), mn.get("days")):
+        lines.append(f"[WARN] size differs: base codes={mb.get('codes')} days={mb.get('days')}, "
+                     f"new codes={mn.get('codes')} days={mn.get('days')}")
+    lines.append(f"{'case':24s} {'base ms':>10} {'new ms':>10} {'Δ time':>8} {'base MB':>8} {'new MB':>8} {'Δ mem':>7}")
+    rb, rn = base.get("results", {}), new.get("results", {})
+    for name in [n for n in rb if n in rn]:
+        b, n = rb[name], rn[name]
+        dt = (n["seconds"] - b["seconds"]) / b["seconds"] if b["seconds"] else 0.0
+        bm, nm = b.get("peak_mb"), n.get("peak_mb")
+        dm = (nm - bm) / bm if bm and nm is not None else None
+        flag = ""
+        if dt > threshold:
+            flag += " SLOWER"
+            regressions.append((name, "time", dt))
+        if dm is not None and dm > mem_threshold:
+            flag += " MORE-MEM"
+            regressions.append((name, "memory", dm))
+        lines.append(f"{name:24s} {b['seconds'] * 1000:10.1f} {n['seconds'] * 1000:10.1f} {dt:+8.0%} "
+                     f"{bm if bm is not None else '-':>8} {nm if nm is not None else '-':>8} "
+                     f"{(f'{dm:+.0%}' if dm is not None else '-'):>7}{flag}")
+    for name in [n for n in rb if n not in rn]:
+        lines.append(f"{name:24s} (missing in new)")
+    return lines, regressions
+
+def cmd_compare(a):
+    with open(a.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(a.new, encoding="utf-8") as f:
+        new = json.load(f)
+    lines, regressions = compare(base, new, a.threshold, a.mem_threshold)
+    for line in lines:
+        print(line)
+    if regressions:
+        print(f"[FAIL] {len(regressions)} regression(s) beyond threshold "
+              f"(time {a.threshold:.0%}, memory {a.mem_threshold:.0%})")
+        sys.exit(1)
+    print("[OK] no regressions")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="normalize / store / report 微基準")
+    sub = ap.add_subparsers(dest="cmd")
+    r = sub.add_parser("run", help="跑基準並存成 JSON")
+    r.add_argument("--codes", type=int, default=1000, help="股票檔數（每日列數）")
+    r.add_argument("--days", type=int, default=60, help="歷史交易日數")
+    r.add_argument("--repeat", type=int, default=3, help="每個 case 跑幾次取最快")
+    r.add_argument("--cases", nargs="*", help=f"只跑這些：{' '.join(CASES)}")
+    r.add_argument("--no-memory", dest="memory", action="store_false", help="不量記憶體峰值（省一次執行）")
+    r.add_argument("--out", help="輸出 JSON（預設 data/bench/<時間>.json）")
+    c = sub.add_parser("compare", help="比較兩份基準 JSON")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="耗時回歸門檻（比例）")
+    c.add_argument("--mem-threshold", type=float, default=DEFAULT_MEM_THRESHOLD, help="記憶體回歸門檻（比例）")
+    a = ap.parse_args(argv)
+    if a.cmd == "run":
+        cmd_run(a)
+    elif a.cmd == "compare":
+        cmd_compare(a)
+    else:
+        ap.print_help()
+
+if __name__ == "__main__":
+    main()
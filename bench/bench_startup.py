@@ -0,0 +1,80 @@
+# bench/bench_startup.py — CLI 啟動時間預算：量 main.py 幾種短指令的牆鐘時間，並檢查沒載入不需要的重模組
+# 用法：python bench/bench_startup.py [--repeat 5] [--scale 1.0]
+# 預算以「扣掉空的 python 啟動」後的毫秒數計（慢機器用 --scale 放寬）；超過預算或載入禁用模組時 exit code 1。
+# fetch --fetch-only 透過本機 replay_server（空錄製）跑，不打網路。
+import os, sys, time, shutil, argparse, tempfile, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import replay_server
+
+# 指令 -> (參數, 預算毫秒, 不該被 import 的模組)；fetch 一定要 requests（約 150 ms），預算含一次本機請求
+CASES = {
+    "--help":                   (["--help"], 100, ("pandas", "numpy", "requests", "yaml")),
+    "stats":                    (["stats"], 150, ("pandas", "numpy", "requests")),
+    "fetch daily --fetch-only": (["fetch", "daily", "--fetch-only"], 400, ("pandas", "numpy")),
+}
+
+def _config(workdir: str, port: int) -> str:
+    lines = [f'output_dir: "{os.path.join(workdir, "data")}"', "telemetry: false", "http_cache: false",
+             "retries: 1", "base_urls:"]
+    lines += [f"  {h}: {u}" for h, u in replay_server.base_urls(port).items()]
+    with open(os.path.join(workdir, "config.yaml"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return workdir
+
+def _run(args, cwd, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + [os.path.join(ROOT, "main.py")] + args
+    t0 = time.perf_counter()
+    p = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    return time.perf_counter() - t0, p
+
+def _imported(stderr: str) -> set:
+    # -X importtime 每行：import time: self | cumulative | 模組名（縮排表示巢狀）
+    out = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            out.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return out
+
+def _best(fn, repeat):
+    return min(fn() for _ in range(repeat))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="main.py 啟動時間預算")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--scale", type=float, default=1.0, help="預算倍數（慢機器 / CI 用）")
+    a = ap.parse_args(argv)
+
+    httpd = replay_server.serve(replay_server.Replay({}), port=0)
+    workdir = _config(tempfile.mkdtemp(prefix="bench_startup_"), httpd.server_address[1])
+
+    floor = _best(lambda: _run_floor(), a.repeat)
+    print(f"python floor: {floor * 1000:.0f} ms")
+    failed = []
+    for name, (args, budget, banned) in CASES.items():
+        best = _best(lambda: _run(args, workdir)[0], a.repeat)
+        _, p = _run(args, workdir, importtime=True)
+        heavy = sorted(_imported(p.stderr) & set(banned))
+        over = (best - floor) * 1000
+        ok = p.returncode == 0 and over <= budget * a.scale and not heavy
+        print(f"{name:28s} {best * 1000:7.0f} ms  (+{over:4.0f} / {budget * a.scale:.0f})  "
+              f"{'imports ' + ','.join(heavy) if heavy else ''}{'' if p.returncode == 0 else ' exit=' + str(p.returncode)}"
+              f"{'' if ok else '  <-- FAIL'}")
+        if not ok:
+            failed.append(name)
+    httpd.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        print(f"[FAIL] over budget: {', '.join(failed)}")
+        sys.exit(1)
+    print("[OK] startup within budget")
+
+def _run_floor():
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], capture_output=True)
+    return time.perf_counter() - t0
+
+if __name__ == "__main__":
+    main()
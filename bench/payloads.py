@@ -0,0 +1,87 @@
+# bench/payloads.py — 假資料產生器：長得跟 TWSE / TPEX 真實回應一樣（欄位名、千分位、民國日期、"--"）
+# 數值隨機但可重現（同一個 seed 產生同一份）。
+import random
+from datetime import datetime, timedelta
+
+T86_FIELDS = [
+    "證券代號", "證券名稱",
+    "外陸資買進股數(不含外資自營商)", "外陸資賣出股數(不含外資自營商)", "外陸資買賣超股數(不含外資自營商)",
+    "外資自營商買進股數", "外資自營商賣出股數", "外資自營商買賣超股數",
+    "投信買進股數", "投信賣出股數", "投信買賣超股數",
+    "自營商買賣超股數",
+    "自營商買進股數(自行買賣)", "自營商賣出股數(自行買賣)", "自營商買賣超股數(自行買賣)",
+    "自營商買進股數(避險)", "自營商賣出股數(避險)", "自營商買賣超股數(避險)",
+    "三大法人買賣超股數",
+]
+
+MI_INDEX_FIELDS = ["指數", "開盤指數", "最高指數", "最低指數", "收盤指數", "成交股數", "成交金額"]
+
+def codes(n: int):
+    """n 檔股票代號（1101 起，四位數不夠就五、六位）。"""
+    return [str(1101 + i) for i in range(n)]
+
+def trading_days(n: int, end: str = "20241231"):
+    """從 end 往回 n 個平日（YYYYMMDD，舊→新）。"""
+    d = datetime.strptime(end, "%Y%m%d")
+    out = []
+    while len(out) < n:
+        if d.weekday() < 5:
+            out.append(d.strftime("%Y%m%d"))
+        d -= timedelta(days=1)
+    return out[::-1]
+
+def _roc(ymd: str) -> str:
+    return f"{int(ymd[:4]) - 1911}{ymd[4:]}"
+
+def _price(rnd):
+    return "--" if rnd.random() < 0.01 else f"{rnd.uniform(5, 1200):,.2f}"
+
+def _shares(rnd, hi=80_000_000):
+    return f"{rnd.randint(-hi, hi):,}"
+
+def stock_day_all(n_codes: int, ymd: str = "20241231", seed: int = 7) -> list:
+    """openapi STOCK_DAY_ALL：list of dict，日期為民國 YYYMMDD。"""
+    rnd = random.Random(seed)
+    date = _roc(ymd)
+    return [{
+        "Date": date, "Code": c, "Name": f"股票{c}",
+        "TradeVolume": f"{rnd.randint(0, 80_000_000)}", "TradeValue": f"{rnd.randint(0, 9_000_000_000)}",
+        "OpeningPrice": _price(rnd), "HighestPrice": _price(rnd), "LowestPrice": _price(rnd),
+        "ClosingPrice": _price(rnd), "Change": f"{rnd.uniform(-10, 10):.2f}",
+        "Transaction": f"{rnd.randint(0, 90_000)}",
+    } for c in codes(n_codes)]
+
+def t86(n_codes: int, ymd: str = "20241231", seed: int = 7) -> dict:
+    """/fund/T86：{"stat","date","fields","data"}，數字帶千分位。"""
+    rnd = random.Random(f"{seed}-{ymd}")
+    rows = []
+    for c in codes(n_codes):
+        rows.append([c, f"股票{c}"] + [_shares(rnd, 5_000_000) for _ in T86_FIELDS[2:]])
+    return {"stat": "OK", "date": ymd, "title": f"{ymd} 三大法人買賣超日報",
+            "fields": list(T86_FIELDS), "data": rows}
+
+def mi_index(ymd: str = "20241231", seed: int = 7, n_indices: int = 40) -> dict:
+    """MI_INDEX?type=IND：多張 tables，其中一張是「發行量加權股價指數」。"""
+    rnd = random.Random(f"{seed}-{ymd}")
+    other = {"title": "價格指數(臺灣證券交易所)", "fields": ["指數", "收盤指數", "漲跌", "漲跌點數"],
+             "data": [[f"指數{i}", f"{rnd.uniform(100, 30000):,.2f}", "+", f"{rnd.uniform(0, 300):.2f}"]
+                      for i in range(n_indices)]}
+    base = rnd.uniform(15000, 23000)
+    taiex = {"title": "發行量加權股價指數歷史資料", "fields": list(MI_INDEX_FIELDS),
+             "data": [["發行量加權股價指數"] + [f"{base * rnd.uniform(0.98, 1.02):,.2f}" for _ in range(4)]
+                      + [f"{rnd.randint(3_000_000_000, 9_000_000_000):,}",
+                         f"{rnd.randint(200_000_000_000, 600_000_000_000):,}"]]}
+    return {"stat": "OK", "date": ymd, "tables": [other, taiex]}
+
+def tpex_index(n_days: int, end: str = "20241231", seed: int = 7) -> list:
+    """TPEX 主板指數全量端點：每天一列，民國日期 YYY/MM/DD。"""
+    rnd = random.Random(seed)
+    rows = []
+    for ymd in trading_days(n_days, end):
+        base = rnd.uniform(200, 280)
+        rows.append({"date": f"{int(ymd[:4]) - 1911}/{ymd[4:6]}/{ymd[6:]}",
+                     "開盤價": f"{base:,.2f}", "最高價": f"{base * 1.01:,.2f}",
+                     "最低價": f"{base * 0.99:,.2f}", "收盤價": f"{base * rnd.uniform(0.99, 1.01):,.2f}",
+                     "成交股數": f"{rnd.randint(300_000_000, 900_000_000):,}",
+                     "成交金額": f"{rnd.randint(30_000_000_000, 90_000_000_000):,}"})
+    return rows
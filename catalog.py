@@ -0,0 +1,190 @@
+# catalog.py — raw 檔目錄索引：data/raw/catalog.db（SQLite），每寫一份 raw 就記一筆
+#   欄位：資料集、交易日、檔名、大小、payload 雜湊、是否為 cache 回填（_cached / _cached_from）
+#   「某資料集最新一份」「某區間有哪些日期」「哪些日子缺 raw」都走 (dataset, date) 索引，不再 listdir + 排序。
+# 第一次開啟（或記錄失敗被標成過期）時掃一次目錄重建；之後由 raw_archive 寫檔時順手維護。
+import os, sqlite3, threading
+from datetime import datetime, timezone
+
+CATALOG_NAME = "catalog.db"
+SCHEMA_VERSION = 1              # PRAGMA user_version；0 = 尚未掃描 / 需要重建
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=10000",
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS raw_files (
+        name        TEXT PRIMARY KEY,       -- raw_dir 底下的檔名
+        dataset     TEXT NOT NULL,
+        date        TEXT NOT NULL,          -- YYYYMMDD；舊版無日期的 <ds>.json 為 ''
+        fmt         INTEGER NOT NULL,       -- 1 = jsonl.gz / zst，0 = 舊版 .json（同一天新格式優先）
+        bytes       INTEGER,
+        sha256      TEXT,                   -- 整個檔案的 sha256（與 normalize 狀態的雜湊相同）；NULL = 尚未計算
+        cached      INTEGER NOT NULL DEFAULT 0,
+        cached_from TEXT,
+        written_at  TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_raw_files_ds_date ON raw_files (dataset, date, fmt)",
+)
+
+_ORDER = "ORDER BY date DESC, fmt DESC"
+
+def catalog_path(raw_dir: str) -> str:
+    return os.path.join(raw_dir, CATALOG_NAME)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class RawCatalog:
+    """
+    一個 raw 目錄一份；多執行緒共用同一條連線（寫入加鎖）。多個行程同時寫靠 WAL + busy_timeout。
+        cat = get_catalog("data/raw")
+        cat.latest("insti")                      # 最新一份的完整路徑
+        cat.dates("insti", "20240101", "20241231")
+        cat.missing("insti", cal.trading_days_between(start, end))
+    """
+    def __init__(self, raw_dir: str):
+        os.makedirs(raw_dir, exist_ok=True)
+        self.raw_dir = raw_dir
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(catalog_path(raw_dir), isolation_level=None, check_same_thread=False)
+        for p in PRAGMAS:
+            self.conn.execute(p)
+        for s in SCHEMA:
+            self.conn.execute(s)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.rebuild()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.raw_dir, name)
+
+    def _query(self, sql: str, args=()):
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    # ---- 寫入 ----
+    def record(self, path: str, size: int | None = None, sha256: str | None = None,
+               cached: bool = False, cached_from: str | None = None) -> bool:
+        """記一份剛寫好的 raw 檔；不是 <ds>_YYYYMMDD / <ds>.json 檔名的（例如 cache/*_last）不記，回 False。"""
+        from raw_archive import parse_name, LEGACY_EXT
+        info = parse_name(path)
+        if not info:
+            return False
+        ds, ymd, ext = info
+        if size is None:
+            size = os.path.getsize(path)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO raw_files (name, dataset, date, fmt, bytes, sha256, cached, cached_from, written_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.basename(path), ds, ymd or "", 0 if ext == LEGACY_EXT else 1, size, sha256,
+                 int(bool(cached)), cached_from, _now()))
+        return True
+
+    def invalidate(self):
+        """記錄失敗時呼叫：下次開啟會重新掃描目錄。"""
+        with self._lock:
+            self.conn.execute("PRAGMA user_version = 0")
+
+    def rebuild(self) -> int:
+        """掃一次目錄，與資料表同步（補上沒記到的、刪掉檔案已不在的）。回傳目前筆數。"""
+        from raw_archive import parse_name, read_header, is_legacy
+        on_disk = {n for n in os.listdir(self.raw_dir) if parse_name(n)}
+        known = {r[0] for r in self._query("SELECT name FROM raw_files")}
+        for name in sorted(on_disk - known):
+            path = self._path(name)
+            cached, cached_from = False, None
+            if not is_legacy(path):
+                try:
+                    meta = read_header(path).get("meta") or {}
+                    cached, cached_from = bool(meta.get("_cached")), meta.get("_cached_from")
+                except Exception:
+                    pass
+            self.record(path, cached=cached, cached_from=cached_from)
+        with self._lock:
+            self.conn.executemany("DELETE FROM raw_files WHERE name = ?", [(n,) for n in known - on_disk])
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return len(on_disk)
+
+    # ---- 查詢 ----
+    def latest(self, dataset: str):
+        """最新一份 raw 的路徑（同一天新格式優先）；檔案被手動刪掉時重掃一次再查。"""
+        for attempt in range(2):
+            row = self._query(f"SELECT name FROM raw_files WHERE dataset = ? {_ORDER} LIMIT 1", (dataset,))
+            if not row:
+                return None
+            path = self._path(row[0][0])
+            if os.path.exists(path):
+                return path
+            if attempt == 0:
+                self.rebuild()
+        return None
+
+    def paths(self, dataset: str, start: str | None = None, end: str | None = None) -> list:
+        """[start, end]（YYYYMMDD，含端點）內的 raw 路徑，新→舊；不限區間時含舊版無日期檔（排最後）。"""
+        sql, args = "SELECT name FROM raw_files WHERE dataset = ?", [dataset]
+        if start or end:
+            sql += " AND date >= ? AND date <= ? AND date != ''"
+            args += [start or "", end or "99999999"]
+        return [self._path(r[0]) for r in self._query(f"{sql} {_ORDER}", args)]
+
+    def dates(self, dataset: str, start: str | None = None, end: str | None = None) -> list:
+        """有 raw 的交易日（舊→新）。"""
+        return sorted({r[0] for r in self._query(
+            "SELECT DISTINCT date FROM raw_files WHERE dataset = ? AND date != '' AND date >= ? AND date <= ?",
+            (dataset, start or "", end or "99999999"))})
+
+    def missing(self, dataset: str, expected) -> list:
+        """expected（YYYYMMDD 清單，例如日曆的交易日）中沒有 raw 的日子。"""
+        expected = list(expected)
+        if not expected:
+            return []
+        have = set(self.dates(dataset, min(expected), max(expected)))
+        return [d for d in expected if d not in have]
+
+    def info(self, path: str) -> dict | None:
+        cur = self.conn.cursor()
+        with self._lock:
+            row = cur.execute("SELECT * FROM raw_files WHERE name = ?", (os.path.basename(path),)).fetchone()
+            cols = [c[0] for c in cur.description]
+        return dict(zip(cols, row)) if row else None
+
+    def digest(self, path: str) -> str:
+        """檔案的 sha256：大小沒變就用記錄值，否則（或還沒算過）重算並寫回。"""
+        from utils import file_sha256
+        rec = self.info(path)
+        size = os.path.getsize(path)
+        if rec and rec["sha256"] and rec["bytes"] == size:
+            return rec["sha256"]
+        digest = file_sha256(path)
+        if rec:
+            with self._lock:
+                self.conn.execute("UPDATE raw_files SET sha256 = ?, bytes = ? WHERE name = ?",
+                                  (digest, size, os.path.basename(path)))
+        else:
+            self.record(path, size=size, sha256=digest)
+        return digest
+
+    def summary(self) -> list:
+        """[(dataset, 檔案數, 最早日, 最新日, 總 bytes, cache 回填數)]"""
+        return self._query(
+            "SELECT dataset, COUNT(*), MIN(NULLIF(date, '')), MAX(date), SUM(bytes), SUM(cached) "
+            "FROM raw_files GROUP BY dataset ORDER BY dataset")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+_CATALOGS = {}
+_CAT_LOCK = threading.Lock()
+
+def get_catalog(raw_dir: str) -> RawCatalog:
+    """每個 raw 目錄整個行程共用一份（fork 出來的子行程各自重開）。"""
+    key = (os.path.abspath(raw_dir), os.getpid())
+    with _CAT_LOCK:
+        cat = _CATALOGS.get(key)
+        if cat is None:
+            cat = _CATALOGS[key] = RawCatalog(raw_dir)
+        return cat
@@ -0,0 +1,103 @@
+# columnar.py — Parquet 分區儲存：<out_root>/columnar/<name>/date=YYYY-MM-DD/part-0.parquet
+# 一個資料集一個交易日一個分區（重跑同一天直接覆蓋該分區），欄位帶型別；
+# 讀取支援欄位投影，以及日期範圍（分區剪枝）/ code（row group 統計）條件下推。
+# 需要 pyarrow（選用依賴；storage 設定含 parquet 時才會用到）。
+import os
+from datetime import date as _date
+
+import pandas as pd
+
+from utils import norm_ymd
+
+PART_NAME = "part-0.parquet"
+
+# 各資料集欄位型別（未列出的欄位一律存字串）
+FLOAT_COLS = {"open", "high", "low", "close"}
+INT_COLS = {"volume", "turnover", "net_foreign", "net_invest", "net_dealer", "net_total", "is_cached"}
+
+def _pa():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import pyarrow.dataset as pds
+    except ImportError as e:
+        raise RuntimeError("parquet storage requires pyarrow (pip install pyarrow)") from e
+    return pa, pq, pds
+
+def dataset_dir(out_root: str, name: str) -> str:
+    return os.path.join(out_root, "columnar", name)
+
+def _iso(ymd: str | None) -> str | None:
+    return f"{ymd[:4]}-{ymd[4:6]}-{ymd[6:]}" if ymd else None
+
+def _typed_table(df: pd.DataFrame):
+    pa, _, _ = _pa()
+    arrays, fields = [], []
+    for c in df.columns:
+        s = df[c]
+        if c in FLOAT_COLS:
+            arr, typ = pd.to_numeric(s, errors="coerce").astype("float64"), pa.float64()
+        elif c in INT_COLS:
+            arr, typ = pd.to_numeric(s, errors="coerce").round().astype("Int64"), pa.int64()
+        else:
+            arr, typ = s.astype("string"), pa.string()
+        arrays.append(pa.array(arr, type=typ, from_pandas=True))
+        fields.append(pa.field(str(c), typ))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+def write_partitions(df: pd.DataFrame, out_root: str, name: str) -> list:
+    """依 date 欄分區寫入；沒有 date 欄或日期認不得的列略過。回傳寫出的分區路徑。"""
+    if df is None or df.empty or "date" not in df.columns:
+        return []
+    _, pq, _ = _pa()
+    base = dataset_dir(out_root, name)
+    # 各資料集日期寫法不一（20240102 / 2024-01-02 / 民國），統一成 ISO 當分區值
+    iso = df["date"].map({d: _iso(norm_ymd(d)) for d in df["date"].dropna().unique()})
+    written = []
+    for day, part in df.drop(columns=["date"]).groupby(iso, sort=True):
+        d = os.path.join(base, f"date={day}")
+        os.makedirs(d, exist_ok=True)
+        path = os.path.join(d, PART_NAME)
+        tmp = path + ".tmp"
+        pq.write_table(_typed_table(part.reset_index(drop=True)), tmp, compression="zstd")
+        os.replace(tmp, path)
+        written.append(path)
+    return written
+
+def list_dates(out_root: str, name: str) -> list:
+    """已存在的分區日期（ISO，舊→新）。"""
+    base = dataset_dir(out_root, name)
+    if not os.path.isdir(base):
+        return []
+    return sorted(p[5:] for p in os.listdir(base) if p.startswith("date="))
+
+def read(out_root: str, name: str, columns=None, start=None, end=None, codes=None) -> pd.DataFrame:
+    """
+    讀回 DataFrame：
+      columns    —— 只讀這些欄位（date 一定附上）
+      start/end  —— 日期範圍（含兩端；任何 norm_ymd 認得的寫法），只打開範圍內的分區
+      codes      —— 只要這些 code 的列（下推到 parquet 掃描）
+    """
+    pa, _, pds = _pa()
+    base = dataset_dir(out_root, name)
+    if not os.path.isdir(base):
+        return pd.DataFrame(columns=[c for c in (columns or []) if c != "date"] + ["date"])
+    part = pds.partitioning(pa.schema([("date", pa.date32())]), flavor="hive")
+    dset = pds.dataset(base, format="parquet", partitioning=part)
+
+    flt = None
+    def _and(a, b):
+        return b if a is None else a & b
+    if start:
+        flt = _and(flt, pds.field("date") >= _date.fromisoformat(_iso(norm_ymd(start))))
+    if end:
+        flt = _and(flt, pds.field("date") <= _date.fromisoformat(_iso(norm_ymd(end))))
+    if codes is not None:
+        flt = _and(flt, pds.field("code").isin([str(c) for c in codes]))
+
+    cols = None
+    if columns:
+        cols = [c for c in columns if c != "date" and c in dset.schema.names] + ["date"]
+    table = dset.to_table(columns=cols, filter=flt)
+    # 整數欄保留 nullable Int64（有缺值也不會變 float）
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
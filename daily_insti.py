@@ -0,0 +1,55 @@
+# daily_insti.py — 個股價量 × 三大法人買賣超的實體化 join：SQLite 的 daily_insti 表，鍵 (code, date)
+# daily 或 insti 任一邊寫入某幾天後，用一條 INSERT ... SELECT ... ON CONFLICT 重算那幾天（先到後到都行）：
+#   以 daily 為主（LEFT JOIN insti），insti 還沒到的那天法人欄位先是 NULL，等 insti 寫入再補上。
+# 查個股的價量 + 法人走勢就是一次 (code, date) 索引查詢，不必每次把兩張全表讀進 pandas merge（query.py）。
+from store_sqlite import table_exists
+
+TABLE = "daily_insti"
+PRICE_COLS = ("name", "open", "high", "low", "close", "volume", "turnover")
+NET_COLS = ("net_foreign", "net_invest", "net_dealer", "net_total")
+SOURCES = ("daily", "insti")
+
+DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+        code TEXT NOT NULL, date TEXT NOT NULL, name TEXT,
+        open REAL, high REAL, low REAL, close REAL, volume INTEGER, turnover INTEGER,
+        net_foreign INTEGER, net_invest INTEGER, net_dealer INTEGER, net_total INTEGER
+    )""",
+    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{TABLE}_key ON {TABLE} (code, date)",
+)
+
+def _cols(conn, table: str) -> set:
+    return {r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+def refresh(db, dates=None) -> int:
+    """
+    重算 dates（ISO 清單）那幾天的 join；dates=None 整表重建。
+    daily 表還不存在時什麼都不做（insti 先到的情況）。回傳寫入列數。
+    """
+    conn = db.conn
+    if not table_exists(conn, "daily"):
+        return 0
+    for ddl in DDL:
+        conn.execute(ddl)
+    db.ensure_indexes(TABLE)        # (date, code)：store_sqlite.INDEXES
+    dcols = _cols(conn, "daily")
+    has_insti = table_exists(conn, "insti")
+    icols = _cols(conn, "insti") if has_insti else set()
+    sel = ["d.code", "d.date"]
+    sel += [f"d.{c}" if c in dcols else "NULL" for c in PRICE_COLS]
+    sel += [f"i.{c}" if c in icols else "NULL" for c in NET_COLS]
+    join = "LEFT JOIN insti AS i ON i.code = d.code AND i.date = d.date" if has_insti else ""
+    cols = ("code", "date") + PRICE_COLS + NET_COLS
+    upd = ", ".join(f"{c} = excluded.{c}" for c in PRICE_COLS + NET_COLS)
+    sql = (f"INSERT INTO {TABLE} ({', '.join(cols)}) SELECT {', '.join(sel)} FROM daily AS d {join} "
+           "WHERE d.code IS NOT NULL AND d.date {where} "
+           f"ON CONFLICT (code, date) DO UPDATE SET {upd}")
+    before = conn.total_changes
+    if dates is None:
+        conn.execute(sql.format(where="IS NOT NULL"))
+    else:
+        dates = sorted({d for d in dates if d})
+        for i in range(0, len(dates), 500):
+            chunk = dates[i:i + 500]
+            conn.execute(sql.format(where=f"IN ({','.join('?' * len(chunk))})"), chunk)
+    return conn.total_changes - before
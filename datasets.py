@@ -0,0 +1,74 @@
+# datasets.py — 資料集登錄表：每個資料集的主機、抓取器、normalizer、鍵、raw 檔名前綴
+# 抓取器 / normalizer 用 "模組:函式" 字串登錄，第一次用到才 import，
+# 所以 main.py --help、stats、只抓不轉的執行都不用載入 pandas。
+import importlib
+
+OPENAPI = "openapi.twse.com.tw"
+TWSE = "www.twse.com.tw"
+TPEX = "www.tpex.org.tw"
+
+def _resolve(target: str):
+    mod, _, attr = target.partition(":")
+    return getattr(importlib.import_module(mod), attr)
+
+class Dataset:
+    """
+    一個資料集的宣告：
+      host       實際打的主機（同主機共用並行額度 / 限速）
+      fetch      "模組:函式"，簽名 (client, out_root, dataset, probe, write=write_raw) -> raw 路徑
+                 （write 換掉就能攔下 payload，例如 pipeline.py 改成留在記憶體、背景寫檔）
+      normalize  "模組:函式"，raw 物件 -> DataFrame
+      key        SQLite 鍵；None = 全量快照，每次整表換新
+      raw        raw 檔名前綴（<raw>_YYYYMMDD.jsonl.gz）
+      backfill   有沒有歷史可回補（openapi 端點只有最新快照）
+      probe      抓取器會同時試探多個候選日（index_probe）；排程時要替每個同時請求各佔一個主機額度
+    """
+    def __init__(self, name: str, host: str, fetch: str, normalize: str, key=None,
+                 raw: str | None = None, backfill: bool = False, probe: bool = False):
+        self.name = name
+        self.host = host
+        self.fetch_target = fetch
+        self.normalize_target = normalize
+        self.key = tuple(key) if key else None
+        self.raw = raw or name
+        self.backfill = backfill
+        self.probe = probe
+
+    def fetcher(self):
+        return _resolve(self.fetch_target)
+
+    def normalizer(self):
+        return _resolve(self.normalize_target)
+
+    def __repr__(self):
+        return f"Dataset({self.name!r})"
+
+# 順序即 fetch-all 的順序
+REGISTRY = {d.name: d for d in (
+    Dataset("daily",   OPENAPI, "fetcher:fetch_dataset", "normalize:normalize_daily",  ("code", "date")),
+    Dataset("monthly", OPENAPI, "fetcher:fetch_dataset", "normalize:normalize_generic"),
+    Dataset("yearly",  OPENAPI, "fetcher:fetch_dataset", "normalize:normalize_generic"),
+    Dataset("basics",  OPENAPI, "fetcher:fetch_dataset", "normalize:normalize_basics", ("code",)),
+    Dataset("news",    OPENAPI, "fetcher:fetch_dataset", "normalize:normalize_news",   ("code", "date", "title")),
+    Dataset("holders", OPENAPI, "fetcher:fetch_dataset", "normalize:normalize_generic"),
+    Dataset("insti",   TWSE,    "insti:fetch_dataset",   "normalize:normalize_insti",  ("code", "date"), backfill=True),
+    Dataset("taiex",   TWSE,    "index_fetch:fetch_taiex_dataset", "normalize:normalize_taiex",
+            ("market", "date"), backfill=True, probe=True),
+    Dataset("otc",     TPEX,    "index_fetch:fetch_otc_dataset",   "normalize:normalize_otc",
+            ("market", "date"), backfill=True, probe=True),
+)}
+
+def names() -> list:
+    return list(REGISTRY)
+
+def get(name: str) -> Dataset:
+    return REGISTRY[name]
+
+def backfillable() -> list:
+    return [d.name for d in REGISTRY.values() if d.backfill]
+
+def hosts() -> dict:
+    return {d.name: d.host for d in REGISTRY.values()}
+
+def keys() -> dict:
+    return {d.name: d.key for d in REGISTRY.values() if d.key}
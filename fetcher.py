@@ -1,5 +1,7 @@
 from typing import Dict, Any, Tuple
-from utils import HttpClient, save_json, ensure_dir
+from datetime import datetime, timedelta, timezone
+from utils import HttpClient, ensure_dir
+from raw_archive import raw_path as archive_path, write_raw, find_latest
 import os
 
 BASE = "https://openapi.twse.com.tw/v1"
@@ -13,11 +15,22 @@ ENDPOINTS = {
     "holders": f"{BASE}/opendata/t187ap14_L",
 }
 
-def fetch(dataset: str, client: HttpClient, out_dir: str) -> str:
+def _today_tw() -> str:
+    return (datetime.now(timezone.utc) + timedelta(hours=8)).strftime("%Y%m%d")
+
+def fetch(dataset: str, client: HttpClient, out_dir: str, write=write_raw) -> str:
     if dataset not in ENDPOINTS:
         raise ValueError(f"Unknown dataset: {dataset}")
     url = ENDPOINTS[dataset]
-    data = client.get_json(url)
-    raw_path = os.path.join(out_dir, "raw", f"{dataset}.json")
-    save_json(data, raw_path)
-    return raw_path
+    data, unchanged = client.get_json_cached(url)
+    raw_dir = os.path.join(out_dir, "raw")
+    # 內容沒變就不再寫一份 raw（快照型端點多數日子都一樣），沿用最近一份
+    latest = find_latest(raw_dir, dataset)
+    if unchanged and latest:
+        print(f"[SKIP] {dataset} unchanged since last fetch")
+        return latest
+    return write(data, archive_path(raw_dir, dataset, _today_tw()))
+
+def fetch_dataset(client: HttpClient, out_root: str, dataset: str, probe: int = 1, write=write_raw) -> str:
+    """datasets 登錄表用的統一簽名。"""
+    return fetch(dataset, client, out_root, write=write)
@@ -1,13 +1,22 @@
 # index_fetch.py — 加權(TAIEX)/櫃買(OTC) 指數抓取：回推 + 快取最後一次有資料
-from utils import HttpClient, save_json
+import requests
+
+from utils import HttpClient, norm_ymd
+from ratelimit import RETRYABLE_STATUS
+from raw_archive import raw_path, write_raw, load_raw
+from trading_calendar import get_calendar
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 import os
-import json
-import requests
+import logging
+import threading
+
+log = logging.getLogger("index_fetch")
 
 # ---- 可調參數 ----
 MAX_BACKTRACK = 10              # 最多往前嘗試天數
 ANNOUNCE_HOUR_LOCAL = 16        # 當地時間（台北）幾點前視為尚未公布，先從前一交易日起算
+PROBE_WIDTH = 1                 # 同時試探的候選日數；1 = 逐日回推
 
 # ---- 時間 & 檔案工具 ----
 def _now_tw():
@@ -16,8 +25,10 @@ def _now_tw():
 def _ymd(dt: datetime) -> str:
     return dt.strftime("%Y%m%d")
 
-def _backtrack_dates(start: datetime, days: int):
-    """從 start 往前推回傳工作日清單（跳過週末），含 start 本身。"""
+def _backtrack_dates(start: datetime, days: int, cal=None):
+    """從 start 往前推回傳工作日清單（跳過週末；有日曆時也跳過已知休市日），含 start 本身。"""
+    if cal is not None:
+        return cal.prev_trading_days(start, days + 1)
     out = []
     d = start
     for _ in range(days + 1):
@@ -36,22 +47,25 @@ def _cache_dir(out_root):
     return d
 
 def _cache_path(out_root, market: str):
+    return os.path.join(_cache_dir(out_root), f"{market}_last.jsonl.gz")
+
+def _legacy_cache_path(out_root, market: str):
     return os.path.join(_cache_dir(out_root), f"{market}_last.json")
 
 def _save_cache(out_root, market: str, date_str: str, payload):
     path = _cache_path(out_root, market)
-    data = {"date": date_str, "data": payload}
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False)
+    write_raw({"date": date_str, "data": payload}, path)
     print(f"[CACHE] saved {market}={date_str} -> {path}")
 
 def _load_cache(out_root, market: str):
+    # 新格式優先，舊版 <market>_last.json 仍可讀
     path = _cache_path(out_root, market)
+    if not os.path.exists(path):
+        path = _legacy_cache_path(out_root, market)
     if not os.path.exists(path):
         return None
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            obj = json.load(f)
+        obj = load_raw(path)
         date_str = obj.get("date")
         data = obj.get("data")
         if data:
@@ -82,40 +96,87 @@ def _non_empty_otc(raw_obj) -> bool:
         return len(rows) > 0
     return False
 
+def _answered(err) -> bool:
+    """伺服器確實回了話（不可重試的 4xx，例如 404 沒這天）；連線錯誤 / 逾時 / 5xx / 斷路都不算。"""
+    resp = getattr(err, "response", None) if isinstance(err, requests.HTTPError) else None
+    return resp is not None and resp.status_code not in RETRYABLE_STATUS
+
+# ---- 候選日並行試探 ----
+def _probe_dates(dates, try_one, width: int = PROBE_WIDTH):
+    """
+    依新→舊順序，每批同時送出 width 個候選日的請求。
+    try_one(ymd) 回傳 (ok, data)；回傳最新一個 ok 的 (ymd, data)，全部失敗回 None。
+    找到後尚未開始的請求取消，進行中的那幾個等它們結束才回傳（結果丟棄）：
+    呼叫端持有的主機並行額度要涵蓋每個送出的請求，回傳後也不會再有人寫日曆。
+    """
+    width = max(1, int(width or 1))
+    for b in range(0, len(dates), width):
+        batch = dates[b:b + width]
+        if len(batch) == 1:
+            ok, data = try_one(batch[0])
+            if ok:
+                return batch[0], data
+            continue
+        ex = ThreadPoolExecutor(max_workers=len(batch))
+        try:
+            futs = [ex.submit(try_one, ymd) for ymd in batch]
+            for ymd, fut in zip(batch, futs):
+                ok, data = fut.result()
+                if ok:
+                    return ymd, data
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+    return None
+
+def _start_date(date_yyyymmdd):
+    # 起始日：未指定且未到公布時間，先從前一工作日
+    if date_yyyymmdd:
+        return datetime.strptime(date_yyyymmdd, "%Y%m%d")
+    start = _now_tw()
+    if start.hour < ANNOUNCE_HOUR_LOCAL:
+        start = start - timedelta(days=1)
+    return start
+
 # ---- 抓取：TAIEX ----
+def _try_taiex(client: HttpClient, ymd: str, tag="", cal=None, strict: bool = False):
+    """
+    回傳 (ok, data)。預設（每日回推）抓不到一律當空、交給 cache 回填；
+    strict=True（回補）時連線 / HTTP / 斷路錯誤往上拋，只有交易所真的回了「沒資料」才是空。
+    """
+    url = f"https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?date={ymd}&type=IND"
+    try:
+        data = client.get_json(url)
+        ok = _non_empty_taiex(data)
+        if cal is not None:
+            cal.observe(ymd, ok)
+    except Exception:
+        if strict:
+            raise
+        ok = False
+        data = {}
+    log.debug("TAIEX try=%s date=%s ok=%s", tag, ymd, ok)
+    return ok, data
+
 def fetch_taiex(client: HttpClient, out_root: str, date_yyyymmdd: str | None = None,
-                max_backtrack: int = MAX_BACKTRACK, use_cache: bool = True):
+                max_backtrack: int = MAX_BACKTRACK, use_cache: bool = True,
+                probe: int = PROBE_WIDTH, write=write_raw):
     """
     抓 TWSE 加權指數（MI_INDEX?type=IND）
-    先回推工作日；若都空，使用 cache 回填，raw 會標註 _cached 與 _cached_from。
+    先回推工作日（probe>1 時每批同時試 probe 天，取最新有資料者）；
+    若都空，使用 cache 回填，raw 會標註 _cached 與 _cached_from。
     """
     raw_dir = os.path.join(out_root, "raw"); _ensure_dir(raw_dir)
+    cal = get_calendar(out_root)
+    dates = _backtrack_dates(_start_date(date_yyyymmdd), max_backtrack, cal)
 
-    # 起始日：未指定且未到公布時間，先從前一工作日
-    if date_yyyymmdd:
-        start = datetime.strptime(date_yyyymmdd, "%Y%m%d")
-    else:
-        start = _now_tw()
-        if _now_tw().hour < ANNOUNCE_HOUR_LOCAL:
-            start = start - timedelta(days=1)
-    dates = _backtrack_dates(start, max_backtrack)
-
-    for i, ymd in enumerate(dates):
-        url = f"https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?date={ymd}&type=IND"
-        ok = False
-        try:
-            data = client.get_json(url)
-            ok = _non_empty_taiex(data)
-        except Exception:
-            ok = False
-            data = {}
-
-        print(f"DEBUG[TAIEX] try={i}, date={ymd}, ok={ok}")
-        path = os.path.join(raw_dir, f"taiex_{ymd}.json")
-        if ok:
-            save_json(data, path)
-            _save_cache(out_root, "taiex", ymd, data)
-            return path, ymd
+    tags = {ymd: i for i, ymd in enumerate(dates)}
+    hit = _probe_dates(dates, lambda ymd: _try_taiex(client, ymd, tags[ymd], cal), probe)
+    if hit:
+        ymd, data = hit
+        path = raw_path(raw_dir, "taiex", ymd)
+        write(data, path)
+        _save_cache(out_root, "taiex", ymd, data)
+        return path, ymd
 
     # 都抓不到 → 用 cache 回填
     if use_cache:
@@ -125,88 +186,111 @@ def fetch_taiex(client: HttpClient, out_root: str, date_yyyymmdd: str | None = N
             ymd = dates[0]  # 以預期日命名
             out_obj = {"_cached": True, "_cached_from": cdate,
                        **(cdata if isinstance(cdata, dict) else {"data": cdata})}
-            path = os.path.join(raw_dir, f"taiex_{ymd}.json")
-            save_json(out_obj, path)
+            path = raw_path(raw_dir, "taiex", ymd)
+            write(out_obj, path)
             print(f"INFO[TAIEX] used cache from {cdate} -> {path}")
             return path, ymd
 
     # 仍無 → 存空
     ymd = dates[0]
-    path = os.path.join(raw_dir, f"taiex_{ymd}.json")
-    save_json({}, path)
+    path = raw_path(raw_dir, "taiex", ymd)
+    write({}, path)
     print(f"INFO[TAIEX] no data after backtrack {max_backtrack} days; saved empty for {ymd}")
     return path, ymd
 
 # ---- 抓取：OTC ----
+OTC_SNAPSHOT_URL = "https://www.tpex.org.tw/openapi/v1/tpex_mainboard_index"
+
+def _row_date(row) -> str | None:
+    if not isinstance(row, dict):
+        return None
+    return norm_ymd(row.get("date") or row.get("Date") or row.get("tradeDate") or
+                    row.get("日期") or row.get("time"))
+
+class OtcSnapshot:
+    """
+    TPEX 主板指數全量端點：第一次查詢時才透過 HttpClient 下載，
+    之後以 {YYYYMMDD: [rows]} 查表（民國/西元各種寫法統一）。
+    多執行緒共用安全；下載失敗視為空快照，不重試第二次。
+    """
+    def __init__(self, client: HttpClient, url: str = OTC_SNAPSHOT_URL):
+        self.client = client
+        self.url = url
+        self._by_date = None
+        self.error = None           # 下載失敗的例外（strict 查詢時拋出）
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            data = self.client.get_json(self.url)
+        except Exception as e:
+            self.error = e
+            data = []
+        by_date = {}
+        for row in data if isinstance(data, list) else []:
+            ymd = _row_date(row)
+            if ymd:
+                by_date.setdefault(ymd, []).append(row)
+        return by_date
+
+    def rows_on(self, ymd: str, strict: bool = False) -> list:
+        """strict=True 且快照下載失敗時拋出該錯誤（不把「沒下載到」當成「那天沒資料」）。"""
+        with self._lock:
+            if self._by_date is None:
+                self._by_date = self._load()
+        if strict and self.error is not None:
+            raise self.error
+        return self._by_date.get(ymd, [])
+
+def _try_otc(client: HttpClient, ymd: str, tag="", snapshot=None, strict: bool = False):
+    """
+    回傳 (ok, rows)。strict=True（回補）時連線 / 5xx / 斷路錯誤往上拋；
+    主端點回 4xx（不支援該日期）仍改查全量快照。
+    """
+    # 先主端點
+    primary = f"https://www.tpex.org.tw/openapi/v1/tpex_mainboard_index?date={ymd}"
+    obj = None
+    try:
+        obj = client.get_json(primary)
+    except Exception as e:
+        if strict and not _answered(e):
+            raise
+        obj = None
+
+    # 失敗/空 → 查全量快照（整次執行只下載一次，依日期建索引）
+    if not _non_empty_otc(obj):
+        obj = snapshot.rows_on(ymd, strict) if snapshot is not None else []
+
+    rows = (len(obj) if isinstance(obj, list) else len(obj.get("data", [])) if isinstance(obj, dict) else 0)
+    log.debug("OTC try=%s date=%s rows=%s", tag, ymd, rows)
+    return _non_empty_otc(obj), obj
+
 def fetch_otc(client: HttpClient, out_root: str, date_yyyymmdd: str | None = None,
-              max_backtrack: int = MAX_BACKTRACK, use_cache: bool = True):
+              max_backtrack: int = MAX_BACKTRACK, use_cache: bool = True,
+              probe: int = PROBE_WIDTH, snapshot: OtcSnapshot | None = None,
+              write=write_raw):
     """
     抓 TPEX 主板指數：
       1) 打 ?date=YYYYMMDD
-      2) 空 → 打全量端點過濾
-      3) 回推工作日
+      2) 空 → 查全量端點快照（一次下載、依日期索引；可由呼叫端傳入共用）
+      3) 回推工作日（probe>1 時每批同時試 probe 天）
       4) 最後用 cache 回填
     """
     raw_dir = os.path.join(out_root, "raw"); _ensure_dir(raw_dir)
+    cal = get_calendar(out_root)
+    dates = _backtrack_dates(_start_date(date_yyyymmdd), max_backtrack, cal)
 
-    # 起始日
-    if date_yyyymmdd:
-        start = datetime.strptime(date_yyyymmdd, "%Y%m%d")
-    else:
-        start = _now_tw()
-        if _now_tw().hour < ANNOUNCE_HOUR_LOCAL:
-            start = start - timedelta(days=1)
-    dates = _backtrack_dates(start, max_backtrack)
-
-    for i, ymd in enumerate(dates):
-        # 先主端點
-        primary = f"https://www.tpex.org.tw/openapi/v1/tpex_mainboard_index?date={ymd}"
-        obj = None
-        try:
-            obj = client.get_json(primary)
-        except Exception:
-            obj = None
-
-        # 失敗/空 → 打全量端點並過濾
-        if not _non_empty_otc(obj):
-            try:
-                r = requests.get("https://www.tpex.org.tw/openapi/v1/tpex_mainboard_index",
-                                 timeout=20,
-                                 headers={"User-Agent": "Mozilla/5.0 (compatible; twse-pipeline/1.0)"})
-                txt = (r.text or "").strip()
-                if txt.startswith("[") or txt.startswith("{"):
-                    data = json.loads(txt)
-                else:
-                    data = []
-            except Exception:
-                data = []
-
-            yyyy, mm, dd = ymd[:4], ymd[4:6], ymd[6:8]
-            patterns = {f"{yyyy}{mm}{dd}", f"{yyyy}-{mm}-{dd}", f"{yyyy}/{mm}/{dd}"}
-            try:  # 民國年
-                patterns.add(f"{int(yyyy)-1911}/{mm}/{dd}")
-            except Exception:
-                pass
-
-            filtered = []
-            for row in data if isinstance(data, list) else []:
-                cand = str(
-                    row.get("date") or row.get("Date") or row.get("tradeDate") or
-                    row.get("日期") or row.get("time") or ""
-                ).strip()
-                cand = cand.replace(".", "-").replace(".", "/")
-                if cand in patterns:
-                    filtered.append(row)
-
-            obj = filtered
-
-        rows = (len(obj) if isinstance(obj, list) else len(obj.get("data", [])) if isinstance(obj, dict) else 0)
-        print(f"DEBUG[OTC] try={i}, date={ymd}, rows={rows}")
-        path = os.path.join(raw_dir, f"otc_{ymd}.json")
-        if _non_empty_otc(obj):
-            save_json(obj, path)
-            _save_cache(out_root, "otc", ymd, obj)
-            return path, ymd
+    snapshot = snapshot or OtcSnapshot(client)
+    tags = {ymd: i for i, ymd in enumerate(dates)}
+    hit = _probe_dates(dates, lambda ymd: _try_otc(client, ymd, tags[ymd], snapshot), probe)
+    if hit:
+        ymd, obj = hit
+        # OTC 回空不一定是休市（全量端點只涵蓋近期），只學「有資料 = 交易日」
+        cal.observe(ymd, True)
+        path = raw_path(raw_dir, "otc", ymd)
+        write(obj, path)
+        _save_cache(out_root, "otc", ymd, obj)
+        return path, ymd
 
     # 都抓不到 → 用 cache 回填
     if use_cache:
@@ -216,15 +300,24 @@ def fetch_otc(client: HttpClient, out_root: str, date_yyyymmdd: str | None = Non
             ymd = dates[0]
             out_obj = {"_cached": True, "_cached_from": cdate,
                        "data": cdata if isinstance(cdata, list) else cdata.get("data", [])}
-            path = os.path.join(raw_dir, f"otc_{ymd}.json")
-            save_json(out_obj, path)
+            path = raw_path(raw_dir, "otc", ymd)
+            write(out_obj, path)
             print(f"INFO[OTC] used cache from {cdate} -> {path}")
             return path, ymd
 
     # 仍無 → 存空
     ymd = dates[0]
-    path = os.path.join(raw_dir, f"otc_{ymd}.json")
-    save_json([], path)
+    path = raw_path(raw_dir, "otc", ymd)
+    write([], path)
     print(f"INFO[OTC] no data after backtrack {max_backtrack} days; saved empty for {ymd}")
     return path, ymd
 
+
+# ---- datasets 登錄表用的統一簽名 ----
+def fetch_taiex_dataset(client: HttpClient, out_root: str, dataset: str = "taiex", probe: int = 1,
+                        write=write_raw) -> str:
+    return fetch_taiex(client, out_root, probe=probe, write=write)[0]
+
+def fetch_otc_dataset(client: HttpClient, out_root: str, dataset: str = "otc", probe: int = 1,
+                      write=write_raw) -> str:
+    return fetch_otc(client, out_root, probe=probe, write=write)[0]
@@ -0,0 +1,206 @@
+# indicators.py — 個股技術指標（增量）：寫入 SQLite 的 indicators 表，鍵 (code, date)
+#   daily → ma5 / ma20 / ma60（收盤均線）、std20（收盤 20 日標準差）
+#   insti → foreign_20d / invest_20d / dealer_20d（三大法人 20 日累計買賣超）
+# 每檔保留最近 W 筆數值當狀態（ind_state_<來源> 表，一檔一列、數值矩陣存成 BLOB）。
+# 每天只把新的一天推進窗格，全部股票一起用 numpy 算：成本 O(股票數)，與歷史長度無關。
+# 語意與 pandas rolling(k)（min_periods=k）相同：不足 k 筆或窗內有缺值 → NaN。
+# 舊日期被改寫（回補、renormalize）時窗格已不連續，改用 rebuild 從來源表依 (code, date) 分塊串流重算。
+import numpy as np
+import pandas as pd
+
+from schema import day_number, to_storage, to_iso, iso_of
+from store_sqlite import table_exists
+
+TABLE = "indicators"
+MA_WINDOWS = (5, 20, 60)
+STD_WINDOW = 20
+NET_WINDOW = 20
+DECIMALS = 4
+CHUNK_ROWS = 200_000            # rebuild 每次從來源表讀的列數
+
+# 來源資料集 -> (讀進狀態的欄位, 狀態窗格長度)
+SOURCES = {
+    "daily": (("close",), max(MA_WINDOWS + (STD_WINDOW,))),
+    "insti": (("net_foreign", "net_invest", "net_dealer"), NET_WINDOW),
+}
+
+def _state_table(ds: str) -> str:
+    return f'"ind_state_{ds}"'
+
+# ---- 指標（窗格矩陣 → 欄位） ----
+def _from_window(ds: str, win: np.ndarray) -> dict:
+    """win：股票 × W × 欄位（最後一格是當天）。回傳 {指標名: 每檔一個值}。"""
+    if ds == "daily":
+        close = win[:, :, 0]
+        out = {f"ma{k}": close[:, -k:].mean(axis=1) for k in MA_WINDOWS}
+        out[f"std{STD_WINDOW}"] = close[:, -STD_WINDOW:].std(axis=1, ddof=1)
+        return out
+    return {f"{c[4:]}_{NET_WINDOW}d": win[:, -NET_WINDOW:, i].sum(axis=1)
+            for i, c in enumerate(SOURCES[ds][0])}
+
+def _from_history(ds: str, df: pd.DataFrame) -> dict:
+    """df 依 (code, date) 排序；整欄 rolling 後把跨股票的前 k-1 列遮掉。"""
+    pos = df.groupby("code", observed=True, sort=False).cumcount().to_numpy()
+
+    def roll(col, k, how):
+        r = getattr(df[col].rolling(k, min_periods=k), how)()
+        return r.where(pos >= k - 1).to_numpy()
+
+    if ds == "daily":
+        out = {f"ma{k}": roll("close", k, "mean") for k in MA_WINDOWS}
+        out[f"std{STD_WINDOW}"] = roll("close", STD_WINDOW, "std")
+        return out
+    return {f"{c[4:]}_{NET_WINDOW}d": roll(c, NET_WINDOW, "sum") for c in SOURCES[ds][0]}
+
+def _values(df: pd.DataFrame, cols) -> pd.DataFrame:
+    """code 字串、date 日序、數值欄 float64（float32 先取最短十進位）；精簡型別或資料庫讀回的都可以。"""
+    s = to_storage(df[["code", "date", *cols]])
+    out = pd.DataFrame({"code": s["code"], "date": day_number(s["date"])}, index=s.index)
+    for c in cols:
+        out[c] = pd.to_numeric(s[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    out = out.dropna(subset=["code", "date"])
+    out["code"] = out["code"].astype(str)
+    out["date"] = out["date"].astype("int64")
+    return out
+
+def _frame(codes, day, ind: dict) -> pd.DataFrame:
+    out = pd.DataFrame({"code": codes, "date": iso_of(day) if np.isscalar(day) else day})
+    for name, v in ind.items():
+        out[name] = np.round(v, DECIMALS)
+    return out
+
+# ---- 狀態 ----
+def _ensure_state(db, ds: str):
+    db.conn.execute(f"CREATE TABLE IF NOT EXISTS {_state_table(ds)} "
+                    f"(code TEXT PRIMARY KEY, day INTEGER NOT NULL, win BLOB NOT NULL)")
+
+def _load_state(db, ds: str, codes) -> tuple:
+    """回傳 (各檔最後日序 dict, 各檔窗格 dict)；只讀這次用得到的股票。"""
+    cols, w = SOURCES[ds]
+    days, wins = {}, {}
+    codes = list(codes)
+    for i in range(0, len(codes), 900):        # SQLite 參數上限
+        chunk = codes[i:i + 900]
+        for code, day, blob in db.conn.execute(
+                f"SELECT code, day, win FROM {_state_table(ds)} "
+                f"WHERE code IN ({','.join('?' * len(chunk))})", chunk):
+            days[code] = day
+            wins[code] = np.frombuffer(blob, dtype=np.float64).reshape(w, len(cols))
+    return days, wins
+
+def _save_state(db, ds: str, codes, day_of, win: np.ndarray):
+    db.conn.executemany(
+        f"INSERT OR REPLACE INTO {_state_table(ds)} (code, day, win) VALUES (?, ?, ?)",
+        [(c, int(d), win[i].tobytes()) for i, (c, d) in enumerate(zip(codes, day_of))])
+
+# ---- 對外 ----
+def update(db, ds: str, df: pd.DataFrame) -> int:
+    """
+    把 df（normalize 後、剛寫入的 daily / insti）推進各檔窗格並寫指標；回傳寫入列數。
+    df 可含多天（依日期逐天推進）；同一天重跑會覆蓋當天那一格。
+    還沒有狀態（第一次啟用）或出現比狀態還舊的日期 → 從來源表整段重算。
+    """
+    if ds not in SOURCES or df is None or df.empty:
+        return 0
+    cols, w = SOURCES[ds]
+    if not all(c in df.columns for c in ("code", "date", *cols)):
+        return 0
+    if not table_exists(db.conn, f"ind_state_{ds}"):
+        return rebuild(db, ds)
+    vals = _values(df, cols).drop_duplicates(subset=["code", "date"], keep="last")
+    last_day, wins = _load_state(db, ds, vals["code"].unique())
+    if last_day and vals["date"].min() < max(last_day.values()) and \
+            any(d < last_day.get(c, -1) for c, d in zip(vals["code"], vals["date"])):
+        print(f"[INFO] indicators {ds}: older dates rewritten -> rebuild")
+        return rebuild(db, ds)
+
+    written = 0
+    for day, part in vals.sort_values("date").groupby("date", sort=True):
+        codes = part["code"].tolist()
+        new = part[list(cols)].to_numpy(dtype=np.float64)
+        nan = np.full((w, len(cols)), np.nan)
+        win = np.stack([wins.get(c, nan) for c in codes])
+        same = np.array([last_day.get(c) == day for c in codes])
+        # 新的一天：整格左移一位；同一天重跑：直接覆蓋最後一格
+        win[~same] = np.roll(win[~same], -1, axis=1)
+        win[:, -1, :] = new
+        _save_state(db, ds, codes, [day] * len(codes), win)
+        for i, c in enumerate(codes):
+            wins[c], last_day[c] = win[i], day
+        written += db.upsert(_frame(codes, day, _from_window(ds, win)), TABLE)
+    return written
+
+def refresh(db, ds: str, dates) -> int:
+    """
+    ds 寫入了 dates（ISO 清單，回補用）之後更新指標；回傳寫入列數。
+    dates 都不早於現有狀態 → 逐天從來源表讀那一天、用 update 推進（成本與歷史長度無關）；
+    有比狀態還舊的日期（補的是中間的缺口）或還沒有狀態 → rebuild。
+    """
+    dates = sorted({d for d in dates or () if d})
+    if ds not in SOURCES or not dates or not table_exists(db.conn, ds):
+        return 0
+    if not table_exists(db.conn, f"ind_state_{ds}"):
+        return rebuild(db, ds)
+    latest = db.conn.execute(f"SELECT MAX(day) FROM {_state_table(ds)}").fetchone()[0]
+    first = day_number(pd.Series([dates[0]]))[0]
+    if latest is not None and (pd.isna(first) or first < latest):
+        print(f"[INFO] indicators {ds}: {dates[0]} is before existing state -> rebuild")
+        return rebuild(db, ds)
+    cols, _ = SOURCES[ds]
+    n = 0
+    for d in dates:
+        df = pd.read_sql_query(f'SELECT code, date, {", ".join(cols)} FROM "{ds}" WHERE date = ?',
+                               db.conn, params=[d])
+        n += update(db, ds, df)
+    return n
+
+def _tail_state(df: pd.DataFrame, cols, w: int) -> tuple:
+    """df 依 (code, date) 排序；每檔最後 w 筆（不足的前面補 NaN）→ (codes, 最後日序, 窗格矩陣)。"""
+    codes, days, mats = [], [], []
+    for code, g in df.groupby("code", sort=False).tail(w).groupby("code", sort=False):
+        m = np.full((w, len(cols)), np.nan)
+        m[w - len(g):] = g[list(cols)].to_numpy(dtype=np.float64)
+        codes.append(code)
+        days.append(g["date"].iloc[-1])
+        mats.append(m)
+    return codes, days, mats
+
+def rebuild(db, ds: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    從來源表整段重算 ds 的指標與狀態（首次使用、回補舊日期、renormalize 後用）。
+    依 (code, date) 順序每次讀 chunk_rows 列（走鍵的唯一索引，不排序）：
+    上一塊最後那檔的最後 W 筆接到下一塊前面當窗格，算完只寫本塊的列；記憶體與歷史長度無關。
+    """
+    if ds not in SOURCES or not table_exists(db.conn, ds):
+        return 0
+    cols, w = SOURCES[ds]
+    have = [r[1] for r in db.conn.execute(f'PRAGMA table_info("{ds}")')]
+    if not all(c in have for c in ("code", "date", *cols)):
+        return 0
+    _ensure_state(db, ds)
+    db.conn.execute(f"DELETE FROM {_state_table(ds)}")
+    sql = f'SELECT code, date, {", ".join(cols)} FROM "{ds}" ORDER BY code, date'
+    n, carry = 0, None
+    for block in pd.read_sql_query(sql, db.conn, chunksize=max(int(chunk_rows), w)):
+        block = _values(block, cols)
+        if block.empty:
+            continue
+        df = block if carry is None else pd.concat([carry, block], ignore_index=True)
+        df = df.reset_index(drop=True)
+        ind = _from_history(ds, df)
+        keep = np.arange(len(df)) >= (0 if carry is None else len(carry))
+        out = _frame(df["code"].to_numpy()[keep], to_iso(df["date"][keep]).to_numpy(),
+                     {k: v[keep] for k, v in ind.items()})
+        n += db.upsert(out, TABLE)
+        # 最後一檔可能延續到下一塊：留到下一塊再寫狀態
+        last = df["code"].iat[-1]
+        done = df[df["code"] != last]
+        carry = df[df["code"] == last].tail(w)
+        codes, days, mats = _tail_state(done, cols, w)
+        if codes:
+            _save_state(db, ds, codes, days, np.stack(mats))
+    if carry is not None:
+        codes, days, mats = _tail_state(carry, cols, w)
+        _save_state(db, ds, codes, days, np.stack(mats))
+    print(f"[OK] indicators {ds}: rebuilt {n} rows")
+    return n
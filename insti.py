@@ -1,21 +1,39 @@
 # insti.py —— 取得 TWSE 三大法人（T86）
 from datetime import datetime, timedelta, timezone
 import os
-from utils import HttpClient, save_json
+from utils import HttpClient
+from raw_archive import raw_path, write_raw
+from trading_calendar import get_calendar
 
-def _taipei_yyyymmdd():
+def _taipei_yyyymmdd(cal=None):
     # Actions 跑在 UTC；轉台北時區並處理週末（六日退到最近週五）
     now = datetime.now(timezone.utc) + timedelta(hours=8)
+    if cal is not None:
+        # 有交易日曆：連國定假日 / 已知休市日一起跳過
+        return cal.latest_trading_day(now)
     if now.weekday() == 5:      # Sat
         now -= timedelta(days=1)
     elif now.weekday() == 6:    # Sun
         now -= timedelta(days=2)
     return now.strftime("%Y%m%d")
 
-def fetch_insti(client: HttpClient, out_root: str, date_yyyymmdd: str | None = None):
-    date_yyyymmdd = date_yyyymmdd or _taipei_yyyymmdd()
-    url = f"https://www.twse.com.tw/rwd/zh/fund/T86?date={date_yyyymmdd}&selectType=ALL"
-    data = client.get_json(url)
-    raw_path = os.path.join(out_root, "raw", f"insti_{date_yyyymmdd}.json")
-    save_json(data, raw_path)
-    return raw_path, date_yyyymmdd
+T86_URL = "https://www.twse.com.tw/rwd/zh/fund/T86?date={ymd}&selectType=ALL"
+
+def get_insti(client: HttpClient, ymd: str, cal=None):
+    """抓單日 T86（不落地）；有日曆時順便記錄當天是否開市。"""
+    data = client.get_json(T86_URL.format(ymd=ymd))
+    if cal is not None:
+        cal.observe(ymd, bool(isinstance(data, dict) and data.get("data")))
+    return data
+
+def fetch_insti(client: HttpClient, out_root: str, date_yyyymmdd: str | None = None, write=write_raw):
+    cal = get_calendar(out_root)
+    date_yyyymmdd = date_yyyymmdd or _taipei_yyyymmdd(cal)
+    data = get_insti(client, date_yyyymmdd, cal)
+    path = write(data, raw_path(os.path.join(out_root, "raw"), "insti", date_yyyymmdd))
+    return path, date_yyyymmdd
+
+def fetch_dataset(client: HttpClient, out_root: str, dataset: str = "insti", probe: int = 1,
+                  write=write_raw) -> str:
+    """datasets 登錄表用的統一簽名。"""
+    return fetch_insti(client, out_root, write=write)[0]
@@ -1,101 +1,334 @@
 # main.py — 加入「大盤指數 TAIEX / OTC」，並保留 insti（三大法人）
 # 變更標記：# NEW / # CHG
+# CHG: 資料集的抓取器 / normalizer 改由 datasets.py 登錄表派送；重模組（pandas、requests、yaml…）
+#      一律在用到的函式裡才 import，--help / stats / 只抓不轉都不用付這些 import 的時間
 
-import argparse, os, yaml, sys, json
-from utils import HttpClient
-from fetcher import fetch as fetch_openapi
-from normalize import (
-    normalize_daily, normalize_basics, normalize_news, normalize_generic,
-    normalize_insti,
-    normalize_taiex,            # NEW
-    normalize_otc               # NEW
-)
-from store import save, save_csv
-from insti import fetch_insti
-from index_fetch import fetch_taiex, fetch_otc   # NEW
-import pandas as pd
-
-# CHG: 擴充資料集清單
-DATASETS = ["daily","monthly","yearly","basics","news","holders","insti","taiex","otc"]  # CHG
+import argparse, os, sys, json, logging
+import datasets
+import telemetry
+import profiling
+
+# CHG: 資料集清單來自登錄表
+DATASETS = datasets.names()
 
 def load_config(path="config.yaml"):
+    import yaml
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def run_fetch(datasets, cfg):
-    client = HttpClient(timeout=cfg.get("timeout_sec",20), retries=cfg.get("retries",3))
+def make_client(cfg):
+    from utils import HttpClient
+    from ratelimit import RateLimiter
     out_root = cfg.get("output_dir","data")
-    raw_paths = {}
-    for ds in datasets:
-        # NEW: 依資料集呼叫不同抓取器
-        if ds == "insti":
-            raw_path, the_date = fetch_insti(client, out_root)
-        elif ds == "taiex":   # NEW
-            raw_path, the_date = fetch_taiex(client, out_root)
-        elif ds == "otc":     # NEW
-            raw_path, the_date = fetch_otc(client, out_root)
-        else:
-            raw_path = fetch_openapi(ds, client, out_root)
+    cache_dir = os.path.join(out_root, "cache", "http") if cfg.get("http_cache", True) else None
+    backoff = cfg.get("http_backoff") or {}
+    breaker = cfg.get("circuit_breaker") or {}
+    limiter = RateLimiter(cfg.get("rate_limits"),
+                          backoff_base=float(backoff.get("base", 1.0)),
+                          backoff_cap=float(backoff.get("cap", 30.0)),
+                          breaker_threshold=int(breaker.get("threshold", 5)),
+                          breaker_cooldown=float(breaker.get("cooldown", 60)))
+    return HttpClient(timeout=cfg.get("timeout_sec",20), retries=cfg.get("retries",3),
+                      cache_dir=cache_dir, limiter=limiter, base_urls=cfg.get("base_urls"),
+                      record_dir=cfg.get("http_record_dir"))
+
+# NEW: 記錄每個資料集上次 normalize 的 raw 雜湊，內容沒變就不重做
+def _state_path(out_root):
+    return os.path.join(out_root, "cache", "normalize_state.json")
+
+def load_normalize_state(out_root):
+    path = _state_path(out_root)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_normalize_state(out_root, state):
+    path = _state_path(out_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+def fetch_one(ds, client, cfg, probe=None):
+    out_root = cfg.get("output_dir","data")
+    if probe is None:
+        # 逐一抓取：試探寬度仍不超過該主機的並行上限
+        from scheduler import HostLimiter, DATASET_HOSTS
+        probe = min(int(cfg.get("index_probe", 1) or 1),
+                    HostLimiter(cfg.get("host_limits")).limit(DATASET_HOSTS.get(ds, ds)))
+    # CHG: 抓取器由登錄表決定
+    with telemetry.stage("fetch", ds):
+        raw_path = datasets.get(ds).fetcher()(client, out_root, ds, probe=probe)
+
+    print(f"[OK] fetched {ds} -> {raw_path}")
+    return raw_path
+
+def run_fetch(names, cfg):
+    from trading_calendar import get_calendar, flush_all as flush_calendars
+    from scheduler import run_concurrent
+    client = make_client(cfg)
+    # NEW: 交易日曆種子假日（之後各抓取器共用同一份日曆）
+    get_calendar(cfg.get("output_dir","data"), holidays=cfg.get("holidays"))
+    workers = int(cfg.get("fetch_workers", 1) or 1)
+    try:
+        if workers <= 1 or len(names) <= 1:
+            return {ds: fetch_one(ds, client, cfg) for ds in names}
+        # NEW: 各資料集互不相依 → 並行抓取（每個主機另有並行上限）
+        return run_concurrent(names, lambda ds, width: fetch_one(ds, client, cfg, probe=width),
+                              workers=workers, host_limits=cfg.get("host_limits"),
+                              probe=int(cfg.get("index_probe", 1) or 1))
+    finally:
+        flush_calendars()
+        for line in client.limiter.report():
+            print(line)
+
+def run_pipelined(names, cfg, force=False):
+    """串流模式：抓到就 normalize、normalize 完就寫入（pipeline.py）；raw 在背景落地。"""
+    from trading_calendar import get_calendar, flush_all as flush_calendars
+    from store import open_store
+    from pipeline import run_pipeline, DEFAULT_NORMALIZE_WORKERS, DEFAULT_QUEUE_SIZE
+    out_root = cfg.get("output_dir","data")
+    client = make_client(cfg)
+    get_calendar(out_root, holidays=cfg.get("holidays"))
+    state = load_normalize_state(out_root)
+    try:
+        with open_store(out_root) as db:
+            done, errors = run_pipeline(
+                names, client, out_root, store=lambda ds, df: store_one(ds, df, cfg, db),
+                state=state, force=force,
+                workers=int(cfg.get("fetch_workers", 1) or 1),
+                normalize_workers=int(cfg.get("normalize_workers", DEFAULT_NORMALIZE_WORKERS) or 1),
+                host_limits=cfg.get("host_limits"), probe=int(cfg.get("index_probe", 1) or 1),
+                queue_size=int(cfg.get("pipeline_queue", DEFAULT_QUEUE_SIZE) or 1))
+    finally:
+        flush_calendars()
+        for line in client.limiter.report():
+            print(line)
+    # 成功的資料集已 commit：先記狀態，再回報失敗
+    state.update(done)
+    save_normalize_state(out_root, state)
+    if errors:
+        raise next(iter(errors.values()))
+    return done
+
+def run_normalize(names, cfg, force=False):
+    from store import open_store
+    out_root = cfg.get("output_dir","data")
+    state = load_normalize_state(out_root)
+    done = {}
+    # CHG: 整次 normalize 共用一條 SQLite 連線、一個交易；commit 成功才更新 normalize 狀態
+    with open_store(out_root) as db:
+        for ds in names:
+            digest = normalize_one(ds, cfg, db, state.get(ds), force)
+            if digest:
+                done[ds] = digest
+    state.update(done)
+    save_normalize_state(out_root, state)
+
+def normalize_one(ds, cfg, db, last_digest=None, force=False):
+    """normalize + 儲存單一資料集最新的 raw；回傳其雜湊（略過時回 None）。"""
+    from catalog import get_catalog
+    from raw_archive import find_latest, load_raw
+    spec = datasets.get(ds)
+    out_root = cfg.get("output_dir","data")
+    # CHG: raw 檔名都帶日期（<ds>_YYYYMMDD.jsonl.gz），取最新一份；舊版 .json 仍可讀
+    raw_path = find_latest(os.path.join(out_root, "raw"), spec.raw)
+    if not raw_path:
+        print(f"[WARN] no raw {ds} file found, skip")
+        return None
 
-        print(f"[OK] fetched {ds} -> {raw_path}")
-        raw_paths[ds] = raw_path
-    return raw_paths
+    # CHG: 雜湊取自 raw catalog（寫檔時已算好），不再每次整檔重讀
+    digest = get_catalog(os.path.dirname(raw_path)).digest(raw_path)
+    if not force and last_digest == digest:
+        print(f"[SKIP] {ds} payload unchanged, not re-normalized")
+        return None
 
-def run_normalize(datasets, cfg):
+    with telemetry.stage("normalize", ds) as st:
+        raw_obj = load_raw(raw_path)
+        st["rows_in"] = telemetry.count_rows(raw_obj)
+
+        # CHG: normalizer 由登錄表決定
+        df = spec.normalizer()(raw_obj)
+        st["rows_out"] = len(df)
+
+    store_one(ds, df, cfg, db)
+    return digest
+
+def store_one(ds, df, cfg, db):
+    """存一個資料集 normalize 後的 DataFrame（SQLite / CSV / Parquet）並輸出 watchlist。"""
+    from store import save, save_csv
+    from schema import to_storage
     out_root = cfg.get("output_dir","data")
     storage = cfg.get("storage","csv")
-    for ds in datasets:
-        # CHG: insti/taiex/otc 的 raw 檔名都帶日期，要從 raw 資料夾找「最新一個」
-        if ds in ["insti","taiex","otc"]:   # CHG
-            raw_dir = os.path.join(out_root, "raw")
-            prefix = {"insti":"insti_", "taiex":"taiex_", "otc":"otc_"}[ds]
-            candidates = sorted([p for p in os.listdir(raw_dir) if p.startswith(prefix)], reverse=True)
-            if not candidates:
-                print(f"[WARN] no raw {ds} file found, skip")
-                continue
-            raw_path = os.path.join(raw_dir, candidates[0])
-        else:
-            raw_path = os.path.join(out_root, "raw", f"{ds}.json")
-
-        if not os.path.exists(raw_path):
-            print(f"[WARN] raw not found: {raw_path}, skip")
-            continue
-
-        with open(raw_path, "r", encoding="utf-8") as f:
-            raw_obj = json.load(f)
-
-        # NEW: 指數的 normalize
-        if ds == "taiex":
-            df = normalize_taiex(raw_obj)
-        elif ds == "otc":
-            df = normalize_otc(raw_obj)
-        elif ds == "daily":
-            df = normalize_daily(raw_obj)
-        elif ds == "basics":
-            df = normalize_basics(raw_obj)
-        elif ds == "news":
-            df = normalize_news(raw_obj)
-        elif ds == "insti":
-            df = normalize_insti(raw_obj)
-        else:
-            df = normalize_generic(raw_obj)
+    with telemetry.stage("store", ds) as st:
+        st["rows_in"] = st["rows_out"] = len(df)
+        out = save(df, storage, out_root, ds, db=db)
+    if out:
+        print(f"[OK] normalized {ds} -> {out}")
+    else:
+        print(f"[OK] normalized {ds} -> saved to SQLite")
 
-        out = save(df, storage, out_root, ds)
-        if out:
-            print(f"[OK] normalized {ds} -> {out}")
-        else:
-            print(f"[OK] normalized {ds} -> saved to SQLite")
+    # NEW: daily × insti 實體化 join（哪邊先到都行），只重算這次寫入的日期
+    import daily_insti
+    if ds in daily_insti.SOURCES and "date" in df.columns:
+        with telemetry.stage("daily_insti", ds) as st:
+            dates = to_storage(df[["date"]])["date"].dropna().unique()
+            st["rows_in"] = len(dates)
+            st["rows_out"] = daily_insti.refresh(db, dates)
+
+    # NEW: 技術指標（daily 均線 / 波動、insti 累計買賣超），只推進新的一天
+    if cfg.get("indicators", True):
+        import indicators
+        if ds in indicators.SOURCES:
+            with telemetry.stage("indicators", ds) as st:
+                st["rows_in"] = len(df)
+                st["rows_out"] = indicators.update(db, ds, df)
 
-        # watchlist 過濾（僅對含 code 欄位的表）
-        wl = set([str(x) for x in cfg.get("watchlist", [])])
-        if len(wl) > 0 and "code" in df.columns:
-            wdf = df[df["code"].astype(str).isin(wl)].copy()
+    # watchlist 過濾（僅對含 code 欄位的表）
+    wl = set([str(x) for x in cfg.get("watchlist", [])])
+    if len(wl) > 0 and "code" in df.columns:
+        with telemetry.stage("watchlist", ds) as st:
+            st["rows_in"] = len(df)
+            wdf = to_storage(df[df["code"].astype(str).isin(wl)])
             wpath = os.path.join(out_root, "watchlist", f"{ds}.csv")
             save_csv(wdf, wpath)
-            print(f"[OK] watchlist filtered {ds} -> {wpath}")
+            st["rows_out"] = len(wdf)
+        print(f"[OK] watchlist filtered {ds} -> {wpath}")
+
+def run_backfill_cmd(names, cfg, start, end, refetch=False):
+    from trading_calendar import get_calendar
+    from backfill import run_backfill
+    out_root = cfg.get("output_dir","data")
+    get_calendar(out_root, holidays=cfg.get("holidays"))
+    client = make_client(cfg)
+    try:
+        return run_backfill(names, start, end, client, out_root,
+                            storage=cfg.get("storage","csv"),
+                            workers=int(cfg.get("backfill_workers", 4) or 1),
+                            budget=int(cfg.get("backfill_budget", 2000) or 0),
+                            host_limits=cfg.get("host_limits"), refetch=refetch,
+                            indicators=cfg.get("indicators", True))
+    finally:
+        for line in client.limiter.report():
+            print(line)
+
+def run_fetch_and_normalize(names, cfg, args):
+    if args.fetch_only:
+        run_fetch(names, cfg)
+    elif args.pipeline or cfg.get("pipeline", False):
+        run_pipelined(names, cfg, force=args.force)
+    else:
+        run_fetch(names, cfg)
+        run_normalize(names, cfg, force=args.force)
+
+def run_raw_catalog(args, cfg):
+    from catalog import get_catalog
+    from utils import norm_ymd
+    out_root = cfg.get("output_dir","data")
+    cat = get_catalog(os.path.join(out_root, "raw"))
+    if args.rebuild:
+        print(f"[OK] raw catalog rebuilt: {cat.rebuild()} file(s)")
+    if args.missing:
+        from trading_calendar import get_calendar
+        if not (args.start and args.end):
+            print("--missing needs --from and --to")
+            sys.exit(1)
+        cal = get_calendar(out_root, cfg.get("holidays"))
+        expected = cal.trading_days_between(norm_ymd(args.start), norm_ymd(args.end))
+        for ds in args.datasets or DATASETS:
+            gaps = cat.missing(datasets.get(ds).raw, expected)
+            print(f"{ds:8s} missing {len(gaps)}/{len(expected)}" + (f": {' '.join(gaps)}" if gaps else ""))
+        return
+    want = set(datasets.get(d).raw for d in args.datasets) if args.datasets else None
+    for ds, n, first, last, size, cached in cat.summary():
+        if want is None or ds in want:
+            print(f"{ds:8s} files={n:<6d} {first or '-'}..{last or '-'}  {(size or 0) / 1e6:8.1f} MB  cached={cached or 0}")
+
+def run_query(args, cfg):
+    import time
+    import query
+    from store import db_path
+    cols = [c for c in (args.cols or "").split(",") if c] or None
+    t0 = time.perf_counter()
+    conn = query.connect(db_path(cfg.get("output_dir","data")))
+    try:
+        if args.kind == "series":
+            if not args.arg:
+                print("query series needs a stock code")
+                sys.exit(1)
+            df = query.series(conn, args.arg, cols, args.start, args.end, last=args.last, table=args.table)
+        elif args.kind == "date":
+            codes = [c for c in (args.codes or "").split(",") if c] or None
+            df = query.cross_section(conn, args.date, cols, codes=codes, table=args.table)
+        else:
+            if not args.arg:
+                print("query top needs a column to rank by")
+                sys.exit(1)
+            df = query.top(conn, args.arg, args.date, n=args.n, ascending=args.asc, columns=cols, table=args.table)
+    except ValueError as e:
+        print(f"[ERR] {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    ms = (time.perf_counter() - t0) * 1000
+    if args.csv:
+        from schema import to_storage
+        to_storage(df.assign(date=df["date"].dt.strftime("%Y-%m-%d"))).to_csv(args.csv, index=False, encoding="utf-8-sig")
+        print(f"[OK] {len(df)} rows -> {args.csv} ({ms:.1f} ms)")
+    else:
+        import pandas as pd
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(df.to_string(index=False))
+        print(f"[OK] {len(df)} rows ({ms:.1f} ms)")
+
+def run_command(args, cfg):
+    if args.cmd == "fetch":
+        ds = [d for d in args.datasets if d in DATASETS]
+        if not ds:
+            print("No valid dataset specified.")
+            sys.exit(1)
+        run_fetch_and_normalize(ds, cfg, args)
+    elif args.cmd == "fetch-all":
+        run_fetch_and_normalize(DATASETS, cfg, args)
+    elif args.cmd == "backfill":
+        ds = [d for d in args.datasets if d in datasets.backfillable()]
+        if not ds:
+            print("No backfillable dataset specified (insti / taiex / otc).")
+            sys.exit(1)
+        run_backfill_cmd(ds, cfg, args.start, args.end, refetch=args.refetch)
+    elif args.cmd == "renormalize":
+        # NEW: 用目前的 normalize 重跑 raw 封存（多行程），不必重抓
+        from renormalize import run_renormalize, DEFAULT_BATCH_ROWS
+        ds = [d for d in (args.datasets or DATASETS) if d in DATASETS]
+        if not ds:
+            print("No valid dataset specified.")
+            sys.exit(1)
+        run_renormalize(ds, cfg.get("output_dir","data"), args.start, args.end,
+                        workers=args.workers or cfg.get("renormalize_workers"),
+                        batch_rows=args.batch_rows or int(cfg.get("renormalize_batch_rows", DEFAULT_BATCH_ROWS)),
+                        indicators=cfg.get("indicators", True))
+    elif args.cmd == "raw-catalog":
+        # NEW: raw 檔目錄索引（catalog.db）：摘要 / 缺哪些交易日 / 重掃
+        run_raw_catalog(args, cfg)
+    elif args.cmd == "query":
+        # NEW: 個股時間序列 / 某日橫斷面 / 某日排行（query.py，走 (code, date) / (date, code) 索引）
+        run_query(args, cfg)
+    elif args.cmd == "migrate-db":
+        from store import db_path
+        from store_sqlite import migrate
+        path = db_path(cfg.get("output_dir","data"))
+        removed = migrate(path)
+        for table, n in removed.items():
+            print(f"[OK] {table}: removed {n} duplicate rows")
+        print(f"[OK] migrated {path}")
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true",
+                        help="每個階段跑 cProfile + tracemalloc，輸出到 data/profile/<run-id>/")
     sub = parser.add_subparsers(dest="cmd")
 
     p_fetch = sub.add_parser("fetch", help="抓取資料集")
@@ -103,24 +336,87 @@ def main():
         "datasets",
         nargs="*",
         default=["daily"],
-        help="可多選: daily monthly yearly basics news holders insti taiex otc"  # CHG
+        help="可多選: " + " ".join(DATASETS)  # CHG
     )
 
-    sub.add_parser("fetch-all", help="一鍵抓取全部資料集")
+    p_fetch.add_argument("--force", action="store_true", help="raw 內容沒變也重新 normalize")
+    p_fetch.add_argument("--fetch-only", action="store_true", help="只抓 raw，不 normalize（不載入 pandas）")
+    p_fetch.add_argument("--pipeline", action="store_true", help="串流模式：抓到就 normalize / 寫入，raw 背景落地")
+
+    p_all = sub.add_parser("fetch-all", help="一鍵抓取全部資料集")
+    p_all.add_argument("--force", action="store_true", help="raw 內容沒變也重新 normalize")
+    p_all.add_argument("--fetch-only", action="store_true", help="只抓 raw，不 normalize（不載入 pandas）")
+    p_all.add_argument("--pipeline", action="store_true", help="串流模式：抓到就 normalize / 寫入，raw 背景落地")
+
+    p_bf = sub.add_parser("backfill", help="回補歷史資料（只補資料庫缺的日期，可中斷續跑）")
+    p_bf.add_argument("datasets", nargs="+", help="可多選: " + " ".join(datasets.backfillable()))
+    p_bf.add_argument("--from", dest="start", required=True, help="起日 YYYYMMDD / YYYY-MM-DD")
+    p_bf.add_argument("--to", dest="end", required=True, help="迄日 YYYYMMDD / YYYY-MM-DD")
+    p_bf.add_argument("--refetch", action="store_true", help="忽略已存資料與 checkpoint，整段重抓")
+
+    p_stats = sub.add_parser("stats", help="彙總 data/logs 的請求與階段紀錄（p50 / p95）")
+    p_stats.add_argument("--runs", type=int, default=None, help="只看最近 N 次執行")
+
+    p_cmp = sub.add_parser("profile-compare", help="比較兩次 --profile 的結果（run-id 或目錄）")
+    p_cmp.add_argument("run_a")
+    p_cmp.add_argument("run_b")
+    p_cmp.add_argument("--top", type=int, default=10, help="每個階段列出變化最大的函式數")
+
+    p_rn = sub.add_parser("renormalize", help="用目前的 normalize 重跑 raw 封存並寫回資料庫（多行程）")
+    p_rn.add_argument("datasets", nargs="*", help="預設全部: " + " ".join(DATASETS))
+    p_rn.add_argument("--from", dest="start", default=None, help="起日 YYYYMMDD / YYYY-MM-DD（依 raw 檔名日期）")
+    p_rn.add_argument("--to", dest="end", default=None, help="迄日 YYYYMMDD / YYYY-MM-DD")
+    p_rn.add_argument("--workers", type=int, default=None, help="行程數（預設 CPU 核心數）")
+    p_rn.add_argument("--batch-rows", type=int, default=None, help="每批 upsert 的列數")
+
+    p_cat = sub.add_parser("raw-catalog", help="raw 檔索引：各資料集檔案數 / 日期範圍；--missing 列出缺 raw 的交易日")
+    p_cat.add_argument("datasets", nargs="*", help="預設全部: " + " ".join(DATASETS))
+    p_cat.add_argument("--missing", action="store_true", help="列出 [--from, --to] 內沒有 raw 的交易日")
+    p_cat.add_argument("--from", dest="start", default=None, help="起日 YYYYMMDD / YYYY-MM-DD")
+    p_cat.add_argument("--to", dest="end", default=None, help="迄日 YYYYMMDD / YYYY-MM-DD")
+    p_cat.add_argument("--rebuild", action="store_true", help="重新掃描 data/raw 同步索引")
+
+    p_q = sub.add_parser("query", help="查 twse.db：series <代號> / date [--date] / top <欄位> [--date]")
+    p_q.add_argument("kind", choices=["series", "date", "top"])
+    p_q.add_argument("arg", nargs="?", help="series：股票代號；top：排序欄位")
+    p_q.add_argument("--cols", default=None, help="只取這些欄位（逗號分隔，例如 close,net_foreign）")
+    p_q.add_argument("--table", default=None, help="daily / insti / daily_insti / indicators（預設自動挑有這些欄位的表）")
+    p_q.add_argument("--from", dest="start", default=None, help="series 起日 YYYYMMDD / YYYY-MM-DD")
+    p_q.add_argument("--to", dest="end", default=None, help="series 迄日")
+    p_q.add_argument("--last", type=int, default=None, help="series 只取最後 N 天")
+    p_q.add_argument("--date", default=None, help="date / top 的日期（預設該表最新一天）")
+    p_q.add_argument("--codes", default=None, help="date 只取這些代號（逗號分隔）")
+    p_q.add_argument("-n", type=int, default=20, help="top 取前 N 檔")
+    p_q.add_argument("--asc", action="store_true", help="top 由小到大（例如外資賣超）")
+    p_q.add_argument("--csv", default=None, help="輸出成 CSV 而不是印出")
+
+    sub.add_parser("migrate-db", help="一次性整理舊 twse.db：依鍵去重並建立唯一索引")
 
     args = parser.parse_args()
     cfg = load_config()
-
-    if args.cmd == "fetch":
-        ds = [d for d in args.datasets if d in DATASETS]
-        if not ds:
-            print("No valid dataset specified.")
-            sys.exit(1)
-        run_fetch(ds, cfg)
-        run_normalize(ds, cfg)
-    elif args.cmd == "fetch-all":
-        run_fetch(DATASETS, cfg)
-        run_normalize(DATASETS, cfg)
+    logging.basicConfig(level=str(cfg.get("log_level", "WARNING")).upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    log_dir = os.path.join(cfg.get("output_dir","data"), "logs")
+    if args.cmd == "stats":
+        for line in telemetry.summarize(log_dir, last_runs=args.runs):
+            print(line)
+        return
+    if args.cmd == "profile-compare":
+        for line in profiling.compare(args.run_a, args.run_b, cfg.get("output_dir","data"), args.top):
+            print(line)
+        return
+    if args.cmd:
+        import raw_archive
+        raw_archive.configure(cfg.get("raw_compression"))
+        run = telemetry.configure(log_dir if cfg.get("telemetry", True) else None,
+                                  memory=cfg.get("telemetry_memory", False) or args.profile)
+        if args.profile:
+            profiling.enable(cfg.get("output_dir","data"), run)
+        try:
+            with telemetry.stage("run", args.cmd):
+                run_command(args, cfg)
+        finally:
+            profiling.finish()
     else:
         parser.print_help()
 
@@ -1,20 +1,7 @@
 from typing import List, Dict, Any
 import pandas as pd
-import os, re, datetime as dt
-
-def _to_num(x):
-    if pd.isna(x):
-        return None
-    if isinstance(x, (int, float)):
-        return x
-    s = str(x).replace(",", "").strip()
-    s = re.sub(r"[^\d\.\-]", "", s)
-    try:
-        if "." in s:
-            return float(s)
-        return int(s)
-    except:
-        return None
+from parsing import to_num, to_float, to_int, roc_to_iso
+from schema import compact
 
 def normalize_daily(raw_json) -> pd.DataFrame:
     # STOCK_DAY_ALL 範例欄位名稱可能為中文；容錯處理
@@ -37,19 +24,12 @@ def normalize_daily(raw_json) -> pd.DataFrame:
     # 基本型態清洗
     for c in ["open","high","low","close","volume","turnover"]:
         if c in df.columns:
-            df[c] = df[c].map(_to_num)
+            df[c] = to_num(df[c])
     # 日期轉換（民國/西元兼容）
     if "date" in df.columns:
-        def fix_date(x):
-            s = str(x).replace("/", "-")
-            # 民國年轉西元
-            m = re.match(r"^(\d{2,3})-(\d{1,2})-(\d{1,2})$", s)
-            if m and int(m.group(1)) < 1911:
-                y = int(m.group(1)) + 1911
-                return f"{y:04d}-{int(m.group(2)):02d}-{int(m.group(3)):02d}"
-            return s
-        df["date"] = df["date"].map(fix_date)
-    return df[["code","name","date","open","high","low","close","volume","turnover"]].dropna(how="all")
+        df["date"] = roc_to_iso(df["date"])
+    # 精簡型別（category / 日序 / float32）；寫出前由 store 換回
+    return compact(df[["code","name","date","open","high","low","close","volume","turnover"]].dropna(how="all"), "daily")
 
 def normalize_basics(raw_json) -> pd.DataFrame:
     df = pd.DataFrame(raw_json)
@@ -63,7 +43,7 @@ def normalize_basics(raw_json) -> pd.DataFrame:
     for k,v in col_map.items():
         if k in df.columns:
             df.rename(columns={k:v}, inplace=True)
-    return df
+    return compact(df, "basics")
 
 def normalize_news(raw_json) -> pd.DataFrame:
     df = pd.DataFrame(raw_json)
@@ -76,7 +56,7 @@ def normalize_news(raw_json) -> pd.DataFrame:
     for k,v in col_map.items():
         if k in df.columns:
             df.rename(columns={k:v}, inplace=True)
-    return df
+    return compact(df, "news")
 
 def normalize_generic(raw_json) -> pd.DataFrame:
     return pd.DataFrame(raw_json)
@@ -88,7 +68,7 @@ def normalize_insti(raw_json) -> pd.DataFrame:
     fields = raw_json.get("fields") or []
     rows = raw_json.get("data") or []
     if not fields or not rows:
-        return pd.DataFrame(columns=["code","name","date","net_foreign","net_invest","net_dealer","net_total"])
+        return compact(pd.DataFrame(columns=["code","name","date","net_foreign","net_invest","net_dealer","net_total"]), "insti")
 
     df = pd.DataFrame(rows, columns=fields)
 
@@ -105,20 +85,12 @@ def normalize_insti(raw_json) -> pd.DataFrame:
             rename_map[col] = "net_invest"
     df.rename(columns=rename_map, inplace=True)
 
-    def _to_int(x):
-        try:
-            s = str(x).replace(",", "").strip()
-            if s in ("", "—"): return 0
-            return int(float(s))
-        except Exception:
-            return 0
-
     # 自營商欄位可能分拆（自行/避險/合計），統一相加
     dealer_cols = [c for c in df.columns if c.startswith("自營商買賣超股數")]
-    df["net_dealer"] = df[dealer_cols].applymap(_to_int).sum(axis=1) if dealer_cols else 0
+    df["net_dealer"] = df[dealer_cols].apply(to_int).sum(axis=1) if dealer_cols else 0
 
-    df["net_foreign"] = df["net_foreign"].map(_to_int) if "net_foreign" in df else 0
-    df["net_invest"]  = df["net_invest"].map(_to_int)  if "net_invest"  in df else 0
+    df["net_foreign"] = to_int(df["net_foreign"]) if "net_foreign" in df else 0
+    df["net_invest"]  = to_int(df["net_invest"])  if "net_invest"  in df else 0
     df["net_total"]   = df["net_foreign"] + df["net_invest"] + df["net_dealer"]
 
     raw_date = (raw_json.get("date") or "").replace("/", "-")[:10]  # YYYY-MM-DD
@@ -127,13 +99,13 @@ def normalize_insti(raw_json) -> pd.DataFrame:
     out_cols = ["code","name","date","net_foreign","net_invest","net_dealer","net_total"]
     for c in out_cols:
         if c not in df.columns: df[c] = None
-    return df[out_cols]
+    return compact(df[out_cols], "insti")
 def normalize_taiex(raw_json) -> pd.DataFrame:
     """
     解析 TWSE MI_INDEX 指數表格，輸出：
       market, date, open, high, low, close, volume, turnover, is_cached, source_date
     """
-    import pandas as pd, re
+    import pandas as pd
 
     is_cached = 1 if (isinstance(raw_json, dict) and raw_json.get("_cached")) else 0
     source_date = (raw_json.get("_cached_from") if isinstance(raw_json, dict) else None)
@@ -158,13 +130,6 @@ def normalize_taiex(raw_json) -> pd.DataFrame:
     rows = target.get("data") or []
     df = pd.DataFrame(rows, columns=cols)
 
-    def _num(x):
-        s = str(x).replace(",", "").strip()
-        try:
-            return float(re.sub(r"[^\d\.\-]", "", s)) if s else None
-        except:
-            return None
-
     cmap = {}
     for c in df.columns:
         if "開盤" in c: cmap[c] = "open"
@@ -176,7 +141,7 @@ def normalize_taiex(raw_json) -> pd.DataFrame:
     df = df.rename(columns=cmap)
 
     for c in ["open","high","low","close","volume","turnover"]:
-        if c in df: df[c] = df[c].map(_num)
+        if c in df: df[c] = to_float(df[c])
 
     date_str = (raw_json.get("reportDate") or raw_json.get("date") or "") if isinstance(raw_json, dict) else ""
     date_str = date_str.replace("/", "-")[:10] if date_str else None
@@ -187,23 +152,16 @@ def normalize_taiex(raw_json) -> pd.DataFrame:
     df["source_date"] = source_date
 
     out_cols = ["market","date","open","high","low","close","volume","turnover","is_cached","source_date"]
-    return df[out_cols]
+    return compact(df[out_cols], "taiex")
 
 
 def normalize_otc(raw_obj) -> pd.DataFrame:
     """
     解析 TPEX 主板指數，輸出：
-      date, open, high, low, close, volume, turnover, is_cached, source_date
+      market, date, open, high, low, close, volume, turnover, is_cached, source_date
     支援 raw 為 list 或 dict（含 _cached 標記）。
     """
-    import pandas as pd, re
-
-    def _num(x):
-        s = str(x).replace(",", "").strip()
-        try:
-            return float(re.sub(r"[^\d\.\-]", "", s)) if s else None
-        except:
-            return None
+    import pandas as pd
 
     is_cached = 1 if (isinstance(raw_obj, dict) and raw_obj.get("_cached")) else 0
     source_date = (raw_obj.get("_cached_from") if isinstance(raw_obj, dict) else None)
@@ -222,7 +180,7 @@ def normalize_otc(raw_obj) -> pd.DataFrame:
         df = pd.DataFrame()
 
     if df.empty:
-        cols = ["date","open","high","low","close","volume","turnover","is_cached","source_date"]
+        cols = ["market","date","open","high","low","close","volume","turnover","is_cached","source_date"]
         return pd.DataFrame(columns=cols)
 
     # 2) 找日期欄位並統一欄名
@@ -250,13 +208,14 @@ def normalize_otc(raw_obj) -> pd.DataFrame:
 
     for c in ["open","high","low","close","volume","turnover"]:
         if c in df.columns:
-            df[c] = df[c].map(_num)
+            df[c] = to_float(df[c])
 
+    df["market"] = "OTC"
     df["is_cached"] = is_cached
     df["source_date"] = source_date
 
-    keep = [c for c in ["date","open","high","low","close","volume","turnover","is_cached","source_date"] if c in df.columns]
+    keep = [c for c in ["market","date","open","high","low","close","volume","turnover","is_cached","source_date"] if c in df.columns]
     df = df[keep].dropna(how="all")
-    return df
+    return compact(df, "otc")
 
 
@@ -0,0 +1,104 @@
+# parsing.py — normalize 共用的向量化解析：數字（去千分位逗號）與民國日期
+# 整欄用 .str 字串方法 + astype / pd.to_numeric(errors="coerce") 一次處理，不逐格呼叫 Python 函式。
+# 逐格版本（num_cell / float_cell / int_cell / roc_date_cell）保留作對照基準（bench/bench_parsing.py）。
+import re
+import numpy as np
+import pandas as pd
+
+_NON_NUM = r"[^\d\.\-]"
+_ROC_RE = r"^(\d{2,3})-(\d{1,2})-(\d{1,2})$"
+
+# ---- 逐格版本（語意基準；也用於退回路徑） ----
+def num_cell(x):
+    """'1,234' → 1234、'12.5' → 12.5、無法解析 → None（原 normalize._to_num）。"""
+    if pd.isna(x):
+        return None
+    if isinstance(x, (int, float)):
+        return x
+    s = str(x).replace(",", "").strip()
+    s = re.sub(_NON_NUM, "", s)
+    try:
+        if "." in s:
+            return float(s)
+        return int(s)
+    except:
+        return None
+
+def float_cell(x):
+    """一律轉 float；空字串或無法解析 → None（原指數 normalize 的 _num）。"""
+    s = str(x).replace(",", "").strip()
+    try:
+        return float(re.sub(_NON_NUM, "", s)) if s else None
+    except:
+        return None
+
+def int_cell(x):
+    """T86 股數：空白/「—」/無法解析 → 0（原 normalize_insti._to_int）。"""
+    try:
+        s = str(x).replace(",", "").strip()
+        if s in ("", "—"): return 0
+        return int(float(s))
+    except Exception:
+        return 0
+
+def roc_date_cell(x):
+    """民國 YYY/MM/DD → 西元 YYYY-MM-DD；其餘只把 / 換成 -（原 normalize_daily.fix_date）。"""
+    s = str(x).replace("/", "-")
+    m = re.match(_ROC_RE, s)
+    if m and int(m.group(1)) < 1911:
+        y = int(m.group(1)) + 1911
+        return f"{y:04d}-{int(m.group(2)):02d}-{int(m.group(3)):02d}"
+    return s
+
+# ---- 向量化版本（輸出與上面逐格版本逐值相同） ----
+# 只含數字 / 小數點 / 負號的格子不必跑正則；用 translate 把這些字元刪掉，剩下東西的才是雜字元格
+_NUM_CHARS = str.maketrans("", "", "0123456789.-")
+
+def _as_int(t: pd.Series):
+    """整欄都是整數字串時直接轉 int64（int() 接受前後空白、正號，和逐格版一致）；否則回 None。"""
+    try:
+        return t.astype("int64")
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+def to_num(s: pd.Series) -> pd.Series:
+    """'1,234' → 1234、'12.5' → 12.5、'--' / 無法解析 → NaN；全是整數時為 int64，否則 float64。"""
+    if s.dtype.kind in "biuf":
+        return s
+    t = s.astype(str).str.replace(",", "", regex=False)
+    v = _as_int(t)
+    if v is not None:
+        return v
+    # 含其他字元的格子（'--'、'X'、'12a'、'1e5'…）才照 num_cell 去掉 [^\d.\-] 再解析
+    odd = t.str.translate(_NUM_CHARS).str.len() > 0
+    if odd.any():
+        t = t.mask(odd, t[odd].str.replace(_NON_NUM, "", regex=True))
+    return pd.to_numeric(t, errors="coerce")
+
+def to_float(s: pd.Series) -> pd.Series:
+    """一律 float64；空字串 / 無法解析 → NaN（指數表用）。"""
+    return to_num(s).astype("float64")
+
+def to_int(s: pd.Series) -> pd.Series:
+    """T86 股數：int64；空白 / 「—」/ 無法解析 → 0，小數無條件捨去（同 int_cell：只去逗號，不剝雜字元）。"""
+    t = s.astype(str).str.replace(",", "", regex=False)
+    v = _as_int(t)
+    if v is not None:
+        return v
+    v = pd.to_numeric(t, errors="coerce")
+    return v.where(np.isfinite(v), 0).astype("int64")
+
+def roc_to_iso(s: pd.Series) -> pd.Series:
+    """
+    民國 YYY/MM/DD → 西元 YYYY-MM-DD；其餘只把 / 換成 -。
+    一張表的日期只有少數幾種（日成交整欄同一天），只對不重複值轉一次再對回。
+    """
+    t = s.astype(str)
+    u = pd.Series(t.unique())
+    iso = u.str.replace("/", "-", regex=False)
+    m = iso.str.extract(_ROC_RE)
+    hit = m[0].notna()
+    if hit.any():
+        y = (m.loc[hit, 0].astype("int64") + 1911).astype(str)
+        iso[hit] = y + "-" + m.loc[hit, 1].str.zfill(2) + "-" + m.loc[hit, 2].str.zfill(2)
+    return t.map(dict(zip(u, iso))).astype(object)
@@ -0,0 +1,111 @@
+# pipeline.py — 串流模式：fetch → normalize → store 三段重疊進行
+#   fetch      ：多執行緒（每主機並行上限同 scheduler），抓到的 payload 直接留在記憶體
+#   normalize  ：另一組執行緒，收到 payload 就編碼 raw（交給背景寫檔）、算雜湊、normalize
+#   store      ：呼叫端執行緒（SQLite 單一寫入者），從有上限的佇列取結果依序寫入
+# 跟 run_fetch + run_normalize 的差別：不必等全部下載完才開始 normalize，也不再把 raw 寫檔後讀回解析。
+# raw 檔仍照原本檔名寫出（背景 RawWriter），normalize 狀態的雜湊與原流程相同，兩種模式可交替使用。
+from concurrent.futures import ThreadPoolExecutor
+import os, hashlib, queue
+
+import datasets
+import telemetry
+from catalog import get_catalog
+from raw_archive import RawWriter, encode_raw, load_raw, cache_marker
+from scheduler import HostLimiter, DATASET_HOSTS, fetch_width
+
+DEFAULT_NORMALIZE_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 4          # normalize 完、等著寫入的資料集數上限（也是背景寫檔佇列長度）
+
+def run_pipeline(names, client, out_root: str, store, state: dict | None = None, force: bool = False,
+                 workers: int = 4, normalize_workers: int = DEFAULT_NORMALIZE_WORKERS,
+                 host_limits: dict | None = None, probe: int = 1,
+                 queue_size: int = DEFAULT_QUEUE_SIZE):
+    """
+    store(ds, df) 在呼叫端執行緒執行（可直接用同一條 SQLite 連線）。
+    state = {ds: 上次 normalize 的 raw 雜湊}；雜湊相同（且非 force）就不 normalize。
+    回傳 (done, errors)：done = {ds: 雜湊}（已寫入、raw 也已落地），errors = {ds: 例外}。
+    """
+    state = state or {}
+    limiter = HostLimiter(host_limits)
+    writer = RawWriter(maxsize=queue_size)
+    results = queue.Queue(maxsize=max(1, int(queue_size)))
+    raw_of = {}                     # ds -> raw 路徑（寫檔失敗時用來對回資料集）
+
+    def _fetch(ds):
+        captured = {}
+
+        def capture(obj, path):
+            # 取代 write_raw：payload 留在記憶體，路徑照舊
+            captured["obj"], captured["path"] = obj, path
+            return path
+
+        with limiter.hold(DATASET_HOSTS.get(ds, ds), fetch_width(ds, probe)) as width, \
+                telemetry.stage("fetch", ds) as st:
+            path = datasets.get(ds).fetcher()(client, out_root, ds, probe=width, write=capture)
+            obj = captured.get("obj") if captured.get("path") == path else None
+            st["rows_out"] = telemetry.count_rows(obj)
+        print(f"[OK] fetched {ds} -> {path}")
+        return path, obj
+
+    def _normalize(ds, path, obj):
+        try:
+            if obj is None:
+                # 抓取器沒寫新 raw（快照端點內容沒變）：沿用既有檔案
+                digest = get_catalog(os.path.dirname(path)).digest(path)
+            else:
+                blob = encode_raw(obj, path)
+                raw_of[ds] = path
+                writer.submit(blob, path, *cache_marker(obj))
+                digest = hashlib.sha256(blob).hexdigest()
+            if not force and state.get(ds) == digest:
+                results.put((ds, "skip", None))
+                return
+            with telemetry.stage("normalize", ds) as st:
+                if obj is None:
+                    obj = load_raw(path)
+                st["rows_in"] = telemetry.count_rows(obj)
+                df = datasets.get(ds).normalizer()(obj)
+                st["rows_out"] = len(df)
+            results.put((ds, "ok", (df, digest)))
+        except Exception as e:
+            results.put((ds, "error", e))
+
+    done, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, int(normalize_workers)), thread_name_prefix="normalize") as nx, \
+         ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="fetch") as fx:
+
+        def _fetched(ds, fut):
+            try:
+                path, obj = fut.result()
+            except Exception as e:
+                results.put((ds, "error", e))
+                return
+            nx.submit(_normalize, ds, path, obj)
+
+        for ds in names:
+            fx.submit(_fetch, ds).add_done_callback(lambda fut, ds=ds: _fetched(ds, fut))
+
+        for _ in range(len(names)):
+            ds, kind, val = results.get()
+            if kind == "skip":
+                print(f"[SKIP] {ds} payload unchanged, not re-normalized")
+            elif kind == "error":
+                print(f"[ERR] pipeline {ds} failed: {val!r}")
+                errors[ds] = val
+            else:
+                df, digest = val
+                try:
+                    store(ds, df)
+                    done[ds] = digest
+                except Exception as e:
+                    print(f"[ERR] pipeline {ds} store failed: {e!r}")
+                    errors[ds] = e
+
+    # raw 全部落地才算完成；寫檔失敗的資料集不記雜湊，下次會重做
+    for path, e in writer.close():
+        print(f"[ERR] raw write failed {path}: {e!r}")
+        for ds, p in raw_of.items():
+            if p == path:
+                done.pop(ds, None)
+                errors.setdefault(ds, e)
+    return done, errors
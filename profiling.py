@@ -0,0 +1,207 @@
+# profiling.py — --profile：每個階段各自跑 cProfile + tracemalloc，結果寫到 data/profile/<run-id>/
+#   <stage>[-<dataset>].prof        pstats 原檔（snakeviz / python -m pstats 可開）
+#   <stage>[-<dataset>].txt         依 cumulative 排序的前幾名函式
+#   <stage>[-<dataset>].alloc.json  該階段配置、結束時仍存活的前幾名位置（tracemalloc）
+#   summary.json                    各階段總耗時 / 呼叫次數 / 淨配置
+# 同一階段重複出現（例如回補逐日 normalize）會累加成一份；記憶體只取前 MEM_SAMPLES 次、且只在主執行緒量。
+# 比較兩次執行：python profiling.py compare <run-a> <run-b>（或直接給目錄）
+import os, io, sys, json, time, pstats, cProfile, threading, tracemalloc
+from contextlib import contextmanager
+
+TOP_FUNCS = 40          # .txt 列出的函式數
+TOP_ALLOCS = 25         # .alloc.json 列出的配置位置數
+MEM_SAMPLES = 2         # 每個階段只在前幾次出現時量記憶體
+
+_state = {"dir": None}
+_lock = threading.Lock()
+_stats = {}             # key -> pstats.Stats（累加）
+_allocs = {}            # key -> {where: [size, count]}
+_wall = {}              # key -> [秒數, 次數]
+_mem_n = {}             # key -> 已拍過幾次記憶體快照（只在主執行緒更新）
+_tls = threading.local()
+
+def enable(out_root: str, run_id: str) -> str:
+    """開啟 profiling；回傳輸出目錄。"""
+    path = os.path.join(out_root, "profile", run_id)
+    os.makedirs(path, exist_ok=True)
+    _state["dir"] = path
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return path
+
+def enabled() -> bool:
+    return bool(_state["dir"])
+
+def _key(name: str, dataset: str | None) -> str:
+    return f"{name}-{dataset}" if dataset else name
+
+@contextmanager
+def stage(name: str, dataset: str | None = None):
+    """
+    profile 一個階段。巢狀階段（run 包 fetch…）各自獨立：進入內層時先停外層，
+    所以外層的數字不含內層（exclusive）。執行緒各自一組 profiler。
+    記憶體只在主執行緒、每個階段前 MEM_SAMPLES 次量；同時間其他執行緒的配置也會算進來，
+    且會重設 telemetry 的峰值計數。
+    """
+    if not enabled():
+        yield
+        return
+    key = _key(name, dataset)
+    stack = getattr(_tls, "stack", None)
+    if stack is None:
+        stack = _tls.stack = []
+    if stack and stack[-1] is not None:
+        stack[-1].disable()
+    prof = cProfile.Profile()
+    # 記憶體：開始時清掉既有 traces，結束時的快照就只剩本階段配置且還活著的部分
+    # （比前後兩張全 heap 快照相減快得多）
+    mem = threading.current_thread() is threading.main_thread() and _mem_n.get(key, 0) < MEM_SAMPLES
+    if mem:
+        _mem_n[key] = _mem_n.get(key, 0) + 1
+        tracemalloc.clear_traces()
+    t0 = time.perf_counter()
+    try:
+        prof.enable()
+    except ValueError:
+        # Python 3.12+ 全程序只能有一個 profiler：並行階段時只記耗時與記憶體
+        prof = None
+    stack.append(prof)
+    try:
+        yield
+    finally:
+        if prof is not None:
+            prof.disable()
+        wall = time.perf_counter() - t0
+        allocs = _snapshot().statistics("lineno") if mem else None
+        stack.pop()
+        _collect(key, prof, wall, allocs)
+        if stack and stack[-1] is not None:
+            stack[-1].enable()
+
+def _snapshot():
+    # 排除 profiling 自己的配置（快照、pstats 彙整）
+    return tracemalloc.take_snapshot().filter_traces(
+        tuple(tracemalloc.Filter(False, f) for f in (tracemalloc.__file__, pstats.__file__, __file__)))
+
+def _collect(key, prof, wall, allocs):
+    st = pstats.Stats(prof) if prof is not None else None
+    with _lock:
+        if st is not None:
+            if key in _stats:
+                _stats[key].add(st)
+            else:
+                _stats[key] = st
+        w = _wall.setdefault(key, [0.0, 0])
+        w[0] += wall
+        w[1] += 1
+        acc = _allocs.setdefault(key, {})
+        for st_ in allocs or ():
+            fr = st_.traceback[0]
+            a = acc.setdefault(f"{fr.filename}:{fr.lineno}", [0, 0])
+            a[0] += st_.size
+            a[1] += st_.count
+
+def finish():
+    """把累積的結果寫檔（程式結束前呼叫一次）；回傳輸出目錄。"""
+    out = _state["dir"]
+    if not out:
+        return None
+    summary = {}
+    with _lock:
+        for key in _wall:
+            st = _stats.get(key)
+            if st is not None:
+                st.dump_stats(os.path.join(out, f"{key}.prof"))
+                buf = io.StringIO()
+                pstats.Stats(os.path.join(out, f"{key}.prof"), stream=buf) \
+                    .strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCS)
+                with open(os.path.join(out, f"{key}.txt"), "w", encoding="utf-8") as f:
+                    f.write(buf.getvalue())
+            top = sorted(_allocs.get(key, {}).items(), key=lambda kv: -kv[1][0])
+            with open(os.path.join(out, f"{key}.alloc.json"), "w", encoding="utf-8") as f:
+                json.dump([{"where": w, "size_kb": round(s / 1024, 1), "count": c}
+                           for w, (s, c) in top[:TOP_ALLOCS]], f, ensure_ascii=False, indent=1)
+            wall, n = _wall.get(key, [0.0, 0])
+            summary[key] = {"wall_s": round(wall, 4), "count": n,
+                            "cpu_s": round(st.total_tt, 4) if st else None,
+                            "calls": st.total_calls if st else None,
+                            "alloc_kb": round(sum(s for s, _ in _allocs.get(key, {}).values()) / 1024, 1)}
+    with open(os.path.join(out, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+    print(f"[OK] profile written -> {out}")
+    return out
+
+@contextmanager
+def script_stage(name: str, dataset: str | None = None, profile: bool = False,
+                 out_root: str = "data"):
+    """reports/* 腳本用：開紀錄、依 --profile 開 profiling，整支腳本當一個階段。"""
+    import telemetry
+    run = telemetry.configure(os.path.join(out_root, "logs"), memory=profile)
+    if profile:
+        enable(out_root, run)
+    try:
+        with telemetry.stage(name, dataset) as st:
+            yield st
+    finally:
+        finish()
+
+# ---- 比較 ----
+def _resolve(run: str, out_root: str) -> str:
+    return run if os.path.isdir(run) else os.path.join(out_root, "profile", run)
+
+def _funcs(path: str) -> dict:
+    """{'file:line(func)': tottime}"""
+    st = pstats.Stats(path)
+    return {f"{os.path.basename(fn)}:{ln}({name})": v[2] for (fn, ln, name), v in st.stats.items()}
+
+def compare(run_a: str, run_b: str, out_root: str = "data", top: int = 10) -> list:
+    """比較兩次執行：各階段耗時 / 配置的變化，再列每個階段 tottime 變化最大的函式。"""
+    a, b = _resolve(run_a, out_root), _resolve(run_b, out_root)
+    with open(os.path.join(a, "summary.json"), encoding="utf-8") as f:
+        sa = json.load(f)
+    with open(os.path.join(b, "summary.json"), encoding="utf-8") as f:
+        sb = json.load(f)
+
+    def pct(x, y):
+        return f"{(y - x) / x * 100:+.0f}%" if x else "n/a"
+
+    lines = [f"A = {a}", f"B = {b}", "",
+             f"{'stage':<28} {'A wall s':>9} {'B wall s':>9} {'Δ':>6} {'A alloc KB':>11} {'B alloc KB':>11}"]
+    keys = sorted(set(sa) | set(sb), key=lambda k: -max(sa.get(k, {}).get("wall_s", 0),
+                                                        sb.get(k, {}).get("wall_s", 0)))
+    for k in keys:
+        x, y = sa.get(k, {}), sb.get(k, {})
+        lines.append(f"{k[:28]:<28} {x.get('wall_s', '-'):>9} {y.get('wall_s', '-'):>9} "
+                     f"{pct(x.get('wall_s', 0), y.get('wall_s', 0)) if x and y else '':>6} "
+                     f"{x.get('alloc_kb', '-'):>11} {y.get('alloc_kb', '-'):>11}")
+    for k in keys:
+        pa, pb = os.path.join(a, f"{k}.prof"), os.path.join(b, f"{k}.prof")
+        if not (os.path.exists(pa) and os.path.exists(pb)):
+            continue
+        fa, fb = _funcs(pa), _funcs(pb)
+        delta = sorted(((fb.get(fn, 0) - fa.get(fn, 0), fn) for fn in set(fa) | set(fb)),
+                       key=lambda t: -abs(t[0]))[:top]
+        if not delta or abs(delta[0][0]) < 1e-4:
+            continue
+        lines += ["", f"[{k}] tottime change (B - A)"]
+        lines += [f"  {d * 1000:+9.1f} ms  {fn}" for d, fn in delta]
+    return lines
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="比較兩次 --profile 的結果")
+    sub = ap.add_subparsers(dest="cmd")
+    p = sub.add_parser("compare")
+    p.add_argument("run_a")
+    p.add_argument("run_b")
+    p.add_argument("--out-root", default="data")
+    p.add_argument("--top", type=int, default=10)
+    args = ap.parse_args(argv)
+    if args.cmd != "compare":
+        ap.print_help()
+        return
+    for line in compare(args.run_a, args.run_b, args.out_root, args.top):
+        print(line)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+# query.py — 查 data/twse.db 的個股資料（daily / insti / daily_insti / indicators，鍵皆為 (code, date)）
+#   series        ：單一股票的時間序列（走鍵的唯一索引 (code, date)）
+#   cross_section ：某一天全部（或指定幾檔）股票的橫斷面（走 (date, code) 索引）
+#   top           ：某一天依某欄位排名前 N 檔（同上，只排那一天的列）
+# 都只讀需要的欄位與列；回傳精簡型別（schema.compact：code category、量 Int64），date 為 datetime64；
+# 價格保留資料庫的 float64（查詢結果直接給人看，float32 會印出 609.26001）。
+#     conn = query.connect("data/twse.db")
+#     query.series(conn, "2330", ["close", "net_foreign"], last=250)     # 自動挑 daily_insti
+#     query.top(conn, "net_foreign", n=20)                               # 最新一天外資買超前 20
+import os, sqlite3
+
+import pandas as pd
+
+from schema import compact, PRICE_COLS
+from store_sqlite import table_exists
+from utils import norm_ymd
+
+# 沒指定表時依序挑第一張「欄位都有」的表
+TABLES = ("daily_insti", "daily", "insti", "indicators")
+KEY_COLS = ("code", "date")
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """唯讀連線（不會建出空的資料庫檔，也不會擋到寫入中的 normalize）。"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(db_path)
+    return sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, check_same_thread=False)
+
+def _iso(x):
+    if not x:
+        return None
+    ymd = norm_ymd(x)
+    if not ymd:
+        raise ValueError(f"bad date: {x!r}")
+    return f"{ymd[:4]}-{ymd[4:6]}-{ymd[6:]}"
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _columns(conn, table: str) -> list:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({_q(table)})")]
+
+def _resolve(conn, table, columns) -> tuple:
+    """(表名, 要讀的欄位)；columns=None 讀全部欄位。欄位不存在丟 ValueError。"""
+    want = [c for c in (columns or []) if c not in KEY_COLS]
+    if table is None:
+        for t in TABLES:
+            if table_exists(conn, t) and set(want) <= set(_columns(conn, t)):
+                table = t
+                break
+        else:
+            raise ValueError(f"no table has all of {want}")
+    elif not table_exists(conn, table):
+        raise ValueError(f"no such table: {table}")
+    have = _columns(conn, table)
+    missing = [c for c in want if c not in have]
+    if missing:
+        raise ValueError(f"{table} has no column(s) {missing}")
+    return table, list(KEY_COLS) + (want or [c for c in have if c not in KEY_COLS])
+
+def _typed(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    df = df.reset_index(drop=True)
+    if df.empty:
+        return df.astype({"date": "datetime64[ns]"})
+    # 資料庫內日期一律 ISO（store_sqlite.iso_dates），直接照格式解析
+    date = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    out = compact(df.drop(columns="date"), table)
+    for c in out.columns.intersection(list(PRICE_COLS)):
+        out[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    out.insert(list(df.columns).index("date"), "date", date)
+    return out
+
+def _read(conn, table, cols, where: str, params, tail: str = "") -> pd.DataFrame:
+    sql = f"SELECT {', '.join(_q(c) for c in cols)} FROM {_q(table)} WHERE {where} {tail}"
+    return pd.read_sql_query(sql, conn, params=list(params))
+
+def latest_date(conn, table: str = "daily"):
+    """表內最新日期（ISO）；走 (date, code) 索引，一次查找。"""
+    if not table_exists(conn, table):
+        return None
+    return conn.execute(f"SELECT MAX(date) FROM {_q(table)}").fetchone()[0]
+
+def series(conn, code: str, columns=None, start=None, end=None, last: int | None = None,
+           table: str | None = None) -> pd.DataFrame:
+    """
+    單一股票在 [start, end] 的時間序列，依日期排序；last=N 只取區間內最後 N 天。
+    日期可用任何 norm_ymd 認得的寫法。
+    """
+    table, cols = _resolve(conn, table, columns)
+    where = "code = ? AND date >= ? AND date <= ?"
+    params = [str(code), _iso(start) or "", _iso(end) or "9999-99-99"]
+    if last:
+        df = _read(conn, table, cols, where, params + [int(last)], "ORDER BY date DESC LIMIT ?")
+        df = df.iloc[::-1]
+    else:
+        df = _read(conn, table, cols, where, params, "ORDER BY date")
+    return _typed(df, table)
+
+def cross_section(conn, date=None, columns=None, codes=None, table: str | None = None) -> pd.DataFrame:
+    """某一天（預設該表最新一天）全部股票、或 codes 指定的幾檔，依代號排序。"""
+    table, cols = _resolve(conn, table, columns)
+    day = _iso(date) or latest_date(conn, table)
+    if codes:
+        codes = [str(c) for c in codes]
+        df = _read(conn, table, cols, f"date = ? AND code IN ({','.join('?' * len(codes))})",
+                   [day] + codes, "ORDER BY code")
+    else:
+        df = _read(conn, table, cols, "date = ?", [day], "ORDER BY code")
+    return _typed(df, table)
+
+def top(conn, column: str, date=None, n: int = 20, ascending: bool = False, columns=None,
+        table: str | None = None) -> pd.DataFrame:
+    """某一天（預設最新一天）依 column 排名前 n 檔（預設由大到小，空值不列入）。"""
+    table, cols = _resolve(conn, table, [column] + [c for c in (columns or []) if c != column])
+    day = _iso(date) or latest_date(conn, table)
+    order = "ASC" if ascending else "DESC"
+    df = _read(conn, table, cols, f"date = ? AND {_q(column)} IS NOT NULL", [day, int(n)],
+               f"ORDER BY {_q(column)} {order}, code LIMIT ?")
+    return _typed(df, table)
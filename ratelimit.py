@@ -0,0 +1,291 @@
+# ratelimit.py — HttpClient 的節流與重試策略：每主機 token bucket + 指數退避 + 斷路器
+import time, random, logging, threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+log = logging.getLogger("ratelimit")
+
+# 這些狀態碼值得重試；其餘 4xx（400/401/403/404/410…）重試也不會成功，直接失敗
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+BACKOFF_BASE = 1.0          # 第一次重試前的基準秒數（之後每次 ×2）
+BACKOFF_CAP = 30.0          # 單次等待上限
+BREAKER_THRESHOLD = 5       # 連續幾次失敗就斷路
+BREAKER_COOLDOWN = 60.0     # 斷路後多久放一個試探請求
+MIN_RATE_RATIO = 0.1        # 被 429 降速時最低降到設定值的幾成
+
+class CircuitOpenError(RuntimeError):
+    """主機處於斷路狀態，請求未送出。"""
+
+class BudgetExhaustedError(RuntimeError):
+    """請求額度用完，請求未送出。"""
+
+class RequestBudget:
+    """
+    HTTP 請求額度（跨資料集、跨執行緒共用）：HttpClient 每送一次（含重試）扣一次。
+        client.budget = RequestBudget(2000)
+    """
+    def __init__(self, total: int):
+        self.left = max(0, int(total))
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            if self.left <= 0:
+                return False
+            self.left -= 1
+            return True
+
+    def charge(self):
+        """扣一次；沒額度了拋 BudgetExhaustedError。"""
+        if not self.take():
+            raise BudgetExhaustedError("request budget exhausted")
+
+def parse_retry_after(value) -> float | None:
+    """Retry-After 可能是秒數或 HTTP 日期；解析不了回 None。"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP,
+                  retry_after: float | None = None) -> float:
+    """
+    第 attempt 次（從 0 起）失敗後要等幾秒。
+    有 Retry-After 就照伺服器說的（不超過 cap）；否則指數退避 + equal jitter，
+    避免多個 worker 同時醒來又一起撞上限。
+    """
+    if retry_after is not None:
+        return min(cap, retry_after)
+    d = min(cap, base * (2 ** attempt))
+    return d / 2 + random.uniform(0, d / 2)
+
+class TokenBucket:
+    """
+    每秒補 rate 個 token，最多存 burst 個。rate <= 0 表示不限速。
+    reserve() 先預約 token，呼叫端在鎖外睡，多執行緒依序排隊、不會一起搶。
+    """
+    def __init__(self, rate: float, burst: float | None = None):
+        self.ceiling = float(rate or 0)
+        self.rate = self.ceiling
+        self.burst = max(1.0, float(burst if burst is not None else max(1.0, self.ceiling)))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.until = 0.0            # 429 暫停到何時（monotonic；不限速時也有效）
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self) -> float:
+        """取一個 token，回傳需等待的秒數（0 = 立即可送）。"""
+        with self._lock:
+            now = time.monotonic()
+            paused = max(0.0, self.until - now)
+            if self.rate <= 0:
+                return paused
+            self._refill(now)
+            self.tokens -= 1
+            return max(paused, 0.0 if self.tokens >= 0 else -self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """429 / Retry-After：讓這個主機整體停 seconds 秒（所有 worker 一起，下次 reserve 時等）。"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.until = max(self.until, time.monotonic() + seconds)
+
+    def slow_down(self) -> float:
+        """被限流：速率減半（不低於 ceiling × MIN_RATE_RATIO）。"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.ceiling * MIN_RATE_RATIO, self.rate / 2)
+            return self.rate
+
+    def speed_up(self) -> float:
+        """成功：每次加回 ceiling 的 5%，慢慢爬回設定值。"""
+        with self._lock:
+            if self.rate < self.ceiling:
+                self._refill(time.monotonic())
+                self.rate = min(self.ceiling, self.rate + self.ceiling * 0.05)
+            return self.rate
+
+class CircuitBreaker:
+    """
+    連續 threshold 次失敗（連線錯誤 / 逾時 / 5xx）→ 斷路 cooldown 秒；
+    之後放一個試探請求（half-open），成功才恢復，失敗再斷 cooldown 秒。
+    試探請求收到不可重試的 4xx 也算主機有回應（恢復）；收到 429 則再等一個 cooldown 重新試探。
+    """
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def requeue(self):
+        """試探請求被 429 擋回（主機沒壞、只是要我們慢一點）：不算失敗，再等一個 cooldown 重新試探。"""
+        with self._lock:
+            if self.probing:
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def failure(self) -> bool:
+        """記錄一次失敗；這次造成斷路時回 True。"""
+        with self._lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return True
+            return False
+
+class RateLimiter:
+    """
+    每個主機一組 TokenBucket + CircuitBreaker + 統計。
+    每個決策（等待、退避、降速、斷路、直接失敗）都記進 stats 並寫 log（logger "ratelimit"）。
+        limiter = RateLimiter({"www.twse.com.tw": 0.5})
+        client = HttpClient(limiter=limiter)
+    """
+    def __init__(self, rates: dict | None = None, default_rate: float = 0.0,
+                 backoff_base: float = BACKOFF_BASE, backoff_cap: float = BACKOFF_CAP,
+                 breaker_threshold: int = BREAKER_THRESHOLD,
+                 breaker_cooldown: float = BREAKER_COOLDOWN):
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> dict:
+        with self._lock:
+            h = self._hosts.get(host)
+            if h is None:
+                h = self._hosts[host] = {
+                    "bucket": TokenBucket(self.rates.get(host, self.default_rate)),
+                    "breaker": CircuitBreaker(self.breaker_threshold, self.breaker_cooldown),
+                    "stats": {"requests": 0, "ok": 0, "retries": 0, "throttled": 0,
+                              "fail_fast": 0, "errors": 0, "breaker_trips": 0,
+                              "rejected": 0, "waited_sec": 0.0},
+                    "lock": threading.Lock(),
+                }
+            return h
+
+    def _count(self, h, key, n=1):
+        with h["lock"]:
+            h["stats"][key] += n
+
+    # ---- 請求前 ----
+    def acquire(self, host: str):
+        """送出前呼叫：斷路中直接拋 CircuitOpenError；否則依 token bucket 等到可送。"""
+        h = self._host(host)
+        if not h["breaker"].allow():
+            self._count(h, "rejected")
+            log.warning("%s: circuit open, request rejected", host)
+            raise CircuitOpenError(f"circuit open for {host}")
+        wait = h["bucket"].reserve()
+        self._count(h, "requests")
+        if wait > 0:
+            self._count(h, "waited_sec", wait)
+            log.debug("%s: rate limit wait %.2fs", host, wait)
+            time.sleep(wait)
+
+    # ---- 請求後 ----
+    def on_success(self, host: str):
+        h = self._host(host)
+        h["breaker"].success()
+        self._count(h, "ok")
+        h["bucket"].speed_up()
+
+    def on_fail_fast(self, host: str, status: int):
+        h = self._host(host)
+        # 主機有回應（只是這個請求本身不對，例如 404 沒這天）：連線正常，half-open 的試探也算成功
+        h["breaker"].success()
+        self._count(h, "fail_fast")
+        log.info("%s: HTTP %s is not retryable, giving up", host, status)
+
+    def on_throttle(self, host: str, attempt: int, retry_after=None) -> float:
+        """
+        429：整個主機暫停（Retry-After 或退避時間）並降速。
+        等待在下次 acquire 時發生，所以回傳 0（呼叫端不必再自己睡）。
+        """
+        h = self._host(host)
+        h["breaker"].requeue()
+        self._count(h, "throttled")
+        self._count(h, "retries")
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, parse_retry_after(retry_after))
+        h["bucket"].pause(delay)
+        rate = h["bucket"].slow_down()
+        log.warning("%s: throttled (429), pausing %.1fs, rate -> %s", host, delay,
+                    f"{rate:.2f}/s" if rate > 0 else "unlimited")
+        return 0.0
+
+    def on_failure(self, host: str, attempt: int, reason: str = "", retry_after=None) -> float:
+        """可重試的失敗（連線錯誤 / 逾時 / 5xx / 回傳非 JSON）；回傳退避秒數。"""
+        h = self._host(host)
+        self._count(h, "errors")
+        self._count(h, "retries")
+        if h["breaker"].failure():
+            self._count(h, "breaker_trips")
+            log.warning("%s: circuit opened after %s (cooldown %.0fs)", host, reason, self.breaker_cooldown)
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, parse_retry_after(retry_after))
+        log.info("%s: %s, retry in %.1fs", host, reason, delay)
+        return delay
+
+    # ---- 觀測 ----
+    def stats(self) -> dict:
+        """{host: {requests, ok, retries, throttled, fail_fast, errors, breaker_trips, rejected, waited_sec, rate, breaker}}"""
+        out = {}
+        with self._lock:
+            hosts = dict(self._hosts)
+        for host, h in hosts.items():
+            with h["lock"]:
+                st = dict(h["stats"])
+            st["rate"] = h["bucket"].rate
+            st["breaker"] = h["breaker"].state
+            out[host] = st
+        return out
+
+    def report(self) -> list:
+        lines = []
+        for host, st in sorted(self.stats().items()):
+            rate = f"{st['rate']:.2f}/s" if st["rate"] > 0 else "unlimited"
+            lines.append(f"[HTTP] {host}: req={st['requests']} ok={st['ok']} retries={st['retries']} "
+                         f"429={st['throttled']} fail_fast={st['fail_fast']} errors={st['errors']} "
+                         f"trips={st['breaker_trips']} rejected={st['rejected']} "
+                         f"waited={st['waited_sec']:.1f}s rate={rate} breaker={st['breaker']}")
+        return lines
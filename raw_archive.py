@@ -0,0 +1,229 @@
+# raw_archive.py — 原始回應封存格式：壓縮的 JSON Lines，一個資料集一天一檔
+#
+# 檔名：<dataset>_<YYYYMMDD>.jsonl.gz（或 .jsonl.zst）
+# 內容：第 1 行是 header，之後每行一筆 record（緊湊 JSON，不縮排）
+#   {"_raw": 1, "type": "list"|"dict"|"value", "key": "data"|"tables"|null, "pos": n, "meta": {...}}
+#   - list：整個回應是 JSON 陣列，每個元素一行
+#   - dict：key 指向的陣列拆成多行，其餘欄位放 meta（T86 的 fields/date、MI_INDEX 的 tables…）
+#   - value：其他型別，整個放在 meta["value"]
+# 舊的 <name>.json（縮排 JSON）仍可用同一組 API 讀取。
+# 帶日期的 raw 檔寫入後會記進 <raw_dir>/catalog.db（catalog.py），list_raw / find_latest 改查索引。
+import os, re, io, gzip, json, queue, hashlib, threading
+
+try:                    # 有 orjson 就用（快數倍，輸出同樣是 UTF-8 緊湊 JSON）
+    import orjson as _orjson
+except ImportError:     # pragma: no cover
+    _orjson = None
+
+try:
+    import zstandard as _zstd
+except ImportError:     # pragma: no cover
+    _zstd = None
+
+FORMAT_VERSION = 1
+RECORD_KEYS = ("data", "tables")
+EXTS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+LEGACY_EXT = ".json"
+
+_compression = "gzip"
+
+def configure(compression: str | None = None):
+    """設定預設壓縮（gzip / zstd）；zstd 需安裝 zstandard，否則退回 gzip。"""
+    global _compression
+    if compression:
+        if compression not in EXTS:
+            raise ValueError(f"Unknown raw compression: {compression}")
+        _compression = compression if (compression != "zstd" or _zstd) else "gzip"
+
+# ---- JSON 編解碼 ----
+def dumps(obj) -> bytes:
+    if _orjson is not None:
+        return _orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(b):
+    if _orjson is not None:
+        return _orjson.loads(b)
+    return json.loads(b)
+
+# ---- 路徑 ----
+_NAME_RE = re.compile(r"^(?P<ds>[a-z_]+?)(?:_(?P<date>\d{8}))?(?P<ext>\.jsonl\.gz|\.jsonl\.zst|\.json)$")
+
+def raw_path(raw_dir: str, dataset: str, ymd: str, compression: str | None = None) -> str:
+    return os.path.join(raw_dir, f"{dataset}_{ymd}{EXTS[compression or _compression]}")
+
+def parse_name(path: str):
+    """檔名 → (dataset, YYYYMMDD 或 None, 副檔名)；不是 raw 檔回 None。"""
+    m = _NAME_RE.match(os.path.basename(path))
+    if not m:
+        return None
+    return m.group("ds"), m.group("date"), m.group("ext")
+
+def is_legacy(path: str) -> bool:
+    return path.endswith(LEGACY_EXT)
+
+def list_raw(raw_dir: str, dataset: str, start: str | None = None, end: str | None = None):
+    """
+    某資料集的 raw 檔（新→舊）；同一天有新舊格式時新格式優先。舊的無日期 <ds>.json 排最後（只在不限區間時）。
+    查 catalog 索引，不掃目錄。
+    """
+    if not os.path.isdir(raw_dir):
+        return []
+    from catalog import get_catalog
+    return get_catalog(raw_dir).paths(dataset, start, end)
+
+def find_latest(raw_dir: str, dataset: str):
+    if not os.path.isdir(raw_dir):
+        return None
+    from catalog import get_catalog
+    return get_catalog(raw_dir).latest(dataset)
+
+def cache_marker(obj):
+    """index_fetch 以 cache 回填的 payload 帶 _cached / _cached_from；回傳 (cached, cached_from)。"""
+    if isinstance(obj, dict) and obj.get("_cached"):
+        return True, obj.get("_cached_from")
+    return False, None
+
+def _catalog_record(path: str, blob: bytes, cached=False, cached_from=None):
+    info = parse_name(path)
+    if not info or not info[1]:
+        return      # cache/<market>_last 等非日期檔不進目錄索引
+    from catalog import get_catalog
+    cat = None
+    try:
+        cat = get_catalog(os.path.dirname(path) or ".")
+        cat.record(path, len(blob), hashlib.sha256(blob).hexdigest(), cached, cached_from)
+    except Exception as e:
+        # 檔案已落地；索引記不進去就標成過期，下次開啟時掃目錄補回
+        print(f"[WARN] raw catalog record failed for {path}: {e!r}")
+        if cat is not None:
+            try:
+                cat.invalidate()
+            except Exception:
+                pass
+
+# ---- 寫入 ----
+def _split(obj):
+    if isinstance(obj, list):
+        return {"type": "list", "key": None, "meta": {}}, obj
+    if isinstance(obj, dict):
+        for key in RECORD_KEYS:
+            if isinstance(obj.get(key), list):
+                meta = {k: v for k, v in obj.items() if k != key}
+                pos = list(obj).index(key)
+                return {"type": "dict", "key": key, "pos": pos, "meta": meta}, obj[key]
+        return {"type": "dict", "key": None, "meta": obj}, []
+    return {"type": "value", "key": None, "meta": {"value": obj}}, []
+
+def _compressor(path: str, raw):
+    if path.endswith(EXTS["zstd"]):
+        return _zstd.ZstdCompressor(level=10).stream_writer(raw, closefd=False)
+    # mtime=0、不寫檔名：同樣內容 → 同樣位元組（雜湊可用來判斷是否有變）
+    return gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0, compresslevel=6)
+
+def write_raw(obj, path: str) -> str:
+    """寫成封存格式（先寫暫存檔再換名，避免半成品）並記進 catalog。回傳 path。"""
+    return write_bytes(encode_raw(obj, path), path, *cache_marker(obj))
+
+def _write_records(f, obj):
+    header, records = _split(obj)
+    f.write(dumps({"_raw": FORMAT_VERSION, **header}) + b"\n")
+    for rec in records:
+        f.write(dumps(rec) + b"\n")
+
+def encode_raw(obj, path: str) -> bytes:
+    """在記憶體裡編碼成與 write_raw(obj, path) 完全相同的位元組（可先算雜湊、再交給 RawWriter 寫檔）。"""
+    buf = io.BytesIO()
+    with _compressor(path, buf) as f:
+        _write_records(f, obj)
+    return buf.getvalue()
+
+def write_bytes(blob: bytes, path: str, cached: bool = False, cached_from: str | None = None) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(blob)
+    os.replace(tmp, path)
+    _catalog_record(path, blob, cached, cached_from)
+    return path
+
+class RawWriter:
+    """
+    背景寫 raw 檔：submit(blob, path[, cached, cached_from]) 放進有上限的佇列（滿了就等，避免記憶體堆積），
+    單一執行緒依序寫出。close() 等全部寫完，回傳寫入失敗的 [(path, 例外)]。
+    """
+    def __init__(self, maxsize: int = 8):
+        self._q = queue.Queue(maxsize=maxsize)
+        self.errors = []
+        self.written = []
+        self._thread = threading.Thread(target=self._run, name="raw-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            blob, path, cached, cached_from = item
+            try:
+                self.written.append(write_bytes(blob, path, cached, cached_from))
+            except Exception as e:
+                self.errors.append((path, e))
+
+    def submit(self, blob: bytes, path: str, cached: bool = False, cached_from: str | None = None):
+        self._q.put((blob, path, cached, cached_from))
+
+    def close(self) -> list:
+        self._q.put(None)
+        self._thread.join()
+        return self.errors
+
+# ---- 讀取 ----
+def _open_read(path: str):
+    if path.endswith(EXTS["zstd"]):
+        if _zstd is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return io.BufferedReader(_zstd.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return gzip.open(path, "rb")
+
+def _load_legacy(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def read_header(path: str) -> dict:
+    if is_legacy(path):
+        header, _ = _split(_load_legacy(path))
+        return {"_raw": 0, **header}
+    with _open_read(path) as f:
+        return loads(f.readline())
+
+def iter_records(path: str):
+    """逐筆產生 records，不把整個檔案讀進記憶體（舊 .json 只能整檔載入後再逐筆）。"""
+    if is_legacy(path):
+        _, records = _split(_load_legacy(path))
+        yield from records
+        return
+    with _open_read(path) as f:
+        f.readline()
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+def load_raw(path: str):
+    """讀回與原始回應相同的物件（新舊格式皆可）。"""
+    if is_legacy(path):
+        return _load_legacy(path)
+    with _open_read(path) as f:
+        header = loads(f.readline())
+        records = [loads(line) for line in f if line.strip()]
+    kind, key, meta = header.get("type"), header.get("key"), header.get("meta") or {}
+    if kind == "list":
+        return records
+    if kind == "value":
+        return meta.get("value")
+    if key is None:
+        return dict(meta)
+    # 把 records 放回原本的欄位位置
+    items = list(meta.items())
+    items.insert(header.get("pos", len(items)), (key, records))
+    return dict(items)
@@ -0,0 +1,118 @@
+# renormalize.py — 用現在的 normalize.py 重跑整個 raw 封存（改了欄位對應後重建歷史，不必重抓）
+#   raw 檔依日期由舊到新分派給 process pool；主行程依序收結果、湊成大批次 upsert，每批 commit 一次。
+#   同時在途的檔案數與每批列數都有上限，記憶體不隨封存年數成長。
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import os, sys, tracemalloc
+
+import datasets
+import daily_insti
+import telemetry
+from raw_archive import list_raw, parse_name, load_raw
+from utils import norm_ymd
+
+DEFAULT_BATCH_ROWS = 200_000    # 湊滿這麼多列才寫一次 SQLite
+INFLIGHT_PER_WORKER = 2         # 每個 worker 最多預排幾個檔案
+
+def archive_files(raw_dir: str, ds: str, start: str | None = None, end: str | None = None) -> list:
+    """
+    某資料集在 [start, end] 內的 raw 檔（舊→新，同一天只取一份、新格式優先）。
+    沒有日期的舊檔（<ds>.json）只在不限區間時納入，排最前面。
+    """
+    seen, out = set(), []
+    for path in list_raw(raw_dir, datasets.get(ds).raw, start, end):
+        ymd = parse_name(path)[1] or ""
+        if ymd not in seen:
+            seen.add(ymd)
+            out.append(path)
+    return out[::-1]
+
+def _init_worker():
+    # fork 出來的 worker 會繼承主行程的 tracemalloc / profiler（telemetry、--profile），在這裡關掉
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    sys.setprofile(None)
+
+def _normalize_file(ds: str, path: str):
+    """worker 行程：讀 raw → normalize；回傳 (rows_in, DataFrame)。"""
+    obj = load_raw(path)
+    return telemetry.count_rows(obj), datasets.get(ds).normalizer()(obj)
+
+def _flush(db, ds: str, frames: list) -> int:
+    import pandas as pd
+    if not frames:
+        return 0
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    frames.clear()
+    with telemetry.stage("store", ds) as st:
+        n = st["rows_in"] = st["rows_out"] = db.upsert(df, ds)
+        db.commit()
+    return n
+
+def renormalize(ds: str, db, raw_dir: str, ex, workers: int, start=None, end=None,
+                batch_rows: int = DEFAULT_BATCH_ROWS) -> dict:
+    """單一資料集；ex 為共用的 ProcessPoolExecutor。回傳 {"files", "rows", "failed"}。"""
+    files = archive_files(raw_dir, ds, start, end)
+    if datasets.get(ds).key is None:
+        # 全量快照（沒有鍵）：每次寫入都整表換新，只有最新一份有意義
+        files = files[-1:]
+    stats = {"files": len(files), "rows": 0, "failed": 0}
+    print(f"[INFO] renormalize {ds}: {len(files)} raw file(s)")
+    if not files:
+        return stats
+
+    frames, buffered = [], 0
+    pending = deque()
+    it = iter(files)
+    window = max(1, int(workers)) * INFLIGHT_PER_WORKER
+    with telemetry.stage("renormalize", ds) as st:
+        while True:
+            while len(pending) < window:
+                path = next(it, None)
+                if path is None:
+                    break
+                pending.append((path, ex.submit(_normalize_file, ds, path)))
+            if not pending:
+                break
+            # 依檔案順序（舊→新）收結果：同一鍵出現在多個檔案時，較新的檔案最後寫入
+            path, fut = pending.popleft()
+            try:
+                _, df = fut.result()
+            except Exception as e:
+                print(f"[ERR] renormalize {ds} {os.path.basename(path)}: {e!r}")
+                stats["failed"] += 1
+                continue
+            if df is None or df.empty:
+                continue
+            frames.append(df)
+            buffered += len(df)
+            if buffered >= batch_rows:
+                stats["rows"] += _flush(db, ds, frames)
+                buffered = 0
+        stats["rows"] += _flush(db, ds, frames)
+        st["rows_in"], st["rows_out"] = stats["files"], stats["rows"]
+    print(f"[OK] renormalize {ds}: files={stats['files']} rows={stats['rows']} failed={stats['failed']}")
+    return stats
+
+def run_renormalize(names, out_root: str, start=None, end=None, workers: int | None = None,
+                    batch_rows: int = DEFAULT_BATCH_ROWS, indicators: bool = True) -> dict:
+    from store import open_store
+    start, end = (norm_ymd(start) if start else None), (norm_ymd(end) if end else None)
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    raw_dir = os.path.join(out_root, "raw")
+    out = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as ex, open_store(out_root) as db:
+        for ds in names:
+            out[ds] = renormalize(ds, db, raw_dir, ex, workers, start, end, batch_rows)
+            if indicators and out[ds]["rows"]:
+                # 歷史改寫過：技術指標整段重算
+                import indicators as ind
+                if ds in ind.SOURCES:
+                    with telemetry.stage("indicators", ds) as st:
+                        st["rows_out"] = ind.rebuild(db, ds)
+                    db.commit()
+        if any(out[ds]["rows"] for ds in names if ds in daily_insti.SOURCES):
+            # daily / insti 歷史改寫過：join 表整表重算
+            with telemetry.stage("daily_insti", "all") as st:
+                st["rows_out"] = daily_insti.refresh(db)
+    return out
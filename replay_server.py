@@ -0,0 +1,193 @@
+# replay_server.py — 離線重播：把 HttpClient 錄下的回應（record_dir）用本機 HTTP 伺服器再吐出來
+# 錄製：config.yaml 設 http_record_dir: data/recordings，照常跑 fetch-all / backfill
+# 重播：
+#   python replay_server.py --dir data/recordings --port 8765 --latency 80 --jitter 40 \
+#       --error-rate 0.02 --throttle-rate 0.01 --holiday-rate 0.05
+#   python replay_server.py --print-config      # 印出要貼進 config.yaml 的 base_urls
+# 網址格式：http://127.0.0.1:8765/<原主機>/<原路徑>?<原查詢字串>（HttpClient 的 base_urls 會自動改寫）
+# 注入：
+#   --latency/--jitter  每個回應延遲（毫秒，平均 ± 均勻抖動）
+#   --error-rate        回 503（會觸發退避 / 斷路）
+#   --throttle-rate     回 429 + Retry-After（會觸發主機暫停 / 降速）
+#   --holiday-rate      當成休市日，回交易所的「查無資料」（--holidays 指定固定日期）
+#   沒錄到的網址預設也回「查無資料」（--missing 404 改回 404）
+import os, sys, json, time, random, signal, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+DEFAULT_PORT = 8765
+HOSTS = ("openapi.twse.com.tw", "www.twse.com.tw", "www.tpex.org.tw")
+# 交易所查無資料時的樣子：rwd 端點回 stat 訊息，openapi 回空陣列
+EMPTY_TWSE = {"stat": "很抱歉，沒有符合條件的資料!"}
+
+def _key(host: str, path: str, query: str) -> str:
+    # 查詢參數排序後比對，順序不同也算同一個網址
+    return f"{host}{path}?{urlencode(sorted(parse_qsl(query, keep_blank_values=True)))}"
+
+def load_recordings(record_dir: str) -> dict:
+    """{key: 錄製紀錄}；目錄結構為 <record_dir>/<host>/<hash>.json（HttpClient._record 寫的）。"""
+    out = {}
+    for host in sorted(os.listdir(record_dir)) if os.path.isdir(record_dir) else []:
+        folder = os.path.join(record_dir, host)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(folder, name), "r", encoding="utf-8") as f:
+                    rec = json.load(f)
+            except ValueError:
+                continue
+            u = urlsplit(rec["url"])
+            rec["body"] = rec["body"].encode("utf-8")
+            out[_key(u.netloc, u.path, u.query)] = rec
+    return out
+
+def empty_body(host: str) -> bytes:
+    obj = EMPTY_TWSE if host == "www.twse.com.tw" else []
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+class Replay:
+    """錄製資料 + 注入設定 + 計數；handler 共用一份。"""
+    def __init__(self, recordings: dict, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, holiday_rate=0.0, holidays=(),
+                 missing="empty", seed=None):
+        self.recordings = recordings
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_rate, self.throttle_rate, self.retry_after = error_rate, throttle_rate, retry_after
+        self.holiday_rate, self.holidays = holiday_rate, set(holidays)
+        self.missing = missing
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self._holiday_draw = {}     # 同一天抽一次，重試 / 其他端點都一致
+
+    def _rand(self) -> float:
+        with self.lock:
+            return self.rnd.random()
+
+    def count(self, what: str):
+        with self.lock:
+            self.counts[what] = self.counts.get(what, 0) + 1
+
+    def is_holiday(self, query: str) -> bool:
+        ymd = dict(parse_qsl(query)).get("date", "").replace("-", "").replace("/", "")
+        if not ymd:
+            return False
+        if ymd in self.holidays:
+            return True
+        if self.holiday_rate <= 0:
+            return False
+        with self.lock:
+            if ymd not in self._holiday_draw:
+                self._holiday_draw[ymd] = self.rnd.random() < self.holiday_rate
+            return self._holiday_draw[ymd]
+
+    def delay(self):
+        ms = self.latency_ms + (self._rand() * 2 - 1) * self.jitter_ms
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def respond(self, host: str, path: str, query: str, headers) -> tuple:
+        """回傳 (status, headers, body)。"""
+        if self.throttle_rate and self._rand() < self.throttle_rate:
+            self.count("429")
+            return 429, {"Retry-After": str(self.retry_after)}, b""
+        if self.error_rate and self._rand() < self.error_rate:
+            self.count("503")
+            return 503, {}, b""
+        if self.is_holiday(query):
+            self.count("holiday")
+            return 200, {"Content-Type": "application/json; charset=utf-8"}, empty_body(host)
+        rec = self.recordings.get(_key(host, path, query))
+        if rec is None:
+            self.count("missing")
+            if self.missing == "404":
+                return 404, {}, b""
+            return 200, {"Content-Type": "application/json; charset=utf-8"}, empty_body(host)
+        out = {"Content-Type": rec.get("content_type") or "application/json; charset=utf-8"}
+        if rec.get("etag"):
+            out["ETag"] = rec["etag"]
+            if headers.get("If-None-Match") == rec["etag"]:
+                self.count("304")
+                return 304, out, b""
+        if rec.get("last_modified"):
+            out["Last-Modified"] = rec["last_modified"]
+        self.count("hit")
+        return rec.get("status") or 200, out, rec["body"]
+
+def make_handler(replay: Replay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"       # keep-alive：跟真實主機一樣可重用連線
+
+        def do_GET(self):
+            u = urlsplit(self.path)
+            host, _, path = u.path.lstrip("/").partition("/")
+            replay.delay()
+            status, headers, body = replay.respond(host, "/" + path, u.query, self.headers)
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+    return Handler
+
+def serve(replay: Replay, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """啟動伺服器（背景執行緒）並回傳；測試 / 基準腳本可直接呼叫。"""
+    httpd = ThreadingHTTPServer((host, port), make_handler(replay))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def base_urls(port: int = DEFAULT_PORT, host: str = "127.0.0.1") -> dict:
+    return {h: f"http://{host}:{port}/{h}" for h in HOSTS}
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="重播 HttpClient 錄下的回應（可注入延遲 / 錯誤 / 429 / 休市日）")
+    ap.add_argument("--dir", default=os.path.join("data", "recordings"), help="錄製目錄（http_record_dir）")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--latency", type=float, default=0.0, help="平均延遲毫秒")
+    ap.add_argument("--jitter", type=float, default=0.0, help="延遲抖動毫秒（±）")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="回 503 的機率")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="回 429 的機率")
+    ap.add_argument("--retry-after", type=int, default=1, help="429 的 Retry-After 秒數")
+    ap.add_argument("--holiday-rate", type=float, default=0.0, help="把某天當休市日的機率（同一天結果固定）")
+    ap.add_argument("--holidays", default="", help="固定休市日，逗號分隔 YYYYMMDD")
+    ap.add_argument("--missing", choices=["empty", "404"], default="empty", help="沒錄到的網址怎麼回")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--print-config", action="store_true", help="印出 config.yaml 的 base_urls 後結束")
+    a = ap.parse_args(argv)
+
+    if a.print_config:
+        print("base_urls:")
+        for h, u in base_urls(a.port, a.host).items():
+            print(f"  {h}: {u}")
+        return
+
+    recs = load_recordings(a.dir)
+    replay = Replay(recs, a.latency, a.jitter, a.error_rate, a.throttle_rate, a.retry_after,
+                    a.holiday_rate, [h for h in a.holidays.split(",") if h], a.missing, a.seed)
+    httpd = serve(replay, a.host, a.port)
+    # 背景執行（&）時 SIGINT 會被忽略：SIGTERM 也一樣印統計後結束
+    signal.signal(signal.SIGTERM, _stop)
+    print(f"[OK] replaying {len(recs)} recording(s) from {a.dir} on http://{a.host}:{a.port}/")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.shutdown()
+        print("[STAT] " + ", ".join(f"{k}={v}" for k, v in sorted(replay.counts.items())))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,105 +1,59 @@
 # reports/backfill_from_normalized.py
-# 目的：把現有的 normalized/taiex.csv 與 normalized/otc.csv
-# 合併成 market_overview.csv 並 upsert 進 data/twse.db 的 market_overview 表
+# 目的：從 data/twse.db 已存的 taiex / otc / insti 歷史重建 market_overview
+#   （--from/--to 指定區間，預設全部），upsert 進 market_overview 表並輸出 data/reports/market_overview.csv
+# 篩選與法人聚合沿用 market_report 的 SQL（日期區間走索引、GROUP BY date），不再讀 normalized/*.csv。
 
 import os
+import sys
 import sqlite3
-import pandas as pd
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profiling  # noqa: E402
+from store_sqlite import SqliteStore  # noqa: E402
+import market_report as mr  # noqa: E402
 
 DB_PATH = "data/twse.db"
 OUT_CSV = "data/reports/market_overview.csv"
-TABLE   = "market_overview"
-
-DDL = f"""
-CREATE TABLE IF NOT EXISTS {TABLE} (
-  date TEXT NOT NULL,
-  market TEXT NOT NULL,
-  open REAL,
-  high REAL,
-  low REAL,
-  close REAL,
-  volume REAL,
-  turnover REAL,
-  net_foreign REAL,
-  net_invest REAL,
-  net_dealer REAL,
-  net_total REAL,
-  PRIMARY KEY (date, market)
-);
-"""
-
-def _read_csv_safe(path: str) -> pd.DataFrame:
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        return pd.DataFrame()
-    try:
-        return pd.read_csv(path)
-    except Exception:
-        return pd.DataFrame()
-
-def main():
-    os.makedirs("data/reports", exist_ok=True)
-
-    tai = _read_csv_safe("data/normalized/taiex.csv")
-    otc = _read_csv_safe("data/normalized/otc.csv")
-
-    frames = []
-    if not tai.empty:
-        # 需要欄位：date,open,high,low,close,volume,turnover
-        keep = [c for c in ["date","open","high","low","close","volume","turnover"] if c in tai.columns]
-        df = tai[keep].copy()
-        df["market"] = "TAIEX"
-        frames.append(df)
+TABLE   = mr.TABLE
 
-    if not otc.empty:
-        keep = [c for c in ["date","open","high","low","close","volume","turnover"] if c in otc.columns]
-        df = otc[keep].copy()
-        df["market"] = "OTC"
-        frames.append(df)
+def main(start=None, end=None):
+    os.makedirs(os.path.dirname(OUT_CSV), exist_ok=True)
+    if not os.path.exists(DB_PATH):
+        print(f"[WARN] {DB_PATH} not found; nothing to backfill.")
+        return 0
+    start, end = mr.parse_range(start, end)
 
-    if not frames:
-        print("[WARN] no normalized TAIEX/OTC csv; nothing to backfill.")
-        return
-
-    out = pd.concat(frames, ignore_index=True)
-
-    # 清理型別與欄位
-    out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-    for c in ["open","high","low","close","volume","turnover"]:
-        if c in out.columns:
-            out[c] = pd.to_numeric(out[c], errors="coerce")
-
-    # 加上法人欄位（目前沒有市場層級的 T86，所以先給空值）
-    for c in ["net_foreign","net_invest","net_dealer","net_total"]:
-        out[c] = None
-
-    # 欄位順序
-    cols = ["date","market","open","high","low","close","volume","turnover",
-            "net_foreign","net_invest","net_dealer","net_total"]
-    for c in cols:
-        if c not in out.columns:
-            out[c] = None
-    out = out[cols].dropna(subset=["date","market"], how="any").drop_duplicates(subset=["date","market"], keep="last")
-
-    # 1) 產 CSV（覆蓋）
-    out.to_csv(OUT_CSV, index=False, encoding="utf-8-sig")
-    print(f"[OK] wrote market_overview.csv -> {OUT_CSV}, rows={len(out)}")
-
-    # 2) 寫入 SQLite（upsert）
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    mr.prepare_sources(DB_PATH)
     conn = sqlite3.connect(DB_PATH)
     try:
-        conn.execute(DDL)
-        conn.commit()
-        rows = [tuple(x) for x in out.itertuples(index=False, name=None)]
-        conn.executemany(f"""
-            INSERT OR REPLACE INTO {TABLE}
-            (date, market, open, high, low, close, volume, turnover,
-             net_foreign, net_invest, net_dealer, net_total)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""", rows)
-        conn.commit()
-        print(f"[OK] backfilled {len(rows)} rows into {DB_PATH}#{TABLE}")
+        idx, insti = mr.load_range(conn, start, end)
     finally:
         conn.close()
 
+    if idx.empty:
+        print("[WARN] no TAIEX/OTC rows in twse.db for this range; nothing to backfill.")
+        return 0
+
+    out = mr.assemble(idx, insti)
+
+    # 1) 寫入 SQLite（依 (date, market) upsert）
+    with SqliteStore(DB_PATH) as db:
+        db.upsert(out, TABLE)
+        # 2) 產 CSV：整表（指定區間時其餘日期沿用表內既有列）
+        mr.export_csv(db.conn, OUT_CSV, encoding="utf-8-sig")
+    print(f"[OK] backfilled {len(out)} rows into {DB_PATH}#{TABLE}")
+    print(f"[OK] wrote market_overview.csv -> {OUT_CSV}")
+    return len(out)
+
+def cli():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--from", dest="start", help="區間起日（YYYY-MM-DD / YYYYMMDD）")
+    ap.add_argument("--to", dest="end", help="區間迄日（含）")
+    ap.add_argument("--profile", action="store_true", help="cProfile + tracemalloc，輸出到 data/profile/<run-id>/")
+    args = ap.parse_args()
+    with profiling.script_stage("report", "backfill_from_normalized", profile=args.profile) as st:
+        st["rows_out"] = main(args.start, args.end)
+
 if __name__ == "__main__":
-    main()
+    cli()
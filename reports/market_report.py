@@ -1,152 +1,272 @@
 # reports/market_report.py
-# 目的：把 TAIEX / OTC 的指數 (normalized) 與三大法人 T86 (normalized) 合併成「市場概覽」
+# 目的：把 TAIEX / OTC 的指數與三大法人 T86 合併成「市場概覽」
+# 來源：主資料庫 data/twse.db（store.save 寫入的 taiex / otc / insti 表）
 # 產出：
-#   - data/market_overview.csv
-#   - twse.db -> market_overview 表（自動建表，覆寫當日同鍵資料）
+#   - data/market_overview.csv（增量：只重寫高水位日之後的尾端）
+#   - data/twse.db -> market_overview 表（依 (date, market) upsert，既有索引保留）
+#
+# 預設為增量模式：只處理日期 >= 表內最大日期（high-water mark）的資料；
+# 最後一天會重算一次，讓較晚才到的 T86 也能補上。--full 則全量重建；--from/--to 只重算指定區間。
+# 篩選與聚合都在 SQLite 裡做（日期區間走 date 索引、法人 GROUP BY date），Python 只拿到一天一列。
 
 import os
+import sys
 import sqlite3
+import argparse
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from store_sqlite import SqliteStore, table_exists  # noqa: E402
+from utils import norm_ymd                          # noqa: E402
+from schema import compact, to_storage, iso_of, memory_report  # noqa: E402
+import profiling                                    # noqa: E402
+
 DATA_DIR = "data"
-NORM_DIR = os.path.join(DATA_DIR, "normalized")
 CSV_OUT = os.path.join(DATA_DIR, "market_overview.csv")
-DB_PATH = "twse.db"
+DB_PATH = os.path.join(DATA_DIR, "twse.db")
 TABLE = "market_overview"
 
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(NORM_DIR, exist_ok=True)
-
+COLS = ["date","market","open","high","low","close","volume","turnover",
+        "net_foreign","net_invest","net_dealer","net_total"]
+NET_COLS = ["net_foreign","net_invest","net_dealer","net_total"]
+PRICE_COLS = ["open","high","low","close","volume","turnover"]
+SOURCE_TABLES = ("taiex", "otc", "insti")
 
-def _read_csv_safe(path: str, expect_cols=None) -> pd.DataFrame:
-    """讀 CSV，不在就回空表；如果只有表頭也視為空表。"""
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        return pd.DataFrame(columns=expect_cols or [])
-    try:
-        df = pd.read_csv(path, dtype=str)
-        # 若只有表頭或完全空
-        if df.empty or (len(df.columns) == 0):
-            return pd.DataFrame(columns=expect_cols or [])
-        return df
-    except Exception:
-        return pd.DataFrame(columns=expect_cols or [])
+os.makedirs(DATA_DIR, exist_ok=True)
 
 
-def _to_num(s):
-    try:
-        s = str(s).replace(",", "").strip()
-        if s == "" or s.lower() == "nan":
-            return None
-        return float(s)
-    except Exception:
-        return None
+def _iso(x):
+    ymd = norm_ymd(x)
+    return f"{ymd[:4]}-{ymd[4:6]}-{ymd[6:]}" if ymd else None
 
 
-def load_index() -> pd.DataFrame:
-    """載入 TAIEX/OTC 的 normalized 指數資料，合併成同一張表。"""
-    expect_cols = ["market", "date", "open", "high", "low", "close", "volume", "turnover"]
+def parse_range(start=None, end=None):
+    """--from / --to（任何 norm_ymd 認得的寫法）→ ISO；認不得丟 ValueError。"""
+    out = []
+    for x in (start, end):
+        if x and not _iso(x):
+            raise ValueError(f"bad date: {x!r}")
+        out.append(_iso(x) if x else None)
+    return tuple(out)
 
-    taiex = _read_csv_safe(os.path.join(NORM_DIR, "taiex.csv"), expect_cols=expect_cols)
-    otc   = _read_csv_safe(os.path.join(NORM_DIR, "otc.csv"),   expect_cols=expect_cols)
 
-    df = pd.concat([taiex, otc], ignore_index=True, sort=False)
-    if df.empty:
-        return pd.DataFrame(columns=expect_cols)
+def high_water_mark(conn):
+    """market_overview 目前最大日期（ISO；日期由 prepare_sources 統一過）。走 date 索引，一次查找。"""
+    if not table_exists(conn, TABLE):
+        return None
+    return conn.execute(f"SELECT MAX(date) FROM {TABLE}").fetchone()[0]
 
-    # 數值欄位轉型
-    for c in ["open", "high", "low", "close", "volume", "turnover"]:
-        if c in df.columns:
-            df[c] = df[c].map(_to_num)
 
-    # 只留必要欄位
-    keep = [c for c in expect_cols if c in df.columns]
-    df = df[keep].copy()
+def prepare_sources(db_path: str = None) -> set:
+    """
+    來源表（taiex / otc / insti）與 market_overview 的日期統一成 ISO、補上 date 索引；
+    之後的查詢一律用 ISO 區間條件走索引。回傳這次有改寫舊日期的表。
+    整欄掃描每張表只做一次（SqliteStore.iso_dates 會記標記），平常每次只是幾個查表，與歷史長度無關。
+    """
+    rewritten = set()
+    with SqliteStore(db_path or DB_PATH) as db:
+        for table in SOURCE_TABLES + (TABLE,):
+            if table_exists(db.conn, table) and "date" in db.columns(table):
+                if db.iso_dates(table):
+                    rewritten.add(table)
+                db.ensure_indexes(table)
+    return rewritten
 
-    # 清掉完全空白列
-    if {"open","high","low","close","volume","turnover"}.issubset(df.columns):
-        df = df.dropna(subset=["open","high","low","close"], how="all")
 
-    return df
+def _range(start, end):
+    return [start or "", end or "9999-99-99"]
 
 
-def load_insti_daily() -> pd.DataFrame:
+def load_index(conn, start=None, end=None) -> pd.DataFrame:
     """
-    載入 normalized 的 T86（insti.csv）並聚合為 market 層級（全市場合計）。
-    期待欄位：date, net_foreign, net_invest, net_dealer, net_total
+    TAIEX/OTC 指數在 [start, end]（ISO，含端點；None 表不限）的列；回傳精簡型別（date 為日序）。
+    挑列在 SQL 裡做：日期區間、去掉 OHLC 全空的列、同一天只留最後寫入的一列。
     """
-    expect_cols = ["date", "net_foreign", "net_invest", "net_dealer", "net_total"]
-    path = os.path.join(NORM_DIR, "insti.csv")
-    df = _read_csv_safe(path, expect_cols=expect_cols)
+    frames = []
+    for table, market in [("taiex", "TAIEX"), ("otc", "OTC")]:
+        if not table_exists(conn, table):
+            continue
+        cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        ohlc = [c for c in ["open","high","low","close"] if c in cols]
+        if "date" not in cols or not ohlc:
+            continue
+        sel = ", ".join(c if c in cols else f"NULL AS {c}" for c in ["date"] + PRICE_COLS)
+        not_blank = " OR ".join(f"{c} IS NOT NULL" for c in ohlc)
+        df = pd.read_sql_query(
+            f"SELECT {sel} FROM {table} WHERE rowid IN ("
+            f"  SELECT MAX(rowid) FROM {table} WHERE date >= ? AND date <= ? AND ({not_blank}) GROUP BY date"
+            f") ORDER BY date", conn, params=_range(start, end))
+        if df.empty:
+            continue
+        df["market"] = market
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["market","date"] + PRICE_COLS)
+
+    # 精簡型別：date → 日序、market → category、價格 float64、量 / 金額 Int64
+    df = compact(pd.concat(frames, ignore_index=True), "market_overview")
+    print(memory_report(df, "index"))
+    return df
 
-    if df.empty:
-        return pd.DataFrame(columns=expect_cols)
 
-    # 確保欄位存在
-    for c in expect_cols:
-        if c not in df.columns:
-            df[c] = 0
+def _empty_insti() -> pd.DataFrame:
+    return pd.DataFrame({"date": pd.array([], dtype="Int32"), **{c: pd.array([], dtype="Int64") for c in NET_COLS}})
 
-    # 數值轉型
-    for c in ["net_foreign", "net_invest", "net_dealer", "net_total"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0)
 
-    # 以 date 聚合為全市場合計
-    grouped = df.groupby("date")[["net_foreign", "net_invest", "net_dealer", "net_total"]].sum().reset_index()
-    return grouped
+def load_insti_daily(conn, start=None, end=None) -> pd.DataFrame:
+    """
+    T86 明細在 [start, end]（ISO）內依日期聚合為全市場合計；GROUP BY 在 SQLite 裡做（insti.date 有索引），
+    回到 Python 的只有一天一列。回傳的 date 為日序。
+    """
+    if not table_exists(conn, "insti"):
+        return _empty_insti()
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(insti)")]
+    if "date" not in cols:
+        return _empty_insti()
+    sums = ", ".join(f"SUM(COALESCE({c}, 0)) AS {c}" if c in cols else f"0 AS {c}" for c in NET_COLS)
+    df = pd.read_sql_query(
+        f"SELECT date, {sums} FROM insti WHERE date >= ? AND date <= ? GROUP BY date ORDER BY date",
+        conn, params=_range(start, end))
+    if df.empty:
+        return _empty_insti()
+    df = compact(df, "insti")
+    print(memory_report(df, "insti"))
+    return df
 
 
-def build_report():
-    idx = load_index()        # TAIEX/OTC 指數（market+價量）
-    insti = load_insti_daily()  # 三大法人加總（僅 date + net_*）
+def load_range(conn, start=None, end=None):
+    """(指數, 法人合計)：法人只讀指數實際有資料的那段日期。"""
+    idx = load_index(conn, start, end)          # TAIEX/OTC 指數（market+價量）
+    days = idx["date"].dropna()
+    if not len(days):
+        return idx, _empty_insti()
+    return idx, load_insti_daily(conn, iso_of(days.min()), iso_of(days.max()))   # 三大法人加總
 
-    # 如果指數兩張都空，仍輸出表頭 CSV，避免 workflow 後續步驟報錯
-    if idx.empty:
-        cols = ["date","market","open","high","low","close","volume","turnover",
-                "net_foreign","net_invest","net_dealer","net_total"]
-        pd.DataFrame(columns=cols).to_csv(CSV_OUT, index=False, encoding="utf-8")
-        # 也寫進 DB 空表（確保存在）
-        with sqlite3.connect(DB_PATH) as conn:
-            pd.DataFrame(columns=cols).to_sql(TABLE, conn, if_exists="replace", index=False)
-        print("[INFO] index empty -> wrote empty market_overview")
-        return
 
+def assemble(idx: pd.DataFrame, insti: pd.DataFrame) -> pd.DataFrame:
+    """指數（左）併上法人合計 → market_overview 欄位順序、寫出用型別（日期 ISO）。"""
     # left merge（index 左，避免 insti 空導致資料消失）
     out = idx.merge(insti, on="date", how="left")
 
     # 填 NA → 0（法人欄位）
-    for c in ["net_foreign","net_invest","net_dealer","net_total"]:
+    for c in NET_COLS:
         if c in out.columns:
             out[c] = pd.to_numeric(out[c], errors="coerce").fillna(0).astype("int64")
 
     # 欄位順序
-    cols = ["date","market","open","high","low","close","volume","turnover",
-            "net_foreign","net_invest","net_dealer","net_total"]
-    for c in cols:
+    for c in COLS:
         if c not in out.columns:
             out[c] = None
-    out = out[cols].copy()
-
-    # 依日期與市場排序
-    out = out.sort_values(["date","market"], ascending=[True, True])
+    out = out[COLS].sort_values(["date","market"], ascending=[True, True])
+    return to_storage(out)      # 日序 → ISO、category → 字串（CSV / SQLite 用）
 
-    # 寫 CSV
-    out.to_csv(CSV_OUT, index=False, encoding="utf-8")
-    print(f"[OK] wrote {CSV_OUT} rows={len(out)}")
 
-    # 寫 SQLite（全量覆寫）
-    with sqlite3.connect(DB_PATH) as conn:
-        out.to_sql(TABLE, conn, if_exists="replace", index=False)
-        # 可選的索引（加速查詢）
-        try:
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_market_overview_date ON market_overview(date)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_market_overview_mkt_date ON market_overview(market, date)")
-        except Exception:
-            pass
-    print(f"[OK] wrote table {TABLE} into {DB_PATH}, rows={len(out)}")
+def _truncate_csv_from(path: str, since: str, chunk: int = 64 * 1024):
+    """
+    CSV 依日期排序：從檔尾往回找，砍掉 date >= since 的尾端列（只讀檔尾幾 KB）。
+    找不到比 since 舊的列（整檔都要重寫）時回傳 False。
+    """
+    with open(path, "rb+") as f:
+        pos = os.path.getsize(path)
+        tail = b""
+        while pos > 0:
+            step = min(chunk, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            lines = tail.split(b"\n")
+            # 沒讀到檔頭前，第一段可能是被切斷的半行，先不看
+            start = pos if pos == 0 else pos + len(lines[0]) + 1
+            full_lines = lines if pos == 0 else lines[1:]
+            spans = []
+            for line in full_lines:
+                spans.append((start, line))
+                start += len(line) + 1
+            # 由後往前找第一列 date < since（或表頭），其後全部砍掉
+            for offset, line in reversed(spans):
+                d = line.split(b",", 1)[0].decode("utf-8-sig", "ignore").strip()
+                if not d:
+                    continue
+                if d == "date":
+                    return False         # 連第一筆資料都要砍 → 直接重寫
+                if d < since:
+                    f.truncate(offset + len(line) + 1)
+                    return True
+        return False
+
+
+def write_csv(out: pd.DataFrame, since=None):
+    """since=None：整檔覆寫；否則砍掉 date >= since 的尾端後附加。"""
+    if since and os.path.exists(CSV_OUT) and os.path.getsize(CSV_OUT) > 0 \
+            and _truncate_csv_from(CSV_OUT, since):
+        out.to_csv(CSV_OUT, mode="a", header=False, index=False, encoding="utf-8")
+    else:
+        out.to_csv(CSV_OUT, index=False, encoding="utf-8")
+
+
+def export_csv(conn, path: str, encoding: str = "utf-8"):
+    """整張 market_overview 依日期輸出成 CSV（指定區間重算後用；一天兩列，整表也不大）。"""
+    pd.read_sql_query(f"SELECT {', '.join(COLS)} FROM {TABLE} ORDER BY date, market", conn) \
+        .to_csv(path, index=False, encoding=encoding)
+
+
+def build_report(full: bool = False, start: str = None, end: str = None):
+    """
+    預設增量（高水位日之後）；full=True 全量重建；
+    給 start / end（任何 norm_ymd 認得的寫法）則只重算那段區間，upsert 後整表重出 CSV。
+    """
+    start, end = parse_range(start, end)
+    ranged = bool(start or end)
+    if TABLE in prepare_sources() and not ranged:
+        # 舊 CSV 也是舊日期寫法，尾端截斷對不上 → 整份重建
+        print("[INFO] market_overview had non-ISO dates -> full rebuild")
+        full = True
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        hwm = None if full or ranged else high_water_mark(conn)
+        if not ranged:
+            start = hwm
+        idx, insti = load_range(conn, start, end)
+    finally:
+        conn.close()
+
+    span = f"{start or 'beginning'}..{end or 'latest'}"
+    if idx.empty:
+        if full or not os.path.exists(CSV_OUT):
+            # 如果指數兩張都空，仍輸出表頭 CSV，避免 workflow 後續步驟報錯
+            pd.DataFrame(columns=COLS).to_csv(CSV_OUT, index=False, encoding="utf-8")
+        print(f"[INFO] no index rows in {span} -> market_overview unchanged")
+        return 0
+
+    out = assemble(idx, insti)
+
+    # 寫 SQLite（依 (date, market) upsert；全量模式先清空）
+    with SqliteStore(DB_PATH) as db:
+        if full:
+            db.conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        db.upsert(out, TABLE)
+        if ranged:
+            export_csv(db.conn, CSV_OUT)
+    print(f"[OK] upserted {len(out)} rows into {DB_PATH}#{TABLE} ({span})")
+
+    # 寫 CSV（增量：只重寫尾端）
+    if not ranged:
+        write_csv(out, since=None if full else hwm)
+    print(f"[OK] wrote {CSV_OUT} (+{len(out)} rows)")
+    return len(out)
 
 
 def main():
-    build_report()
+    ap = argparse.ArgumentParser(description="合併 TAIEX/OTC 指數與三大法人為 market_overview")
+    ap.add_argument("--full", action="store_true", help="全量重建（預設只處理高水位日之後）")
+    ap.add_argument("--from", dest="start", help="只重算這天起的區間（YYYY-MM-DD / YYYYMMDD）")
+    ap.add_argument("--to", dest="end", help="只重算到這天（含）")
+    ap.add_argument("--profile", action="store_true", help="cProfile + tracemalloc，輸出到 data/profile/<run-id>/")
+    args = ap.parse_args()
+    if args.full and (args.start or args.end):
+        ap.error("--full 與 --from/--to 擇一")
+    with profiling.script_stage("report", TABLE, profile=args.profile, out_root=DATA_DIR) as st:
+        st["rows_out"] = build_report(full=args.full, start=args.start, end=args.end)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,13 @@
 # reports/to_sql.py
 import os
+import sys
 import sqlite3
+import argparse
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profiling  # noqa: E402
+
 DB_PATH = "data/twse.db"
 CSV_PATH = "data/market_overview.csv"
 TABLE = "market_overview"
@@ -43,5 +48,12 @@ def main():
     finally:
         conn.close()
 
+def cli():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", action="store_true", help="cProfile + tracemalloc，輸出到 data/profile/<run-id>/")
+    args = ap.parse_args()
+    with profiling.script_stage("report", "to_sql", profile=args.profile):
+        main()
+
 if __name__ == "__main__":
-    main()
+    cli()
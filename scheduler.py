@@ -0,0 +1,84 @@
+# scheduler.py — 多資料集並行抓取：全域 worker 上限 + 每個主機各自的並行上限
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+
+import datasets
+
+# 各資料集實際打的主機（同主機共用一個並行額度；登錄在 datasets.py）
+DATASET_HOSTS = datasets.hosts()
+
+DEFAULT_WORKERS = 4
+DEFAULT_HOST_LIMIT = 2
+
+class HostLimiter:
+    """每個主機一個 semaphore；未設定的主機用 default 額度。"""
+    def __init__(self, limits: dict | None = None, default: int = DEFAULT_HOST_LIMIT):
+        self.limits = dict(limits or {})
+        self.default = default
+        self._sems = {}
+        self._multi = {}
+        self._lock = threading.Lock()
+
+    def limit(self, host: str) -> int:
+        return max(1, int(self.limits.get(host, self.default)))
+
+    def slot(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.limit(host))
+                self._sems[host] = sem
+                self._multi[host] = threading.Lock()
+            return sem
+
+    @contextmanager
+    def hold(self, host: str, n: int = 1):
+        """
+        佔 n 個額度（不超過主機上限），yield 實際拿到的個數：同時送 n 個請求的工作（候選日試探）用。
+        多額度的取得依主機排隊，兩個工作各拿一半互等的死結不會發生。
+        """
+        sem = self.slot(host)
+        n = max(1, min(int(n or 1), self.limit(host)))
+        if n == 1:
+            with sem:
+                yield 1
+            return
+        with self._multi[host]:
+            for _ in range(n):
+                sem.acquire()
+        try:
+            yield n
+        finally:
+            for _ in range(n):
+                sem.release()
+
+def fetch_width(ds: str, probe: int) -> int:
+    """資料集抓取時同時送出的請求數：會試探候選日的用 probe，其餘 1。"""
+    return max(1, int(probe or 1)) if datasets.get(ds).probe else 1
+
+def run_concurrent(names, fetch_one, workers: int = DEFAULT_WORKERS,
+                   host_limits: dict | None = None, probe: int = 1):
+    """
+    並行執行 fetch_one(ds, probe)，回傳 {ds: fetch_one 的結果}（依 names 原順序）。
+    probe = 這次實際拿到的主機額度（試探候選日的資料集最多 probe 個，其餘 1），抓取器同時送出的請求不超過它。
+    任一資料集失敗時，其餘資料集仍會跑完，最後再拋出第一個錯誤。
+    """
+    limiter = HostLimiter(host_limits)
+
+    def _task(ds):
+        with limiter.hold(DATASET_HOSTS.get(ds, ds), fetch_width(ds, probe)) as width:
+            return fetch_one(ds, width)
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as ex:
+        futs = {ds: ex.submit(_task, ds) for ds in names}
+        for ds, fut in futs.items():
+            try:
+                results[ds] = fut.result()
+            except Exception as e:
+                print(f"[ERR] fetch {ds} failed: {e!r}")
+                errors[ds] = e
+    if errors:
+        raise next(iter(errors.values()))
+    return results
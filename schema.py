@@ -0,0 +1,103 @@
+# schema.py — normalize 後 DataFrame 的精簡型別（長歷史整段放進記憶體用）
+#   code / name / market 等重複字串 → category
+#   date                            → Int32 日序（1970-01-01 起的天數；認不得 → <NA>）
+#   價格                            → float32（指數表仍用 float64：指數值有效位數超過 float32）
+#   成交量 / 金額 / 法人買賣超       → Int64（可為 <NA>）
+# 寫出（SQLite / CSV / Parquet）前由 to_storage 換回一般型別，日期一律 ISO（YYYY-MM-DD）。
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils import norm_ymd
+
+_EPOCH = date(1970, 1, 1).toordinal()
+
+CATEGORY_COLS = {"code", "name", "market", "industry", "source_date"}
+DATE_COLS = {"date"}
+PRICE_COLS = {"open", "high", "low", "close"}
+INT_COLS = {"volume", "turnover", "net_foreign", "net_invest", "net_dealer", "net_total"}
+FLAG_COLS = {"is_cached"}
+FLOAT64_DATASETS = {"taiex", "otc", "market_overview"}
+
+# ---- 日期 ----
+def day_number(s: pd.Series) -> pd.Series:
+    """任何 norm_ymd 認得的日期寫法 → Int32 日序；只對不重複值解析一次。"""
+    if isinstance(s.dtype, pd.Int32Dtype):
+        return s
+    lut = {}
+    for v in pd.unique(s.dropna()):
+        ymd = norm_ymd(v)
+        try:
+            lut[v] = date(int(ymd[:4]), int(ymd[4:6]), int(ymd[6:])).toordinal() - _EPOCH if ymd else None
+        except ValueError:      # 2024-02-31 之類
+            lut[v] = None
+    return pd.array(s.map(lut), dtype="Int32") if lut else pd.array([None] * len(s), dtype="Int32")
+
+def to_iso(s) -> pd.Series:
+    """Int32 日序 → 'YYYY-MM-DD' 字串（<NA> → None）。"""
+    s = pd.Series(s)
+    lut = {int(v): date.fromordinal(int(v) + _EPOCH).isoformat() for v in pd.unique(s.dropna())}
+    return s.map(lut).astype(object).where(s.notna(), None)
+
+def iso_of(day: int) -> str:
+    return date.fromordinal(int(day) + _EPOCH).isoformat()
+
+# ---- 精簡 / 還原 ----
+def _int64(s: pd.Series) -> pd.Series:
+    if s.dtype.kind in "iu":
+        return s.astype("Int64")
+    return pd.to_numeric(s, errors="coerce").round().astype("Int64")
+
+def compact(df: pd.DataFrame, dataset: str | None = None) -> pd.DataFrame:
+    """套用精簡型別，回傳新的 DataFrame（一次建好，不逐欄改寫）；不認得的欄位保持原樣。"""
+    if df is None or df.empty:
+        return df
+    price = "float64" if dataset in FLOAT64_DATASETS else "float32"
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c in CATEGORY_COLS:
+            s = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+        elif c in DATE_COLS:
+            s = day_number(s)
+        elif c in PRICE_COLS:
+            s = (s if s.dtype.kind == "f" else pd.to_numeric(s, errors="coerce")).astype(price)
+        elif c in INT_COLS:
+            s = _int64(s)
+        elif c in FLAG_COLS:
+            s = pd.to_numeric(s, errors="coerce").fillna(0).astype("int8")
+        out[c] = s
+    return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+def to_storage(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    精簡型別 → 寫出用的一般型別（新 DataFrame，不改動原本的）：
+    日序 → ISO 字串、category → 字串、float32 → float64（取最短十進位表示，12.35 不會變成 12.350000381）。
+    已是一般型別的欄位原樣保留，重複呼叫無副作用。
+    """
+    if df is None:
+        return df
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c in DATE_COLS and isinstance(s.dtype, pd.Int32Dtype):
+            s = to_iso(s)
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(object).where(s.notna(), None)
+        elif s.dtype == np.float32:
+            s = pd.Series(s.to_numpy().astype(str).astype(np.float64), index=s.index)
+        out[c] = s
+    return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+# ---- 記憶體 ----
+def memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(index=True, deep=True).sum() / 1e6
+
+def memory_report(df: pd.DataFrame, label: str, top: int = 3) -> str:
+    """一行摘要：列數、總 MB、最佔空間的幾個欄位。"""
+    if df is None:
+        return f"[MEM] {label}: -"
+    per = df.memory_usage(index=False, deep=True).sort_values(ascending=False)
+    cols = ", ".join(f"{c}={v / 1e6:.2f}MB({df[c].dtype})" for c, v in per.head(top).items())
+    return f"[MEM] {label}: rows={len(df)} {memory_mb(df):.2f} MB" + (f"  [{cols}]" if cols else "")
@@ -1,26 +1,54 @@
-# store.py  —— CSV + SQLite 雙存版（穩定版）
+# store.py  —— CSV + SQLite 雙存版（穩定版）；storage 含 parquet 時另寫日期分區 Parquet
 import os
 import pandas as pd
-from store_sqlite import save_sqlite  # 同目錄下的 store_sqlite.py
+from store_sqlite import save_sqlite, SqliteStore  # 同目錄下的 store_sqlite.py
+from schema import to_storage
+
+def storage_targets(storage) -> set:
+    """storage 可為字串（"sqlite" / "sqlite,parquet"）或清單。"""
+    if isinstance(storage, str):
+        storage = storage.replace("+", ",").split(",")
+    return {str(s).strip().lower() for s in (storage or []) if str(s).strip()}
 
 def save_csv(df: pd.DataFrame, path: str):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     df.to_csv(path, index=False, encoding="utf-8-sig")
 
-def save(df: pd.DataFrame, storage: str, out_root: str, name: str):
+def db_path(out_root: str) -> str:
+    return os.path.join(out_root, "twse.db")
+
+def open_store(out_root: str) -> SqliteStore:
+    """整次執行共用的 SQLite 連線；用 with 包起來就是一個交易。"""
+    os.makedirs(out_root, exist_ok=True)
+    return SqliteStore(db_path(out_root))
+
+def save(df: pd.DataFrame, storage: str, out_root: str, name: str, db: SqliteStore | None = None,
+         csv: bool = True):
     """
-    無視 storage，總是同時輸出：
-      1) SQLite：data/twse.db 的 <name> 表（append）
+    總是同時輸出：
+      1) SQLite：data/twse.db 的 <name> 表（依鍵 upsert；傳入 db 則共用其連線/交易）
       2) CSV   ：data/normalized/<name>.csv
-    回傳 CSV 路徑（給呼叫端列印用）
+    storage 含 parquet 時再加：
+      3) Parquet：data/columnar/<name>/date=YYYY-MM-DD/（每個交易日一個分區，覆蓋）
+    回傳 CSV 路徑（給呼叫端列印用）；csv=False（逐日回補）時不覆寫 CSV，回傳 None
+    normalize 輸出的精簡型別（category / 日序 / float32）先換回一般型別，日期一律寫成 ISO。
     """
     os.makedirs(out_root, exist_ok=True)
+    df = to_storage(df)
 
     # 1) 寫入 SQLite
-    db = os.path.join(out_root, "twse.db")
-    save_sqlite(df, db, name)
+    save_sqlite(df, db_path(out_root), name, db=db)
+
+    # 2) 寫入 normalized CSV（只放最新一批）
+    csv_path = None
+    if csv:
+        csv_path = os.path.join(out_root, "normalized", f"{name}.csv")
+        save_csv(df, csv_path)
 
-    # 2) 寫入 normalized CSV
-    csv_path = os.path.join(out_root, "normalized", f"{name}.csv")
-    save_csv(df, csv_path)
+    # 3) 日期分區 Parquet（選用）
+    if "parquet" in storage_targets(storage):
+        from columnar import write_partitions
+        parts = write_partitions(df, out_root, name)
+        if parts:
+            print(f"[OK] parquet {name}: {len(parts)} partition(s)")
     return csv_path
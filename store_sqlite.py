@@ -1,10 +1,263 @@
+# store_sqlite.py —— SQLite 儲存：每個資料集有主鍵（唯一索引），寫入一律 upsert
 import os, sqlite3
 import pandas as pd
+import datasets
+from schema import to_storage
+from utils import norm_ymd
 
-def save_sqlite(df: pd.DataFrame, db_path: str, table: str):
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+# 各表的鍵：資料集的鍵登錄在 datasets.py；沒有鍵的（monthly / yearly / holders 等全量快照）每次整表換成最新快照
+KEYS = {
+    **datasets.keys(),
+    "market_overview": ("date", "market"),
+    "indicators": ("code", "date"),          # indicators.py
+    "daily_insti": ("code", "date"),         # daily_insti.py
+}
+
+# 次要索引：{table: {索引名: 欄位}}（依日期取整天資料、報表依日期彙總用）
+# 個股表的 (code, date) 由鍵的唯一索引負責（個股時間序列）；(date, code) 給某一天的橫斷面 / 排行（query.py）
+INDEXES = {
+    "daily": {"ix_daily_date_code": ("date", "code")},
+    "insti": {"ix_insti_date_code": ("date", "code")},
+    "taiex": {"ix_taiex_date": ("date",)},
+    "otc": {"ix_otc_date": ("date",)},
+    "indicators": {"ix_indicators_date_code": ("date", "code")},
+    "daily_insti": {"ix_daily_insti_date_code": ("date", "code")},
+    "market_overview": {
+        "idx_market_overview_date": ("date",),
+        "idx_market_overview_mkt_date": ("market", "date"),
+    },
+}
+
+# 被上面取代、建索引時順手拿掉的舊索引（(date) 已被 (date, code) 涵蓋）
+RETIRED_INDEXES = {t: (f"ix_{t}_date",) for t in ("daily", "insti", "indicators", "daily_insti")}
+
+# 舊資料補欄位預設值（migrate 用；例如早期 otc 沒有 market 欄）
+FILL_DEFAULTS = {
+    "taiex": {"market": "TAIEX"},
+    "otc":   {"market": "OTC"},
+}
+
+# 存放每張表的維護標記（例如 "iso_dates:insti" = 日期已全部是 ISO，不必再整欄掃描）
+META_TABLE = "_store_meta"
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MiB
+    "PRAGMA busy_timeout=10000",
+)
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _sql_type(s: pd.Series) -> str:
+    kind = s.dtype.kind
+    if kind in "biu":
+        return "INTEGER"
+    if kind == "f":
+        return "REAL"
+    return "TEXT"
+
+def _rows(df: pd.DataFrame):
+    # NaN / NA → None；numpy 純量 → Python 純量（sqlite3 才綁得進去）
+    obj = df.astype(object).where(df.notna(), None)
+    return list(obj.itertuples(index=False, name=None))
+
+class SqliteStore:
+    """
+    一次執行共用一條連線；with 區塊 = 一個交易（正常結束 commit，例外 rollback）。
+        with SqliteStore("data/twse.db") as db:
+            db.upsert(df, "daily")
+    """
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        for p in PRAGMAS:
+            self.conn.execute(p)
+        self._iso_checked = set()
+
+    def __enter__(self):
+        self.conn.execute("BEGIN")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.close()
+
+    def commit(self):
+        """長時間執行（例如回補）中途落地：提交目前交易並立刻開始下一個。"""
+        self.conn.execute("COMMIT")
+        self.conn.execute("BEGIN")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # ---- 結構 ----
+    def columns(self, table: str) -> list:
+        return [r[1] for r in self.conn.execute(f"PRAGMA table_info({_q(table)})")]
+
+    def meta(self, key: str):
+        if not table_exists(self.conn, META_TABLE):
+            return None
+        row = self.conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str = "1"):
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)", (key, value))
+
+    def ensure_table(self, table: str, df: pd.DataFrame):
+        """建表（沿用 pandas 的 SQLite 型別對應）、補缺欄位、建鍵的唯一索引。"""
+        cols = self.columns(table)
+        if not cols:
+            self.conn.execute(pd.io.sql.get_schema(df, table))
+            if "date" in df.columns:
+                # 新表只會經 upsert（to_storage）寫入，日期一律 ISO
+                self.set_meta(f"iso_dates:{table}")
+                self._iso_checked.add(table)
+        else:
+            if "date" in cols and table not in self._iso_checked:
+                self.iso_dates(table)
+            for c in df.columns:
+                if c not in cols:
+                    self.conn.execute(f"ALTER TABLE {_q(table)} ADD COLUMN {_q(c)} {_sql_type(df[c])}")
+        self.ensure_indexes(table)
+
+    def ensure_indexes(self, table: str):
+        """建鍵的唯一索引與 INDEXES 的次要索引（表內有那些欄位才建；已存在不動），拿掉 RETIRED_INDEXES。"""
+        cols = set(self.columns(table))
+        keys = KEYS.get(table)
+        if keys and all(k in cols for k in keys):
+            ddl = (f"CREATE UNIQUE INDEX IF NOT EXISTS {_q('ux_' + table + '_key')} "
+                   f"ON {_q(table)} ({', '.join(_q(k) for k in keys)})")
+            try:
+                self.conn.execute(ddl)
+            except sqlite3.IntegrityError:
+                # 舊表（append 時代）有重複鍵：先去重再建索引
+                print(f"[INFO] {table}: removed {self.dedupe(table)} duplicate rows before indexing")
+                self.conn.execute(ddl)
+        for name in RETIRED_INDEXES.get(table, ()):
+            self.conn.execute(f"DROP INDEX IF EXISTS {_q(name)}")
+        for name, idx_cols in INDEXES.get(table, {}).items():
+            if all(c in cols for c in idx_cols):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {_q(name)} "
+                                  f"ON {_q(table)} ({', '.join(_q(c) for c in idx_cols)})")
+
+    # ---- 寫入 ----
+    def upsert(self, df: pd.DataFrame, table: str) -> int:
+        """
+        有鍵：INSERT ... ON CONFLICT(鍵) DO UPDATE（同一天重跑不會重複）。
+        無鍵：整表換成這次的快照。
+        鍵欄位不齊（上游欄名變了）：退回 append 並警告。
+        精簡型別（schema.compact）在這裡換回一般型別：日期寫成 ISO、category 寫成字串。
+        """
+        if df is None or len(df.columns) == 0:
+            return 0
+        df = to_storage(df.loc[:, ~df.columns.duplicated()])
+        self.ensure_table(table, df)
+        cols = [str(c) for c in df.columns]
+        col_sql = ", ".join(_q(c) for c in cols)
+        sql = f"INSERT INTO {_q(table)} ({col_sql}) VALUES ({', '.join('?' * len(cols))})"
+
+        keys = KEYS.get(table)
+        if keys and all(k in cols for k in keys):
+            updates = [c for c in cols if c not in keys]
+            sql += f" ON CONFLICT ({', '.join(_q(k) for k in keys)}) DO "
+            sql += ("UPDATE SET " + ", ".join(f"{_q(c)}=excluded.{_q(c)}" for c in updates)) if updates else "NOTHING"
+        elif keys:
+            print(f"[WARN] {table}: key columns {keys} missing, appending without dedupe")
+        else:
+            self.conn.execute(f"DELETE FROM {_q(table)}")
+
+        if df.empty:
+            return 0
+        self.conn.executemany(sql, _rows(df))
+        return len(df)
+
+    # ---- 維護 ----
+    def iso_dates(self, table: str, force: bool = False) -> int:
+        """
+        把 date 欄的舊寫法（20240102、民國 113/01/02…）改成 ISO，與 to_storage 寫入的一致；
+        改完同一鍵若出現兩列，保留最後寫入的。回傳改寫的日期數。
+        整欄掃描每張表只做一次：做完在 _store_meta 記 "iso_dates:<table>"，之後直接跳過（force=True 重掃）。
+        """
+        self._iso_checked.add(table)
+        key = f"iso_dates:{table}"
+        if not force and self.meta(key):
+            return 0
+        fix = {}
+        for (d,) in self.conn.execute(f"SELECT DISTINCT date FROM {_q(table)} WHERE date IS NOT NULL"):
+            ymd = norm_ymd(d)
+            iso = f"{ymd[:4]}-{ymd[4:6]}-{ymd[6:]}" if ymd else None
+            if iso and iso != d:
+                fix[d] = iso
+        if not fix:
+            self.set_meta(key)
+            return 0
+        # 唯一索引會擋住改寫後撞鍵的列：先拿掉，去重後由 ensure_indexes 重建
+        self.conn.execute(f"DROP INDEX IF EXISTS {_q('ux_' + table + '_key')}")
+        self.conn.executemany(f"UPDATE {_q(table)} SET date = ? WHERE date = ?",
+                              [(iso, d) for d, iso in fix.items()])
+        removed = self.dedupe(table)
+        self.set_meta(key)
+        print(f"[INFO] {table}: rewrote {len(fix)} date spelling(s) to ISO, removed {removed} duplicate rows")
+        return len(fix)
+
+    def dedupe(self, table: str) -> int:
+        """依鍵去重（保留最後寫入的那列），回傳刪除列數。"""
+        keys = KEYS.get(table)
+        cols = self.columns(table)
+        if not keys or not all(k in cols for k in keys):
+            return 0
+        for col, val in FILL_DEFAULTS.get(table, {}).items():
+            if col in cols:
+                self.conn.execute(f"UPDATE {_q(table)} SET {_q(col)}=? WHERE {_q(col)} IS NULL", (val,))
+        before = self.conn.total_changes
+        self.conn.execute(
+            f"DELETE FROM {_q(table)} WHERE rowid NOT IN "
+            f"(SELECT MAX(rowid) FROM {_q(table)} GROUP BY {', '.join(_q(k) for k in keys)})")
+        return self.conn.total_changes - before
+
+def table_exists(conn, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+def save_sqlite(df: pd.DataFrame, db_path: str, table: str, db: SqliteStore | None = None):
+    """寫入單一資料集；有傳入 db 就用它的連線與交易，否則自己開一個。"""
+    if db is not None:
+        return db.upsert(df, table)
+    with SqliteStore(db_path) as st:
+        return st.upsert(df, table)
+
+def migrate(db_path: str) -> dict:
+    """
+    一次性整理舊的 twse.db（早期版本每次 append、沒有主鍵）：
+      補欄位預設值 → 日期統一成 ISO → 依鍵去重 → 建唯一索引 → VACUUM。回傳 {table: 刪除列數}。
+    """
+    if not os.path.exists(db_path):
+        return {}
+    removed = {}
+    with SqliteStore(db_path) as st:
+        tables = {r[0] for r in st.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for table in KEYS:
+            if table not in tables:
+                continue
+            cols = st.columns(table)
+            for col in FILL_DEFAULTS.get(table, {}):
+                if col not in cols:
+                    st.conn.execute(f"ALTER TABLE {_q(table)} ADD COLUMN {_q(col)} TEXT")
+            if "date" in cols:
+                st.iso_dates(table, force=True)
+            removed[table] = st.dedupe(table)
+            st.ensure_table(table, pd.DataFrame(columns=st.columns(table)))
     conn = sqlite3.connect(db_path)
     try:
-        df.to_sql(table, conn, if_exists="append", index=False)
+        conn.execute("VACUUM")
     finally:
         conn.close()
+    return removed
@@ -0,0 +1,188 @@
+# telemetry.py — 結構化紀錄：每次 HTTP 請求、每個 pipeline 階段各寫一行 JSON
+#   <output_dir>/logs/requests.jsonl：url / endpoint / dataset / status / 延遲 / bytes / 重試 / 快取命中
+#   <output_dir>/logs/stages.jsonl  ：stage / dataset / 耗時 / rows_in / rows_out / 記憶體峰值
+# summarize() 跨多次執行算各端點、各階段的 p50 / p95（main.py stats）。
+import os, json, math, time, threading, tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlsplit
+
+import profiling
+
+try:
+    import resource             # 非 Windows 才有；拿 process 的 max RSS
+except ImportError:             # pragma: no cover
+    resource = None
+
+_state = {"dir": None, "run_id": None, "memory": False}
+_lock = threading.Lock()
+_ctx = threading.local()        # 目前執行緒所在的 dataset（讓 HTTP 紀錄知道是哪個資料集打的）
+
+def _now_tw():
+    return datetime.now(timezone(timedelta(hours=8)))
+
+def _now_iso():
+    return _now_tw().isoformat(timespec="milliseconds")
+
+def configure(log_dir: str | None, run_id: str | None = None, memory: bool = False) -> str | None:
+    """
+    啟用紀錄（log_dir=None 則關閉）。memory=True 時用 tracemalloc 量每階段記憶體峰值
+    （會讓每次 Python 配置都變慢，預設關閉，--profile / 基準測試時才開；並行階段共用同一個峰值計數，數字是該期間整個 process 的峰值）。
+    回傳本次 run_id。
+    """
+    _state["dir"] = log_dir
+    _state["run_id"] = run_id or _now_tw().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+    _state["memory"] = bool(memory and log_dir)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        if _state["memory"] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    return _state["run_id"]
+
+def enabled() -> bool:
+    return bool(_state["dir"])
+
+def run_id() -> str | None:
+    return _state["run_id"]
+
+def _append(name: str, rec: dict):
+    if not _state["dir"]:
+        return
+    rec = {"ts": _now_iso(), "run": _state["run_id"], **rec}
+    line = json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        with open(os.path.join(_state["dir"], name), "a", encoding="utf-8") as f:
+            f.write(line)
+
+def endpoint(url: str) -> str:
+    """去掉 query string 的端點名（host + path），當彙總鍵。"""
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
+
+def current_dataset() -> str | None:
+    return getattr(_ctx, "dataset", None)
+
+def record_request(url: str, status: int | None, latency_ms: float, nbytes: int = 0,
+                   retries: int = 0, cache_hit: bool = False, error: str | None = None):
+    _append("requests.jsonl", {
+        "url": url, "endpoint": endpoint(url), "dataset": current_dataset(),
+        "status": status, "latency_ms": round(latency_ms, 1), "bytes": nbytes,
+        "retries": retries, "cache_hit": cache_hit, "error": error,
+    })
+
+def count_rows(obj) -> int | None:
+    """raw payload 大約幾列（list 長度 / dict 的 data / tables[*].data 總和）。"""
+    if obj is None:
+        return None
+    if hasattr(obj, "__len__") and hasattr(obj, "columns"):     # DataFrame
+        return len(obj)
+    if isinstance(obj, list):
+        return len(obj)
+    if isinstance(obj, dict):
+        if isinstance(obj.get("data"), list):
+            return len(obj["data"])
+        if isinstance(obj.get("tables"), list):
+            return sum(len(t.get("data") or []) for t in obj["tables"] if isinstance(t, dict))
+    return None
+
+def _rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)   # Linux: KiB
+
+@contextmanager
+def stage(name: str, dataset: str | None = None):
+    """
+    包住一個階段，結束時寫一行 stages.jsonl。區塊內可填 rows_in / rows_out：
+        with telemetry.stage("normalize", ds) as st:
+            st["rows_in"] = count_rows(raw)
+            df = ...
+            st["rows_out"] = len(df)
+    """
+    rec = {"stage": name, "dataset": dataset, "rows_in": None, "rows_out": None}
+    prev = current_dataset()
+    if dataset is not None:
+        _ctx.dataset = dataset
+    tracing = _state["memory"] and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    try:
+        with profiling.stage(name, dataset):      # --profile 時才有作用
+            yield rec
+        rec["ok"] = True
+    except BaseException as e:
+        rec["ok"] = False
+        rec["error"] = repr(e)
+        raise
+    finally:
+        rec["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if tracing:
+            rec["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        rec["max_rss_mb"] = _rss_mb()
+        _ctx.dataset = prev
+        _append("stages.jsonl", rec)
+
+# ---- 彙總 ----
+def _read(path: str):
+    if not os.path.exists(path):
+        return []
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue            # 被中斷時最後一行可能不完整
+    return out
+
+def _pct(values, p):
+    """最近秩百分位（nearest-rank）；values 需已排序。"""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[k]
+
+def _group(recs, key, value):
+    groups = {}
+    for r in recs:
+        v = r.get(value)
+        if v is not None:
+            groups.setdefault(key(r), []).append(v)
+    return {k: sorted(v) for k, v in groups.items()}
+
+def summarize(log_dir: str, last_runs: int | None = None) -> list:
+    """跨執行彙總：各端點 / 各階段的次數、p50、p95、max；回傳要印的行。"""
+    reqs = _read(os.path.join(log_dir, "requests.jsonl"))
+    stages = _read(os.path.join(log_dir, "stages.jsonl"))
+    runs = sorted({r.get("run") for r in reqs + stages if r.get("run")})
+    if last_runs:
+        keep = set(runs[-last_runs:])
+        reqs = [r for r in reqs if r.get("run") in keep]
+        stages = [r for r in stages if r.get("run") in keep]
+        runs = sorted(keep)
+
+    lines = [f"runs: {len(runs)}" + (f" ({runs[0]} .. {runs[-1]})" if runs else "")]
+
+    lines.append("")
+    lines.append(f"{'endpoint':<58} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'err':>4} {'cache':>5}")
+    by_ep = _group(reqs, lambda r: r.get("endpoint") or "?", "latency_ms")
+    for ep, vals in sorted(by_ep.items(), key=lambda kv: -sum(kv[1])):
+        rs = [r for r in reqs if (r.get("endpoint") or "?") == ep]
+        errs = sum(1 for r in rs if r.get("error"))
+        hits = sum(1 for r in rs if r.get("cache_hit"))
+        lines.append(f"{ep[:58]:<58} {len(vals):>5} {_pct(vals, 50):>8.0f} {_pct(vals, 95):>8.0f} "
+                     f"{vals[-1]:>8.0f} {errs:>4} {hits:>5}")
+
+    lines.append("")
+    lines.append(f"{'stage':<24} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'total s':>8} {'rows out':>9} {'peak MB':>8}")
+    key = lambda r: f"{r.get('stage')}:{r.get('dataset')}" if r.get("dataset") else str(r.get("stage"))
+    by_stage = _group(stages, key, "duration_ms")
+    for st, vals in sorted(by_stage.items(), key=lambda kv: -sum(kv[1])):
+        rs = [r for r in stages if key(r) == st]
+        rows = [r["rows_out"] for r in rs if r.get("rows_out") is not None]
+        peaks = [r["peak_mb"] for r in rs if r.get("peak_mb") is not None]
+        lines.append(f"{st[:24]:<24} {len(vals):>5} {_pct(vals, 50):>8.0f} {_pct(vals, 95):>8.0f} "
+                     f"{sum(vals) / 1000:>8.1f} {(rows[-1] if rows else ''):>9} "
+                     f"{(max(peaks) if peaks else ''):>8}")
+    return lines
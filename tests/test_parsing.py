@@ -0,0 +1,62 @@
+# tests/test_parsing.py — 向量化解析與逐格版本（原 normalize 的 _to_num / _num / _to_int / fix_date）逐值相同
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+import parsing as P
+
+# TWSE / TPEX 實際出現的格子寫法，加上幾種雜字元
+CELLS = [
+    "1,234", "1,234,567", "0", "-1,234", "12.5", "-0.35", "1,234.56", " 1,234 ",
+    "", "-", "--", "---", "—", "X", "12a", "1,234 *", "+5", "1e5", "1.2.3", "inf", "nan",
+    "N/A", "7.", ".5", "0012",
+]
+
+# (格子, num_cell, float_cell, int_cell) — 錨定幾個關鍵寫法的基準值
+EXPECTED = [
+    ("1,234",   1234,   1234.0, 1234),
+    ("12.5",    12.5,   12.5,   12),
+    ("--",      None,   None,   0),
+    ("X",       None,   None,   0),
+    ("—",       None,   None,   0),
+    ("-",       None,   None,   0),
+    ("12a",     12,     12.0,   0),
+    ("1,234 *", 1234,   1234.0, 0),
+    ("1e5",     15,     15.0,   100000),
+]
+
+PAIRS = [(P.to_num, P.num_cell), (P.to_float, P.float_cell), (P.to_int, P.int_cell)]
+
+def _same(vec: pd.Series, ref: pd.Series):
+    a = pd.to_numeric(vec, errors="coerce").astype("float64")
+    b = pd.to_numeric(ref, errors="coerce").astype("float64")
+    pd.testing.assert_series_equal(a, b, check_names=False)
+
+@pytest.mark.parametrize("cell,num,flt,integer", EXPECTED)
+def test_baseline_values(cell, num, flt, integer):
+    for fn, want in ((P.num_cell, num), (P.float_cell, flt), (P.int_cell, integer)):
+        assert fn(cell) == want
+
+@pytest.mark.parametrize("vec,cell_fn", PAIRS, ids=lambda f: getattr(f, "__name__", ""))
+def test_column_matches_cells(vec, cell_fn):
+    s = pd.Series(CELLS, dtype=object)
+    _same(vec(s), s.map(cell_fn))
+
+@pytest.mark.parametrize("cell", CELLS)
+@pytest.mark.parametrize("vec,cell_fn", PAIRS, ids=lambda f: getattr(f, "__name__", ""))
+def test_single_cell(vec, cell_fn, cell):
+    # 單格欄位會走整數快速路徑或退回路徑，兩邊都要對
+    s = pd.Series([cell, cell], dtype=object)
+    _same(vec(s), s.map(cell_fn))
+
+def test_integer_column_dtype():
+    s = pd.Series(["1,234", "-5", "0"], dtype=object)
+    assert P.to_num(s).dtype == "int64" and P.to_int(s).dtype == "int64"
+    assert P.to_num(s).tolist() == [1234, -5, 0]
+
+@pytest.mark.parametrize("cell", ["113/01/02", "99/12/31", "113/1/2", "2024/01/02", "2024-01-02", "1130102", ""])
+def test_roc_to_iso(cell):
+    s = pd.Series([cell, "113/01/02"], dtype=object)
+    assert P.roc_to_iso(s).tolist() == s.map(P.roc_date_cell).tolist()
@@ -0,0 +1,139 @@
+# trading_calendar.py — 交易日曆：週末 + 種子假日 + 從實際回應學到的開/休市日
+from datetime import datetime, timedelta
+import os, json, atexit, threading
+
+from utils import norm_ymd
+
+class TradingCalendar:
+    """
+    三種來源判斷某日是否休市：
+      1) 週末
+      2) 種子假日（config.yaml 的 holidays）
+      3) 觀測：MI_INDEX / T86 有資料 → 交易日；
+              比已知最新交易日還舊卻回空 → 休市（颱風假、補假等）
+    只有「已知休市」的日子會被跳過，未知的平日仍視為候選交易日。
+    觀測只改記憶體並標成 dirty；由 flush() 寫檔（fetch / backfill 結束時，行程結束前也會補一次）。
+    """
+    def __init__(self, path: str, holidays=()):
+        self.path = path
+        self.trading = set()
+        self.closed = set()
+        self.seeded = set()
+        self.latest = None          # 已知最新交易日（= max(trading)，觀測時維護，不每次重算）
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._load()
+        self.seed(holidays)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                obj = json.load(f)
+            self.trading = set(obj.get("trading") or [])
+            self.closed = set(obj.get("closed") or [])
+            self.latest = max(self.trading) if self.trading else None
+        except Exception:
+            pass
+
+    def flush(self):
+        """有新觀測才寫檔（整份 JSON 覆寫一次）。"""
+        with self._lock:
+            if not self.dirty:
+                return
+            self._save()
+            self.dirty = False
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"trading": sorted(self.trading), "closed": sorted(self.closed)}, f)
+        os.replace(tmp, self.path)
+
+    def seed(self, holidays):
+        for h in holidays or ():
+            ymd = norm_ymd(h)
+            if ymd:
+                self.seeded.add(ymd)
+
+    # ---- 查詢 ----
+    def is_closed(self, ymd: str) -> bool:
+        """已知休市（週末 / 假日 / 觀測到休市）。"""
+        if ymd in self.trading:
+            return False
+        if datetime.strptime(ymd, "%Y%m%d").weekday() >= 5:
+            return True
+        return ymd in self.seeded or ymd in self.closed
+
+    def is_trading_day(self, ymd: str) -> bool:
+        """非已知休市即視為交易日（含尚未觀測的平日）。"""
+        return not self.is_closed(ymd)
+
+    def prev_trading_days(self, start: datetime, n: int):
+        """從 start（含）往前推，回傳 n 個非休市日（新→舊）。"""
+        out = []
+        d = start
+        while len(out) < n:
+            ymd = d.strftime("%Y%m%d")
+            if not self.is_closed(ymd):
+                out.append(ymd)
+            d = d - timedelta(days=1)
+        return out
+
+    def latest_trading_day(self, start: datetime) -> str:
+        return self.prev_trading_days(start, 1)[0]
+
+    def trading_days_between(self, start: str, end: str):
+        """[start, end] 之間的非休市日（舊→新）。"""
+        d = datetime.strptime(start, "%Y%m%d")
+        stop = datetime.strptime(end, "%Y%m%d")
+        out = []
+        while d <= stop:
+            ymd = d.strftime("%Y%m%d")
+            if not self.is_closed(ymd):
+                out.append(ymd)
+            d = d + timedelta(days=1)
+        return out
+
+    # ---- 學習 ----
+    def observe(self, ymd: str, non_empty: bool, learn_closed: bool = True):
+        """
+        記錄一次成功回應（例外/逾時不要呼叫）。
+        non_empty → 交易日；回空且早於已知最新交易日 → 休市。只改記憶體，寫檔見 flush()。
+        """
+        with self._lock:
+            if non_empty:
+                if ymd not in self.trading:
+                    self.trading.add(ymd)
+                    self.closed.discard(ymd)
+                    self.latest = max(self.latest or ymd, ymd)
+                    self.dirty = True
+            elif learn_closed and ymd not in self.trading and ymd not in self.closed:
+                if self.latest and ymd < self.latest:
+                    self.closed.add(ymd)
+                    self.dirty = True
+
+_CALENDARS = {}
+_CAL_LOCK = threading.Lock()
+
+def get_calendar(out_root: str, holidays=None) -> TradingCalendar:
+    """每個 out_root 共用一份日曆（存在 <out_root>/cache/trading_calendar.json）。"""
+    path = os.path.join(out_root, "cache", "trading_calendar.json")
+    with _CAL_LOCK:
+        cal = _CALENDARS.get(path)
+        if cal is None:
+            cal = _CALENDARS[path] = TradingCalendar(path, holidays)
+        elif holidays:
+            cal.seed(holidays)
+        return cal
+
+def flush_all():
+    """把所有日曆的新觀測寫檔（fetch / backfill 結束時呼叫；行程結束前也會自動跑一次）。"""
+    with _CAL_LOCK:
+        cals = list(_CALENDARS.values())
+    for cal in cals:
+        cal.flush()
+
+atexit.register(flush_all)
@@ -1,32 +1,193 @@
-import os, time, json, logging, hashlib
+import os, time, json, logging, hashlib, threading
 from typing import Any, Dict, Optional, Tuple
 
 import requests
+from urllib.parse import urlsplit, urlunsplit
+
+from ratelimit import RateLimiter, RETRYABLE_STATUS
+import telemetry
 
 DEFAULT_HEADERS = {
     "User-Agent": "TWSE-OpenAPI-Example/1.0 (+https://example.local)"
 }
 
 class HttpClient:
-    def __init__(self, timeout: int = 20, retries: int = 3):
+    def __init__(self, timeout: int = 20, retries: int = 3, cache_dir: Optional[str] = None,
+                 limiter: Optional[RateLimiter] = None, base_urls: Optional[Dict[str, str]] = None,
+                 record_dir: Optional[str] = None):
         self.timeout = timeout
         self.retries = retries
-        self.session = requests.Session()
-        self.session.headers.update(DEFAULT_HEADERS)
+        # 有設 cache_dir 才啟用條件式 GET 快取（ETag / Last-Modified / 內容雜湊）
+        self.cache_dir = cache_dir
+        # 每主機限速 / 退避 / 斷路；沒給就只有退避與斷路，不限速
+        self.limiter = limiter or RateLimiter()
+        # requests.Session 非執行緒安全：每個執行緒各自一個 session（仍可重用連線）
+        self._local = threading.local()
+        # 主機改道（離線重播 / 測試機）：{"www.twse.com.tw": "http://127.0.0.1:8765/www.twse.com.tw"}
+        # 只改實際送出的網址；限速、斷路、telemetry 仍以原主機 / 原網址計
+        self.base_urls = {h: u.rstrip("/") for h, u in (base_urls or {}).items()}
+        # 有設 record_dir 就把每個成功回應存一份，給 replay_server.py 重播
+        self.record_dir = record_dir
+        # 請求額度（ratelimit.RequestBudget；回補時掛上）：每次送出（含重試）扣一次
+        self.budget = None
 
-    def get_json(self, url: str) -> Any:
+    def resolve(self, url: str) -> str:
+        parts = urlsplit(url)
+        base = self.base_urls.get(parts.netloc)
+        if not base:
+            return url
+        b = urlsplit(base)
+        return urlunsplit((b.scheme, b.netloc, b.path + parts.path, parts.query, ""))
+
+    def _record(self, url: str, resp: requests.Response):
+        parts = urlsplit(url)
+        folder = os.path.join(self.record_dir, parts.netloc)
+        ensure_dir(folder)
+        path = os.path.join(folder, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}.json")
+        rec = {"url": url, "status": resp.status_code,
+               "content_type": resp.headers.get("Content-Type"),
+               "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified"),
+               "body": resp.text}
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rec, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @property
+    def session(self) -> requests.Session:
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = requests.Session()
+            s.headers.update(DEFAULT_HEADERS)
+            self._local.session = s
+        return s
+
+    def _request(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """_send 外包一層：每次呼叫（含重試）寫一行 requests.jsonl。"""
+        t0 = time.perf_counter()
+        self._local.attempts = 0
+        try:
+            resp, obj = self._send(url, headers)
+        except Exception as e:
+            resp = getattr(e, "response", None)
+            telemetry.record_request(url, getattr(resp, "status_code", None),
+                                     (time.perf_counter() - t0) * 1000,
+                                     retries=max(0, self._local.attempts - 1), error=repr(e))
+            raise
+        telemetry.record_request(url, resp.status_code, (time.perf_counter() - t0) * 1000,
+                                 len(resp.content or b""), retries=self._local.attempts - 1,
+                                 cache_hit=resp.status_code == 304)
+        return resp, obj
+
+    def _send(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """
+        送 GET 並解析 JSON，回傳 (resp, obj)；304 時 obj 為 None。
+        - 送出前扣請求額度（有掛 budget 時；用完拋 BudgetExhaustedError）
+        - 送出前經過 limiter（token bucket 等待、斷路中直接拋 CircuitOpenError）
+        - 429：依 Retry-After 讓整個主機暫停並降速後重試
+        - 連線錯誤 / 逾時 / 5xx / 回傳不是 JSON：指數退避 + jitter 後重試
+        - 其他 4xx（400/401/403/404…）：不重試，直接 raise HTTPError
+        """
+        host = urlsplit(url).netloc
         last_err = None
-        for i in range(self.retries):
+        for attempt in range(self.retries):
+            self._local.attempts = attempt + 1
+            if self.budget is not None:
+                self.budget.charge()
+            self.limiter.acquire(host)
+            retry_after = None
             try:
-                resp = self.session.get(url, timeout=self.timeout)
-                resp.raise_for_status()
-                # TWSE 有些端點回傳 JSON List，有些是 JSON Object
-                return resp.json()
-            except Exception as e:
+                resp = self.session.get(self.resolve(url), timeout=self.timeout, headers=headers)
+                status = resp.status_code
+                if status == 304:
+                    self.limiter.on_success(host)
+                    return resp, None
+                if status >= 400 and status not in RETRYABLE_STATUS:
+                    self.limiter.on_fail_fast(host, status)
+                    resp.raise_for_status()
+                retry_after = resp.headers.get("Retry-After")
+                if status == 429:
+                    last_err = requests.HTTPError(f"429 Too Many Requests for url: {url}", response=resp)
+                    delay = self.limiter.on_throttle(host, attempt, retry_after)
+                else:
+                    resp.raise_for_status()
+                    # TWSE 有些端點回傳 JSON List，有些是 JSON Object
+                    obj = resp.json()
+                    self.limiter.on_success(host)
+                    if self.record_dir:
+                        self._record(url, resp)
+                    return resp, obj
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code not in RETRYABLE_STATUS:
+                    raise
+                last_err = e
+                delay = self.limiter.on_failure(host, attempt, f"HTTP {e.response.status_code}", retry_after)
+            except (requests.RequestException, ValueError) as e:
+                # 連線錯誤 / 逾時；被擋時 TWSE 會回 200 + HTML，json 解析失敗也算
                 last_err = e
-                time.sleep(1.5 * (i + 1))
+                delay = self.limiter.on_failure(host, attempt, type(e).__name__)
+            if attempt + 1 < self.retries:
+                time.sleep(delay)
         raise last_err
 
+    def get_json(self, url: str) -> Any:
+        return self._request(url)[1]
+
+    # ---- 條件式 GET：回傳 (obj, unchanged) ----
+    def _cache_paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        return (os.path.join(self.cache_dir, f"{key}.meta.json"),
+                os.path.join(self.cache_dir, f"{key}.body"))
+
+    def _load_meta(self, url: str) -> Dict[str, Any]:
+        meta_path, body_path = self._cache_paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return {}
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return meta if meta.get("url") == url else {}
+        except Exception:
+            return {}
+
+    def get_json_cached(self, url: str) -> Tuple[Any, bool]:
+        """
+        帶 If-None-Match / If-Modified-Since 的 GET。
+        unchanged=True 表示伺服器回 304，或內容雜湊與上次相同。
+        未設 cache_dir 時等同 get_json，unchanged 一律 False。
+        """
+        if not self.cache_dir:
+            return self.get_json(url), False
+
+        meta = self._load_meta(url)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        meta_path, body_path = self._cache_paths(url)
+        resp, obj = self._request(url, headers=headers)
+        if resp.status_code == 304 and meta:
+            with open(body_path, "rb") as f:
+                return json.loads(f.read()), True
+        if obj is None:
+            # 沒有快取卻收到 304（快取檔被刪）：不帶條件重抓
+            resp, obj = self._request(url)
+        body = resp.content
+
+        digest = hashlib.sha256(body).hexdigest()
+        unchanged = digest == meta.get("sha256")
+        ensure_dir(self.cache_dir)
+        if not unchanged:
+            with open(body_path, "wb") as f:
+                f.write(body)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "sha256": digest,
+                       "etag": resp.headers.get("ETag"),
+                       "last_modified": resp.headers.get("Last-Modified")}, f)
+        return obj, unchanged
+
 def ensure_dir(p):
     os.makedirs(p, exist_ok=True)
 
@@ -35,5 +196,39 @@ def save_json(obj, path: str):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=2)
 
+def norm_ymd(x) -> Optional[str]:
+    """
+    各種日期寫法統一成 YYYYMMDD；認不得回 None。
+    支援：20240102、2024-01-02、2024/01/02、民國 113/01/02、113-01-02、1130102、date/datetime。
+    """
+    if x is None:
+        return None
+    if hasattr(x, "strftime"):
+        return x.strftime("%Y%m%d")
+    s = str(x).strip().replace(".", "/").replace("-", "/")
+    if "/" in s:
+        parts = s.split("/")
+        if len(parts) != 3 or not all(p.isdigit() for p in parts):
+            return None
+        y, m, d = (int(p) for p in parts)
+    elif s.isdigit() and len(s) == 8:
+        y, m, d = int(s[:4]), int(s[4:6]), int(s[6:])
+    elif s.isdigit() and len(s) in (6, 7):   # 民國 YYYMMDD / YYMMDD
+        y, m, d = int(s[:-4]), int(s[-4:-2]), int(s[-2:])
+    else:
+        return None
+    if y < 1911:
+        y += 1911
+    if not (1 <= m <= 12 and 1 <= d <= 31):
+        return None
+    return f"{y:04d}{m:02d}{d:02d}"
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
 def slug(s: str) -> str:
     return hashlib.md5(s.encode("utf-8")).hexdigest()[:8]